@@ -0,0 +1,126 @@
+# admision_jugadores.py - Altas de jugadores en lote para /unirse
+# Cuando el profesor dicta el PIN, toda la clase entra a la vez. En lugar de un
+# INSERT + COMMIT + SELECT por jugador, cada alta recibe en el momento un id de
+# un bloque reservado de antemano (así el jugador ya existe en memoria: sesión,
+# clasificación y lista del host) y la fila se escribe con las demás que lleguen
+# en la misma ventana, en un solo INSERT multi-fila.
+#
+# Si ya hay 'max_altas_pendientes' altas esperando a guardarse, /unirse no encola
+# más y le dice al jugador cuántos tiene por delante para que lo reintente en un
+# momento. Es un límite de escrituras en cola, no del tamaño de la sala: una
+# partida admite tantos jugadores como se quiera mientras la DB vaya guardándolos.
+
+import os
+import threading
+
+from escritor_respuestas import EscritorLotes
+
+admision_config = {
+    # Milisegundos que se esperan a que lleguen más altas antes de escribir
+    "ventana_ms": float(os.environ.get("KAHOOT_ADMISION_VENTANA_MS", 10)),
+    # Máximo de jugadores por INSERT
+    "tamano_lote": int(os.environ.get("KAHOOT_ADMISION_LOTE", 200)),
+    # Altas que pueden estar esperando a guardarse antes de rechazar nuevas
+    "max_altas_pendientes": int(os.environ.get("KAHOOT_ADMISION_MAX_PENDIENTES", 2000)),
+    # Ids que se reservan de una vez en la DB
+    "tamano_bloque": int(os.environ.get("KAHOOT_ADMISION_BLOQUE_IDS", 100)),
+}
+
+
+class AdmisionSaturada(Exception):
+    """Demasiadas altas esperando a guardarse; 'en_cola' es cuántas hay por delante."""
+
+    def __init__(self, en_cola):
+        super().__init__(f"{en_cola} jugadores entrando")
+        self.en_cola = en_cola
+
+
+class BloqueIds:
+    """
+    Reparte ids de un bloque reservado con 'reservar(cantidad)', que devuelve el
+    primero del bloque (o None si no se pudo reservar), y pide otro al acabarse.
+    """
+
+    def __init__(self, reservar, tamano):
+        self._reservar = reservar
+        self.tamano = tamano
+        self._siguiente = 0
+        self._fin = 0
+        self._lock = threading.Lock()
+
+    def siguiente(self):
+        """Un id sin usar, o None si no se pudo reservar un bloque nuevo."""
+        with self._lock:
+            if self._siguiente >= self._fin:
+                inicio = self._reservar(self.tamano)
+                if inicio is None:
+                    return None
+                self._siguiente, self._fin = inicio, inicio + self.tamano
+            jugador_id = self._siguiente
+            self._siguiente += 1
+            return jugador_id
+
+
+class AdmisionJugadores(EscritorLotes):
+    """
+    Altas de jugadores con id reservado y escritura en lotes.
+
+    'reservar_ids' y 'guardar_lote' son database.reservar_ids_jugadores y
+    database.registrar_jugadores_lote.
+    """
+
+    nombre = "admision-jugadores"
+
+    def __init__(
+        self,
+        reservar_ids,
+        guardar_lote,
+        max_altas_pendientes,
+        tamano_bloque,
+        **config_lotes,
+    ):
+        super().__init__(guardar_lote, **config_lotes)
+        self.max_altas_pendientes = max_altas_pendientes
+        self._ids = BloqueIds(reservar_ids, tamano_bloque)
+        self.metricas["rechazados"] = 0
+
+    def admitir(self, partida_id, nombre, session_id):
+        """
+        Da de alta a un jugador: devuelve (jugador, resguardo de su escritura), o
+        (None, None) si no hay id disponible. Lanza AdmisionSaturada si ya hay
+        'max_altas_pendientes' altas esperando a guardarse.
+        """
+        en_cola = self.pendientes()
+        if en_cola >= self.max_altas_pendientes:
+            self._rechazar()
+            raise AdmisionSaturada(en_cola)
+
+        jugador_id = self._ids.siguiente()
+        if jugador_id is None:
+            return None, None
+
+        resguardo = self._encolar(
+            (jugador_id, partida_id, nombre, session_id), self.max_altas_pendientes
+        )
+        if resguardo is None:
+            # Se llenó mientras tanto; el id queda sin usar (los huecos no importan)
+            self._rechazar()
+            raise AdmisionSaturada(self.pendientes())
+
+        jugador = {
+            "id": jugador_id,
+            "partida_id": partida_id,
+            "nombre": nombre,
+            "session_id": session_id,
+            "puntaje": 0,
+        }
+        return jugador, resguardo
+
+    def _rechazar(self):
+        with self._condicion:
+            self.metricas["rechazados"] += 1
+
+    def obtener_metricas(self):
+        datos = super().obtener_metricas()
+        datos["max_altas_pendientes"] = self.max_altas_pendientes
+        return datos
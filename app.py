@@ -2,6 +2,7 @@
 
 from flask import (
     Flask,
+    Response,
     render_template,
     request,
     redirect,
@@ -9,8 +10,12 @@ from flask import (
     session,
     jsonify,
     flash,
+    send_from_directory,
 )
+import click
+import functools
 import os
+import json
 import uuid
 import time
 
@@ -20,37 +25,71 @@ from werkzeug.security import generate_password_hash, check_password_hash
 # --- IMPORTACIONES DE BASE DE DATOS ---
 # Asegúrate de que todas estas funciones existan en tu archivo database.py
 from database import (
+    init_app as init_database,
+    confirmar_peticion,
+    finalizar_conexion_peticion,
     get_db_connection,
     obtener_usuario_por_username,
     obtener_partida_por_pin,
-    obtener_preguntas_por_kahoot,
-    obtener_opciones_pregunta,
-    registrar_jugador,
+    obtener_partida_por_id,
     obtener_jugadores_partida,
     obtener_jugador_por_session,
-    registrar_respuesta,
-    obtener_respuestas_pregunta,
-    actualizar_puntaje_jugador,
+    obtener_respuestas_partida,
     obtener_ranking,
-    jugador_ya_respondio,
     actualizar_estado_partida,
     reiniciar_partida_db,
     guardar_cuestionario_completo,
     obtener_todos_kahoots,
     actualizar_kahoot_partida,
-    verificar_si_es_correcta,
-    registrar_respuesta_y_puntaje,
+    crear_partida,
+    registrar_respuestas_lote,
+    reservar_ids_jugadores,
+    registrar_jugadores_lote,
+    obtener_estadisticas_pool,
+    guardar_liquidacion,
+    obtener_preguntas_liquidadas,
 )
 
+from registro_partidas import RegistroPartidas
+from registro_compartido import RegistroPartidasSQLite, VigilanteCambios
+from eventos import CanalEventos
+from escritor_respuestas import EscritorRespuestas, escritor_config
+from admision_jugadores import AdmisionJugadores, AdmisionSaturada, admision_config
+from temporizador import Temporizador
+from cuestionarios import CacheCuestionarios
+from imagenes import (
+    CARPETA_IMAGENES,
+    ImagenInvalidaError,
+    etag_imagen,
+    extraer_imagenes_cuestionario,
+    migrar_imagenes_embebidas,
+    srcset_imagen,
+)
+from importador import detectar_formato, importar_banco_preguntas, FORMATOS
+
+from metricas import registro_metricas, TIPO_CONTENIDO, init_app as init_metricas
+from perfilador import init_app as init_perfilador
 from evaluadora import (
-    calcular_puntajes,
+    calcular_puntajes_lote,
+    calcular_puntos_respuesta,
+    evaluar_respuesta,
+    nuevas_estadisticas_cuestionario,
+    sumar_respuesta_estadisticas,
     obtener_podio,
-    generar_estadisticas_pregunta,
-    actualizar_puntajes_totales,
 )
 
 app = Flask(__name__)
-app.secret_key = "kahoot_secreto_2024"  # Asegúrate de que esta sea la única secret_key
+# Asegúrate de que esta sea la única secret_key (enrutador.py usa la misma)
+app.secret_key = os.environ.get("KAHOOT_SECRET_KEY", "kahoot_secreto_2024")
+
+# Una sola conexión y transacción de base de datos por petición
+init_database(app)
+
+# Latencia de cada endpoint para /metrics (ver metricas.py)
+init_metricas(app)
+
+# Con KAHOOT_PERFILAR, perfilado por muestreo de peticiones (ver perfilador.py)
+perfilador = init_perfilador(app)
 
 # Configura la carpeta de subida de imágenes si no la tienes
 UPLOAD_FOLDER = "static/uploads"
@@ -60,28 +99,222 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # ALMACENAMIENTO EN MEMORIA (Estado del juego)
 
-# Estructura: {pin: {estado, pregunta_actual, tiempo_inicio, preguntas, partida_id}}
-partidas_activas = {}
+# Estructura: {pin: {estado, pregunta_actual, tiempo_inicio, preguntas,
+#                    clave_respuestas, respondidas, clasificacion,
+#                    estadisticas, partida_id}}
+# El registro mantiene además el índice partida_id -> pin para los jugadores.
+# Con KAHOOT_ESTADO=sqlite el estado se comparte entre varios procesos worker
+# (ver registro_compartido.py); por defecto vive sólo en este proceso.
+if os.environ.get("KAHOOT_ESTADO", "memoria") == "sqlite":
+    partidas_activas = RegistroPartidasSQLite(
+        cargar=lambda pin: cargar_partida_en_memoria(pin)
+    )
+else:
+    partidas_activas = RegistroPartidas()
+
+registro_metricas.indicador(
+    "kahoot_partidas_activas",
+    "Partidas en partidas_activas de este proceso",
+    lambda: len(partidas_activas.items()),
+)
+registro_metricas.indicador(
+    "kahoot_jugadores_activos",
+    "Jugadores de las partidas en partidas_activas de este proceso",
+    lambda: sum(len(estado["clasificacion"]) for _, estado in partidas_activas.items()),
+)
+respuestas_total = registro_metricas.contador(
+    "kahoot_respuestas_total",
+    "Respuestas aceptadas en /responder por partida",
+    ("pin",),
+)
+respuestas_inconsistentes = registro_metricas.contador(
+    "kahoot_respuestas_inconsistentes_total",
+    "Respuestas puntuadas en una pregunta ya liquidada que no se pudieron guardar",
+    ("pin",),
+)
+
+# Canal de eventos en tiempo real (SSE) hacia el host y los jugadores
+canal_eventos = CanalEventos()
+registro_metricas.indicador(
+    "kahoot_suscriptores_sse",
+    "Flujos SSE abiertos en este proceso",
+    canal_eventos.total_suscriptores,
+)
+
+# Con estado compartido, los cambios pueden venir de otro proceso: un hilo los
+# detecta y los publica a los clientes SSE conectados a este
+if partidas_activas.compartido:
+    VigilanteCambios(
+        partidas_activas, canal_eventos, lambda estado: resumen_estado_partida(estado)
+    ).iniciar()
+
+# Las respuestas se guardan en lotes (una transacción para muchas respuestas)
+escritor_respuestas = EscritorRespuestas(registrar_respuestas_lote, **escritor_config)
+
+# Segundos que /responder espera a que su lote quede guardado en la DB
+ESPERA_MAXIMA_ESCRITURA = 5
+
+# Los jugadores que se unen reciben un id reservado y se guardan en lotes
+admision_jugadores = AdmisionJugadores(
+    reservar_ids_jugadores, registrar_jugadores_lote, **admision_config
+)
+
+# Segundos tras los que join.html reintenta solo si la admisión está saturada
+REINTENTO_ADMISION_SATURADA = 2
+
+# Un solo hilo cierra las preguntas de todas las partidas al acabarse su tiempo
+temporizador = Temporizador()
+
+# Segundos de margen tras el tiempo límite para las respuestas que ya venían de camino
+GRACIA_RESPUESTAS = float(os.environ.get("KAHOOT_GRACIA_RESPUESTAS", 1))
+
+# Con KAHOOT_AUTO_AVANZAR=N, al acabarse el tiempo se muestran los resultados y
+# N segundos después se pasa sola a la siguiente pregunta (0 = lo hace el host)
+AUTO_AVANZAR = float(os.environ.get("KAHOOT_AUTO_AVANZAR", 0))
+
+# Reloj monotónico de la pregunta en curso de cada partida empezada en este
+# proceso: {pin: (pregunta_actual, tiempo_inicio, inicio_monotonico)}
+relojes_preguntas = {}
+
+# Cuestionarios compilados (preguntas + opciones + clave), compartidos por partidas
+cache_cuestionarios = CacheCuestionarios()
+
+# Las imágenes se sirven con el hash en el nombre: el navegador no las vuelve a pedir
+MAX_AGE_IMAGENES = 365 * 24 * 3600
+app.jinja_env.globals["srcset_imagen"] = srcset_imagen
 
 
 def garantizar_estado_partida_en_memoria(pin, partida_db):
     """
     Asegura que la partida esté inicializada en el diccionario global 'partidas_activas'.
-    Si no existe, carga las preguntas de la DB y crea la estructura inicial en memoria.
+    Si no existe, toma el cuestionario compilado (preguntas, opciones y clave de
+    respuestas) de la caché y crea la estructura inicial en memoria.
     """
-    if pin not in partidas_activas:
-        # print(f"⚡ Inicializando estado en memoria para PIN {pin}") # Debug opcional
-        preguntas = obtener_preguntas_por_kahoot(partida_db["kahoot_id"])
-
-        partidas_activas[pin] = {
-            "estado": partida_db["estado"],  # Usamos el estado inicial de la DB
-            "pregunta_actual": 0,
-            "tiempo_inicio": 0,  # No ha empezado la primera pregunta
-            "preguntas": preguntas,
-            "partida_id": partida_db["id"],
+    if pin in partidas_activas:
+        return
+    # Bajo el lock de la partida, para que dos peticiones no la carguen a la vez
+    with partidas_activas.bloquear(pin):
+        if pin not in partidas_activas:
+            # print(f"⚡ Inicializando estado en memoria para PIN {pin}") # Debug opcional
+            cuestionario = cache_cuestionarios.obtener(partida_db["kahoot_id"])
+            preguntas = cuestionario.preguntas
+            opciones = cuestionario.opciones
+            clave_respuestas = cuestionario.clave_respuestas
+
+            # Si la partida se recarga a mitad, los contadores arrancan con lo ya respondido
+            respuestas_previas = obtener_respuestas_partida(partida_db["id"])
+            estadisticas = nuevas_estadisticas_cuestionario(preguntas, opciones)
+            for _, pregunta_id, opcion_id, tiempo in respuestas_previas:
+                if pregunta_id in estadisticas:
+                    sumar_respuesta_estadisticas(
+                        estadisticas[pregunta_id],
+                        opcion_id,
+                        evaluar_respuesta(clave_respuestas, pregunta_id, opcion_id),
+                        tiempo or 0,
+                    )
+
+            partidas_activas.crear(
+                pin,
+                partida_db["id"],
+                preguntas,
+                clave_respuestas=clave_respuestas,
+                opciones_por_pregunta=cuestionario.opciones_por_pregunta,
+                respuestas_previas=respuestas_previas,
+                liquidadas=obtener_preguntas_liquidadas(partida_db["id"]),
+                jugadores=obtener_ranking(partida_db["id"]),
+                estadisticas=estadisticas,
+                estado=partida_db["estado"],  # Usamos el estado inicial de la DB
+            )
+
+
+def cargar_partida_en_memoria(pin):
+    """Carga en este proceso una partida que otro proceso ya tiene activa."""
+    partida_db = obtener_partida_por_pin(pin)
+    if partida_db:
+        garantizar_estado_partida_en_memoria(pin, partida_db)
+
+
+def datos_estado_partida(estado):
+    """
+    Estado de una partida en memoria tal y como se envía a los jugadores.
+    Sólo depende de la versión del estado: en vez del tiempo restante lleva
+    'fin_pregunta' (hora del servidor en la que se acaba la pregunta).
+    """
+    if estado["estado"] == "finalizado" or (
+        estado["estado"] == "jugando"
+        and estado["pregunta_actual"] >= len(estado["preguntas"])
+    ):
+        return {
+            "estado": "finalizado",
+            "redirect": "/podio",
+            "version": estado["version"],
         }
-    # else:
-    # print(f"ℹ️ El estado en memoria ya existía para PIN {pin}") # Debug opcional
+
+    datos = {
+        "estado": estado["estado"],
+        "pregunta_actual": estado["pregunta_actual"],
+        "version": estado["version"],
+    }
+    if estado["estado"] == "jugando":
+        pregunta = estado["preguntas"][estado["pregunta_actual"]]
+        datos["fin_pregunta"] = estado["tiempo_inicio"] + pregunta.get(
+            "tiempo_limite", 20
+        )
+    return datos
+
+
+def codificar_estado_partida(estado):
+    """JSON ya codificado de datos_estado_partida, para guardarlo en caché."""
+    return json.dumps(datos_estado_partida(estado)).encode("utf-8")
+
+
+def resumen_estado_partida(estado):
+    """datos_estado_partida más el tiempo restante calculado en este momento."""
+    datos = datos_estado_partida(estado)
+    tiempo_restante = 0
+    if "fin_pregunta" in datos:
+        tiempo_restante = max(0, int(datos["fin_pregunta"] - time.time()))
+    datos["tiempo_restante"] = tiempo_restante
+    return datos
+
+
+def registrar_cambio_estado(pin, **cambios):
+    """
+    Aplica los 'cambios' al estado de la partida con una versión nueva
+    (invalidando el JSON en caché) y avisa por SSE a todos los conectados.
+    Devuelve el estado nuevo, o None si la partida no está en memoria.
+    """
+    if pin in partidas_activas:
+        estado = partidas_activas.actualizar(pin, **cambios)
+        if partidas_activas.compartido:
+            return estado  # Lo publica el VigilanteCambios de cada proceso
+        canal_eventos.publicar(
+            estado["partida_id"], "estado", resumen_estado_partida(estado)
+        )
+        return estado
+    return None
+
+
+def respuesta_sse(partida_id, evento_inicial):
+    """
+    Suscribe al cliente a los eventos de la partida y devuelve la respuesta
+    text/event-stream. Si el proceso ya tiene todos los flujos que admite,
+    contesta 503: EventSource no reintenta y la página sigue con el polling.
+    """
+    cola = canal_eventos.suscribir(partida_id)
+    if cola is None:
+        return jsonify({"error": "Demasiadas conexiones en tiempo real"}), 503
+    respuesta = Response(
+        canal_eventos.flujo(partida_id, cola, evento_inicial),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Que los proxies no acumulen los eventos
+        },
+    )
+    # Si el cliente se va antes de empezar el flujo, su 'finally' no llega a correr
+    respuesta.call_on_close(lambda: canal_eventos.desuscribir(partida_id, cola))
+    return respuesta
 
 
 @app.route("/")
@@ -120,6 +353,8 @@ def crear_admin_temporal():
             sql = "INSERT INTO usuarios (username, email, password_hash) VALUES (%s, %s, %s)"
             cursor.execute(sql, (MI_USUARIO, MI_EMAIL, password_hash))
             conn.commit()
+            if not confirmar_peticion():
+                return "❌ Error al guardar el usuario en la DB", 500
             return f"✅ Usuario '{MI_USUARIO}' creado con éxito. ¡Ahora puedes ir a /login!"
         except Exception as e:
             return f"❌ Error al crear usuario (¿quizás ya existe?): {e}"
@@ -239,6 +474,9 @@ def register():
                 sql_insert = "INSERT INTO usuarios (username, email, password_hash) VALUES (%s, %s, %s)"
                 cursor.execute(sql_insert, (usuario, email, password_hash))
                 conn.commit()
+                if not confirmar_peticion():
+                    flash("Ocurrió un error interno al crear la cuenta.", "danger")
+                    return render_template("register.html"), 500
 
                 flash(
                     "✅ ¡Cuenta creada con éxito! Ahora puedes iniciar sesión.",
@@ -275,6 +513,53 @@ def logout():
 # ============================================
 
 
+def guardar_jugador_en_sesion(jugador, pin):
+    # La cookie de sesión va firmada con la secret_key: el jugador no puede
+    # cambiar su id ni su partida sin invalidarla
+    session["jugador_id"] = jugador["id"]
+    session["partida_id"] = jugador["partida_id"]
+    session["nombre"] = jugador["nombre"]
+    if pin:
+        session["pin"] = pin
+
+
+def jugador_de_sesion():
+    """
+    Jugador de la petición, con el PIN y el estado de su partida (None si no
+    está en memoria). Devuelve (None, None, None) si no hay un jugador válido.
+
+    El id, la partida y el nombre salen de la cookie de sesión que firma
+    /unirse, y el puntaje de la clasificación en memoria, así que las rutas de
+    los jugadores no consultan la DB. Sólo se lee 'jugadores_sesion' si la
+    sesión es anterior a estos datos o si la partida está en memoria y el
+    jugador no figura en ella (p. ej. porque el host la reinició).
+    """
+    if "session_id" not in session:
+        return None, None, None
+
+    jugador_id = session.get("jugador_id")
+    if jugador_id is not None:
+        pin, estado = partidas_activas.buscar_por_partida_id(session["partida_id"])
+        # Sin la partida en memoria el puntaje queda sin leer: quien lo necesite
+        # (el podio) lo toma del ranking de la DB
+        puntaje = None if estado is None else estado["clasificacion"].puntaje(jugador_id)
+        if estado is None or puntaje is not None:
+            jugador = {
+                "id": jugador_id,
+                "partida_id": session["partida_id"],
+                "nombre": session["nombre"],
+                "puntaje": puntaje,
+            }
+            return jugador, pin, estado
+
+    jugador = obtener_jugador_por_session(session["session_id"])
+    if not jugador:
+        return None, None, None
+    pin, estado = partidas_activas.buscar_por_partida_id(jugador["partida_id"])
+    guardar_jugador_en_sesion(jugador, pin)
+    return jugador, pin, estado
+
+
 @app.route("/unirse", methods=["POST"])
 def unirse():
     """Procesar solicitud de unirse a partida"""
@@ -284,19 +569,69 @@ def unirse():
     if not pin or not nombre:
         return render_template("join.html", error="Ingresa el PIN y tu nombre")
 
-    # Verificar que existe la partida
-    partida = obtener_partida_por_pin(pin)
-    if not partida:
-        return render_template("join.html", error="PIN no válido o partida finalizada")
+    # Verificar que existe la partida: primero en memoria (el host ya la abrió)
+    estado = partidas_activas.get(pin)
+    if estado is not None:
+        partida_id = estado["partida_id"]
+    else:
+        partida = obtener_partida_por_pin(pin)
+        if not partida:
+            return render_template(
+                "join.html", error="PIN no válido o partida finalizada"
+            )
+        partida_id = partida["id"]
 
     # Crear ID de sesión único para el jugador
     session_id = str(uuid.uuid4())
-    session["session_id"] = session_id
-    session["nombre"] = nombre
-    # session["pin"] = pin # ELIMINADO: El jugador ya no guarda el PIN directamente
 
-    # Registrar jugador en la base de datos
-    registrar_jugador(partida["id"], nombre, session_id)
+    # El jugador recibe su id al momento; la fila se guarda con las de los
+    # demás que se unen a la vez (ver admision_jugadores.py)
+    try:
+        jugador, resguardo = admision_jugadores.admitir(partida_id, nombre, session_id)
+    except AdmisionSaturada as e:
+        respuesta = Response(
+            render_template(
+                "join.html",
+                error=f"¡Hay mucha gente entrando! Tienes {e.en_cola} jugadores por delante, reintentando...",
+                pin=pin,
+                nombre=nombre,
+                reintentar_en=REINTENTO_ADMISION_SATURADA,
+            ),
+            status=503,
+        )
+        respuesta.headers["Retry-After"] = str(REINTENTO_ADMISION_SATURADA)
+        return respuesta
+
+    exito = None
+    if jugador:
+        # Como en /responder: la conexión vuelve al pool antes de esperar al lote
+        finalizar_conexion_peticion()
+        exito = resguardo.esperar(ESPERA_MAXIMA_ESCRITURA)
+    if exito is False or not jugador:
+        return render_template(
+            "join.html", error="No pudimos unirte a la partida, inténtalo de nuevo"
+        )
+    # exito None: sigue en la cola y se guardará, no hacemos esperar más al jugador
+
+    session["session_id"] = session_id
+    # El PIN también sirve para que enrutador.py mande al jugador al worker de su partida
+    guardar_jugador_en_sesion(jugador, pin)
+
+    # Avisar al host (y al resto de la sala) de que entró alguien
+    _, estado = partidas_activas.buscar_por_partida_id(partida_id)
+    if estado is not None:
+        estado["clasificacion"].agregar_jugador(jugador)
+    # Con estado compartido lo avisa el VigilanteCambios de cada proceso
+    if not partidas_activas.compartido:
+        canal_eventos.publicar(
+            partida_id,
+            "jugador",
+            {
+                "id": jugador["id"],
+                "nombre": jugador["nombre"],
+                "puntaje": jugador["puntaje"],
+            },
+        )
 
     return redirect(url_for("lobby_jugador"))
 
@@ -307,19 +642,11 @@ def lobby_jugador():
     if "session_id" not in session:
         return redirect(url_for("index"))
 
-    jugador = obtener_jugador_por_session(session["session_id"])
+    # El PIN para mostrarlo en el lobby sale de las partidas activas en memoria
+    jugador, pin, _ = jugador_de_sesion()
     if not jugador:
         return redirect(url_for("index"))
 
-    # Necesitamos el PIN para mostrarlo en el lobby, lo obtenemos de la DB
-    partida_id = jugador["partida_id"]
-    pin = None
-    # Buscamos el PIN en las partidas activas en memoria
-    for p_pin, p_estado in partidas_activas.items():
-        if p_estado["partida_id"] == partida_id:
-            pin = p_pin
-            break
-
     # Si no está en memoria, es una partida "esperando", lo buscamos en la DB
     if pin is None:
         # Esta es una solución temporal, idealmente tendríamos una función obtener_partida_por_id
@@ -337,21 +664,11 @@ def jugar():
     if "session_id" not in session:
         return redirect(url_for("index"))
 
-    jugador = obtener_jugador_por_session(session["session_id"])
+    # Buscamos la partida activa en memoria usando el partida_id de la sesión
+    jugador, pin, estado = jugador_de_sesion()
     if not jugador:
         return redirect(url_for("index"))
 
-    partida_id = jugador["partida_id"]
-    pin = None
-    estado = None
-
-    # Buscamos la partida activa en memoria usando el partida_id
-    for p_pin, p_estado in partidas_activas.items():
-        if p_estado["partida_id"] == partida_id:
-            pin = p_pin
-            estado = p_estado
-            break
-
     # Verificar si hay partida activa
     if estado is None:
         return render_template(
@@ -377,10 +694,10 @@ def jugar():
         return redirect(url_for("podio_jugador"))
 
     pregunta = preguntas[pregunta_idx]
-    opciones = obtener_opciones_pregunta(pregunta["id"])
+    opciones = estado["opciones_por_pregunta"].get(pregunta["id"], ())
 
     # Verificar si ya respondió
-    ya_respondio = jugador_ya_respondio(jugador["id"], pregunta["id"])
+    ya_respondio = partidas_activas.ya_respondio(pin, pregunta["id"], jugador["id"])
 
     # Calcular tiempo restante
     tiempo_transcurrido = time.time() - estado["tiempo_inicio"]
@@ -411,7 +728,7 @@ def responder():
     if "session_id" not in session:
         return jsonify({"error": "No autorizado"}), 401
 
-    jugador = obtener_jugador_por_session(session["session_id"])
+    jugador, pin, estado = jugador_de_sesion()
     if not jugador:
         return jsonify({"error": "Jugador no encontrado"}), 404
 
@@ -430,45 +747,132 @@ def responder():
         return jsonify({"error": "opcion_id no proporcionado"}), 400
 
     try:
-        tiempo_respuesta = float(data.get("tiempo_respuesta", 20))
+        pregunta_id = int(pregunta_id)
+        opcion_id = int(opcion_id)
     except (TypeError, ValueError):
-        tiempo_respuesta = 20
+        return jsonify({"error": "pregunta_id u opcion_id no válidos"}), 400
 
-    # Verificar que no haya respondido ya
-    if jugador_ya_respondio(jugador["id"], pregunta_id):
-        return jsonify({"error": "Ya respondiste esta pregunta"}), 400
+    if estado is None:
+        return jsonify({"error": "Partida no iniciada"}), 400
+
+    # El tiempo lo mide el servidor. El del cliente sólo se acepta si es hasta
+    # GRACIA_RESPUESTAS menor (la latencia de la red), nunca mayor ni menor
+    pregunta_en_curso = None
+    if estado["estado"] == "jugando" and estado["pregunta_actual"] < len(estado["preguntas"]):
+        pregunta_en_curso = estado["preguntas"][estado["pregunta_actual"]]
+    if pregunta_en_curso is not None and pregunta_en_curso["id"] == pregunta_id:
+        transcurrido = segundos_en_pregunta(pin, estado)
+        if transcurrido > pregunta_en_curso.get("tiempo_limite", 20) + GRACIA_RESPUESTAS:
+            return jsonify({"error": "Se acabó el tiempo"}), 400
+        try:
+            tiempo_respuesta = float(data.get("tiempo_respuesta", transcurrido))
+        except (TypeError, ValueError):
+            tiempo_respuesta = transcurrido
+        tiempo_respuesta = min(max(tiempo_respuesta, transcurrido - GRACIA_RESPUESTAS), transcurrido)
 
     # --- NUEVA LÓGICA DE PUNTOS ---
-    puntos_ganados = 0
-    es_correcta = False
-
-    # 1. Verificamos si la opción elegida es la correcta en la BD
-    #    (Usamos la nueva función que agregaste en el Paso 1 a database.py)
-    if verificar_si_es_correcta(opcion_id):
-        es_correcta = True
-        puntos_ganados = 200  # Puntos fijos por acierto
-    else:
-        es_correcta = False
-        puntos_ganados = 0  # 0 puntos si falla
+    # 1. Evaluamos con la clave de respuestas compilada al cargar la partida
+    #    (sin consultar la tabla 'opciones')
+    es_correcta = evaluar_respuesta(estado["clave_respuestas"], pregunta_id, opcion_id)
+    if es_correcta is None:
+        return jsonify({"error": "La opción no pertenece a esta pregunta"}), 400
+
+    if partidas_activas.pregunta_cerrada(pin, pregunta_id):
+        return jsonify({"error": "La pregunta ya está cerrada"}), 400
+    if pregunta_en_curso is None or pregunta_en_curso["id"] != pregunta_id:
+        return jsonify({"error": "La pregunta no está en curso"}), 400
+
+    # Verificar que no haya respondido ya (en memoria y de forma atómica;
+    # el índice único de la DB respalda esta comprobación)
+    if not partidas_activas.marcar_respondida(pin, pregunta_id, jugador["id"]):
+        return jsonify({"error": "Ya respondiste esta pregunta"}), 400
+
+    # La respuesta entra en el reparto de puntos antes de esperar a la DB: si la
+    # pregunta se liquida mientras tanto (el host o el temporizador), ya cuenta
+    if not partidas_activas.registrar_respuesta(
+        pin, pregunta_id, jugador["id"], opcion_id, tiempo_respuesta, es_correcta
+    ):
+        partidas_activas.desmarcar_respondida(pin, pregunta_id, jugador["id"])
+        return jsonify({"error": "La pregunta ya está cerrada"}), 400
+
+    # Los puntos se guardan al cerrar la pregunta (ver liquidar_pregunta); aquí
+    # sólo se calculan para mostrárselos al jugador
+    pregunta = estado["pregunta_por_id"][pregunta_id]
+    puntos_ganados = calcular_puntos_respuesta(
+        es_correcta, tiempo_respuesta, pregunta.get("tiempo_limite", 20)
+    )
 
     # 2. Registramos la respuesta y actualizamos el puntaje en la BD
-    #    (Usamos la OTRA nueva función que agregaste en el Paso 1 a database.py)
-    success = registrar_respuesta_y_puntaje(
-        jugador["id"], pregunta_id, opcion_id, tiempo_respuesta, puntos_ganados
+    #    La respuesta entra en la cola del escritor, que la guarda junto con las
+    #    demás que lleguen en la misma ventana (un solo commit para todo el lote).
+    resguardo = escritor_respuestas.encolar(
+        jugador["id"], pregunta_id, opcion_id, tiempo_respuesta, 0
     )
+    # Hasta aquí sólo hubo lecturas: la conexión vuelve al pool antes de esperar,
+    # o con muchos jugadores respondiendo el escritor se queda sin ninguna
+    finalizar_conexion_peticion()
+    exito = resguardo.esperar(ESPERA_MAXIMA_ESCRITURA)
+
+    respuesta = (pin, pregunta_id, jugador["id"], opcion_id, tiempo_respuesta, es_correcta)
+    pendiente = False
+    if exito is None:
+        # Sigue en la cola (sólo en memoria): el resultado se atiende al llegar
+        resguardo.al_resolver(functools.partial(resolver_escritura_respuesta, respuesta))
+        pendiente = True
+    elif not exito:
+        if atender_respuesta_fallida(respuesta) == "retirada":
+            # Que pueda volver a intentarlo
+            return jsonify({"error": "Error al registrar respuesta"}), 500
+        pendiente = True  # Ya puntuada: se reintenta su escritura
+    else:
+        respuestas_total.incrementar(pin)
+
+    # --- IMPORTANTE: Devolvemos al frontend si acertó o no ---
+    cuerpo = {
+        "success": not pendiente,
+        "mensaje": "Respuesta registrada",
+        "es_correcta": es_correcta,  # <-- NUEVO: Le dice al JS si acertó
+        "puntos_ganados": puntos_ganados,  # <-- NUEVO: Cuántos puntos ganó
+    }
+    if pendiente:
+        # 202: recibida pero todavía sin guardar; si al final falla, se podrá repetir
+        cuerpo.update(pendiente=True, mensaje="Respuesta recibida, guardándose")
+        return jsonify(cuerpo), 202
+    return jsonify(cuerpo)
+
+
+def resolver_escritura_respuesta(respuesta, exito, reintentar=True):
+    """Resultado de la escritura de una respuesta que /responder no esperó."""
+    if exito:
+        respuestas_total.incrementar(respuesta[0])
+    else:
+        atender_respuesta_fallida(respuesta, reintentar)
 
-    if success:
-        # --- IMPORTANTE: Devolvemos al frontend si acertó o no ---
-        return jsonify(
-            {
-                "success": True,
-                "mensaje": "Respuesta registrada",
-                "es_correcta": es_correcta,  # <-- NUEVO: Le dice al JS si acertó
-                "puntos_ganados": puntos_ganados,  # <-- NUEVO: Cuántos puntos ganó
-            }
+
+def atender_respuesta_fallida(respuesta, reintentar=True):
+    """
+    Una respuesta no se pudo guardar. Si su pregunta sigue abierta se retira del
+    reparto y el jugador puede repetirla ("retirada"). Si ya se liquidó, sus
+    puntos están en la clasificación y falta su fila: se reintenta una vez
+    ("reintento") y, si vuelve a fallar, se anota la inconsistencia.
+    """
+    pin, pregunta_id, jugador_id, opcion_id, tiempo, es_correcta = respuesta
+    if partidas_activas.retirar_respuesta(
+        pin, pregunta_id, jugador_id, opcion_id, tiempo, es_correcta
+    ):
+        partidas_activas.desmarcar_respondida(pin, pregunta_id, jugador_id)
+        return "retirada"
+    if reintentar:
+        escritor_respuestas.encolar(jugador_id, pregunta_id, opcion_id, tiempo, 0).al_resolver(
+            functools.partial(resolver_escritura_respuesta, respuesta, reintentar=False)
         )
-    else:
-        return jsonify({"error": "Error al registrar respuesta"}), 500
+        return "reintento"
+    respuestas_inconsistentes.incrementar(pin)
+    print(
+        f"⚠️ INCONSISTENCIA: la respuesta del jugador {jugador_id} a la pregunta "
+        f"{pregunta_id} (PIN {pin}) ya sumó sus puntos pero no se pudo guardar"
+    )
+    return "inconsistente"
 
 
 @app.route("/podio")
@@ -477,20 +881,27 @@ def podio_jugador():
     if "session_id" not in session:
         return redirect(url_for("index"))
 
-    jugador = obtener_jugador_por_session(session["session_id"])
+    jugador, _, estado = jugador_de_sesion()
     if not jugador:
         return redirect(url_for("index"))
 
     partida_id = jugador["partida_id"]
 
-    ranking = obtener_ranking(partida_id)
+    if estado is not None:
+        # Clasificación en memoria: sin ORDER BY en la base de datos
+        clasificacion = estado["clasificacion"]
+        ranking = clasificacion.todos()
+        mi_posicion = clasificacion.posicion(jugador["id"])
+    else:
+        ranking = obtener_ranking(partida_id)
+        # Encontrar posición del jugador actual
+        mi_posicion = next(
+            (i + 1 for i, j in enumerate(ranking) if j["id"] == jugador["id"]), 0
+        )
+        if mi_posicion:
+            jugador["puntaje"] = ranking[mi_posicion - 1]["puntaje"]
     podio = obtener_podio(ranking)
 
-    # Encontrar posición del jugador actual
-    mi_posicion = next(
-        (i + 1 for i, j in enumerate(ranking) if j["id"] == jugador["id"]), 0
-    )
-
     return render_template(
         "podium.html",
         podio=podio,
@@ -518,16 +929,17 @@ def host(pin):
     if partida_db["estado"] == "finalizada":
         print(f"🔄 Reiniciando partida finalizada PIN {pin}...")
         reiniciar_partida_db(partida_db["id"])
+        if not confirmar_peticion():
+            return "Error al reiniciar la partida", 500
         partida_db["estado"] = "esperando"
-        if pin in partidas_activas:
-            del partidas_activas[pin]
+        partidas_activas.eliminar(pin)
 
     # 3. Asegurar memoria
     garantizar_estado_partida_en_memoria(pin, partida_db)
     estado_memoria = partidas_activas[pin]
 
-    # 4. Obtener datos para la vista
-    jugadores = obtener_jugadores_partida(partida_db["id"])
+    # 4. Obtener datos para la vista (los jugadores, de la clasificación en memoria)
+    jugadores = estado_memoria["clasificacion"].todos()
     total_preguntas = len(estado_memoria["preguntas"])
 
     # --- NUEVO: Obtener la lista de todos los cuestionarios disponibles ---
@@ -564,11 +976,13 @@ def seleccionar_kahoot(pin):
     # 1. Actualizar en Base de Datos
     exito = actualizar_kahoot_partida(partida["id"], nuevo_kahoot_id)
 
-    if exito:
+    if exito and confirmar_peticion():
+        # El cuestionario se vuelve a leer de la DB al cargar la partida
+        cache_cuestionarios.invalidar(nuevo_kahoot_id)
+
         # 2. IMPORTANTE: Borrar la memoria RAM para este PIN.
         #    Esto forzará a que, al recargar la página, se lean las NUEVAS preguntas de la DB.
-        if pin in partidas_activas:
-            del partidas_activas[pin]
+        if partidas_activas.eliminar(pin) is not None:
             print(
                 f"🧹 Memoria RAM limpiada para PIN {pin} tras cambio de cuestionario."
             )
@@ -588,50 +1002,35 @@ def iniciar_partida(pin):
     if not partida:
         return jsonify({"error": "Partida no encontrada"}), 404
 
-    if pin not in partidas_activas:
-        preguntas = obtener_preguntas_por_kahoot(partida["kahoot_id"])
-        partidas_activas[pin] = {
-            "estado": "esperando",
-            "pregunta_actual": 0,
-            "tiempo_inicio": 0,
-            "preguntas": preguntas,
-            "partida_id": partida["id"],
-        }
+    garantizar_estado_partida_en_memoria(pin, partida)
 
-    # Actualizar estado en memoria
-    partidas_activas[pin]["estado"] = "jugando"
-    partidas_activas[pin]["tiempo_inicio"] = time.time()
-    partidas_activas[pin]["pregunta_actual"] = 0
+    with partidas_activas.bloquear(pin):
+        # Actualizar estado en base de datos (antes de empezar en memoria)
+        actualizar_estado_partida(partida["id"], "en_curso")
+        if not confirmar_peticion():
+            return jsonify({"error": "Error al actualizar la base de datos"}), 500
 
-    # Actualizar estado en base de datos
-    actualizar_estado_partida(partida["id"], "en_curso")
+        # Actualizar estado en memoria y poner en marcha el reloj de la pregunta
+        iniciar_pregunta(pin, 0)
 
     return jsonify({"success": True})
 
 
 @app.route("/host/<pin>/siguiente", methods=["POST"])
 def siguiente_pregunta(pin):
-    """Pasar a la siguiente pregunta (Versión Limpia - SIN CALCULAR PUNTOS)"""
+    """Pasar a la siguiente pregunta (liquidando antes los puntos de la actual)"""
     if pin not in partidas_activas:
         return jsonify({"error": "Partida no iniciada"}), 400
 
-    estado = partidas_activas[pin]
-
-    # ==================================================================
-    # [ELIMINADO] LÓGICA ANTIGUA DE CÁLCULO DE PUNTAJES
-    # Los puntos ahora se calculan y suman en tiempo real en la ruta /responder.
-    # Aquí ya no se debe tocar el puntaje.
-    # ==================================================================
+    # Un solo avance a la vez: dos clics seguidos no se saltan una pregunta
+    with partidas_activas.bloquear(pin):
+        estado = avanzar_pregunta(pin)
 
-    # Avanzar a la siguiente pregunta
-    estado["pregunta_actual"] += 1
-    estado["tiempo_inicio"] = time.time()
-    estado["estado"] = "jugando"
+    # Puntos de la pregunta liquidada y, al acabar, el estado 'finalizada'
+    if not confirmar_peticion():
+        return jsonify({"error": "Error al guardar los puntos en la base de datos"}), 500
 
-    # Verificar si se terminó el juego
-    if estado["pregunta_actual"] >= len(estado["preguntas"]):
-        estado["estado"] = "finalizado"
-        actualizar_estado_partida(estado["partida_id"], "finalizada")
+    if estado["estado"] == "finalizado":
         return jsonify({"success": True, "finalizado": True})
 
     return jsonify(
@@ -649,15 +1048,19 @@ def mostrar_resultado(pin):
     if pin not in partidas_activas:
         return jsonify({"error": "Partida no iniciada"}), 400
 
-    estado = partidas_activas[pin]
-    estado["estado"] = "mostrando_resultado"
+    with partidas_activas.bloquear(pin):
+        # Sólo con una pregunta en juego: en la sala de espera se liquidaría la
+        # primera antes de empezar, y en una partida finalizada no hay ninguna
+        if partidas_activas[pin]["estado"] != "jugando":
+            return jsonify({"error": "No hay pregunta en curso"}), 400
+        estado = mostrar_resultado_pregunta(pin)
 
-    pregunta = estado["preguntas"][estado["pregunta_actual"]]
-    opciones = obtener_opciones_pregunta(pregunta["id"])
-    respuestas = obtener_respuestas_pregunta(pregunta["id"], estado["partida_id"])
+    if not confirmar_peticion():
+        return jsonify({"error": "Error al guardar los puntos en la base de datos"}), 500
 
-    stats = generar_estadisticas_pregunta(respuestas, opciones)
-    ranking = obtener_ranking(estado["partida_id"])[:5]  # Top 5
+    pregunta = estado["preguntas"][estado["pregunta_actual"]]
+    stats = partidas_activas.estadisticas_pregunta(pin, pregunta["id"])
+    ranking = estado["clasificacion"].top(5)  # Top 5
 
     return jsonify(
         {
@@ -668,19 +1071,166 @@ def mostrar_resultado(pin):
     )
 
 
+# --- RELOJ DE LAS PREGUNTAS (ver temporizador.py) ---
+# Estas funciones se llaman con el lock de la partida tomado.
+
+
+def iniciar_pregunta(pin, indice):
+    """Pone en juego la pregunta 'indice' y programa su cierre al acabarse el tiempo."""
+    tiempo_inicio = time.time()
+    estado = registrar_cambio_estado(
+        pin, estado="jugando", pregunta_actual=indice, tiempo_inicio=tiempo_inicio
+    )
+    relojes_preguntas[pin] = (indice, tiempo_inicio, time.monotonic())
+
+    tiempo_limite = estado["preguntas"][indice].get("tiempo_limite", 20)
+    temporizador.programar(
+        pin,
+        tiempo_limite + GRACIA_RESPUESTAS,
+        lambda: cerrar_pregunta_por_tiempo(pin, indice, tiempo_inicio),
+    )
+    return estado
+
+
+def avanzar_pregunta(pin):
+    """Liquida la pregunta actual y pasa a la siguiente, o finaliza la partida."""
+    estado = partidas_activas[pin]
+
+    # Cerrar la pregunta actual: sus puntos se calculan y guardan todos juntos
+    # (si ya se mostraron los resultados, ya estaba liquidada)
+    liquidar_pregunta(pin, estado["pregunta_actual"])
+
+    siguiente = estado["pregunta_actual"] + 1
+    if siguiente >= len(estado["preguntas"]):
+        temporizador.cancelar(pin)
+        relojes_preguntas.pop(pin, None)
+        actualizar_estado_partida(estado["partida_id"], "finalizada")
+        return registrar_cambio_estado(
+            pin, estado="finalizado", pregunta_actual=siguiente
+        )
+    return iniciar_pregunta(pin, siguiente)
+
+
+def mostrar_resultado_pregunta(pin):
+    """Cierra y liquida la pregunta actual y pasa a mostrar sus resultados."""
+    estado = registrar_cambio_estado(pin, estado="mostrando_resultado")
+
+    # Al mostrar resultados la pregunta se cierra y se reparten sus puntos
+    liquidar_pregunta(pin, estado["pregunta_actual"])
+
+    if AUTO_AVANZAR:
+        indice, tiempo_inicio = estado["pregunta_actual"], estado["tiempo_inicio"]
+        temporizador.programar(
+            pin,
+            AUTO_AVANZAR,
+            lambda: avanzar_por_tiempo(pin, indice, tiempo_inicio),
+        )
+    else:
+        # La pregunta ya está cerrada: su cierre programado no tiene nada que hacer
+        temporizador.cancelar(pin)
+    return estado
+
+
+def _misma_pregunta(estado, indice, tiempo_inicio):
+    # El tiempo_inicio distingue esta pregunta de la misma tras reiniciar la partida
+    return (
+        estado is not None
+        and estado["pregunta_actual"] == indice
+        and estado["tiempo_inicio"] == tiempo_inicio
+    )
+
+
+def cerrar_pregunta_por_tiempo(pin, indice, tiempo_inicio):
+    """Tarea del temporizador: se acabó el tiempo de la pregunta 'indice'."""
+    with partidas_activas.bloquear(pin):
+        estado = partidas_activas.get(pin)
+        if not _misma_pregunta(estado, indice, tiempo_inicio) or estado["estado"] != "jugando":
+            return
+        if AUTO_AVANZAR:
+            mostrar_resultado_pregunta(pin)
+        else:
+            # Los puntos quedan repartidos; el host decide cuándo enseñarlos
+            liquidar_pregunta(pin, indice)
+
+
+def avanzar_por_tiempo(pin, indice, tiempo_inicio):
+    """Tarea del temporizador: pasar a la siguiente pregunta tras mostrar resultados."""
+    with partidas_activas.bloquear(pin):
+        estado = partidas_activas.get(pin)
+        if (
+            _misma_pregunta(estado, indice, tiempo_inicio)
+            and estado["estado"] == "mostrando_resultado"
+        ):
+            avanzar_pregunta(pin)
+
+
+def segundos_en_pregunta(pin, estado):
+    """
+    Segundos desde que empezó la pregunta actual. Con el reloj monotónico si la
+    empezó este proceso; si no (estado compartido), con la hora guardada.
+    """
+    reloj = relojes_preguntas.get(pin)
+    if reloj is not None and reloj[:2] == (estado["pregunta_actual"], estado["tiempo_inicio"]):
+        return time.monotonic() - reloj[2]
+    return time.time() - estado["tiempo_inicio"]
+
+
+def liquidar_pregunta(pin, indice):
+    """
+    Cierra una pregunta: calcula de una sola pasada los puntos de todas sus
+    respuestas, los suma a la clasificación y guarda los nuevos totales con un
+    único UPDATE. Sólo tiene efecto la primera vez para cada pregunta.
+    """
+    estado = partidas_activas.get(pin)
+    if estado is None or indice >= len(estado["preguntas"]):
+        return
+    pregunta = estado["preguntas"][indice]
+
+    respuestas = partidas_activas.cerrar_pregunta(pin, pregunta["id"])
+    if respuestas is None:
+        return
+    jugadores, tiempos, correctas = respuestas
+
+    puntos = calcular_puntajes_lote(
+        tiempos, correctas, pregunta.get("tiempo_limite", 20)
+    )
+    actualizados = estado["clasificacion"].sumar_puntos_lote(zip(jugadores, puntos))
+    guardar_liquidacion(estado["partida_id"], pregunta["id"], actualizados)
+
+
+@app.route("/host/<pin>/estadisticas")
+def estadisticas_en_vivo(pin):
+    """Respuestas recibidas hasta ahora en la pregunta actual (para barras en vivo)"""
+    estado = partidas_activas.get(pin)
+    if estado is None:
+        return jsonify({"error": "Partida no iniciada"}), 400
+    if estado["pregunta_actual"] >= len(estado["preguntas"]):
+        return jsonify({"error": "No hay pregunta en curso"}), 400
+
+    pregunta = estado["preguntas"][estado["pregunta_actual"]]
+    return jsonify(
+        {
+            "pregunta_actual": estado["pregunta_actual"],
+            "estadisticas": partidas_activas.estadisticas_pregunta(pin, pregunta["id"]),
+        }
+    )
+
+
 @app.route("/host/<pin>/estado")
 def estado_partida(pin):
     """Obtener estado actual de la partida (para polling)"""
-    partida = obtener_partida_por_pin(pin)
-    if not partida:
-        return jsonify({"error": "Partida no encontrada"}), 404
-
-    jugadores = obtener_jugadores_partida(partida["id"])
     estado_memoria = partidas_activas.get(pin)
+    # Con la partida en memoria la lista sale de su clasificación, sin ir a la DB
+    if estado_memoria is not None:
+        jugadores = estado_memoria["clasificacion"].todos()
+        estado_actual_str = estado_memoria["estado"]
+    else:
+        partida = obtener_partida_por_pin(pin)
+        if not partida:
+            return jsonify({"error": "Partida no encontrada"}), 404
+        jugadores = obtener_jugadores_partida(partida["id"])
+        estado_actual_str = partida["estado"]
 
-    estado_actual_str = (
-        estado_memoria["estado"] if estado_memoria else partida["estado"]
-    )
     pregunta_actual_idx = estado_memoria["pregunta_actual"] if estado_memoria else 0
 
     tiempo_restante = 0
@@ -706,76 +1256,120 @@ def estado_partida(pin):
     )
 
 
+@app.route("/host/<pin>/eventos")
+def eventos_host(pin):
+    """Flujo SSE del host: cambios de estado y jugadores que se unen"""
+    partida = obtener_partida_por_pin(pin)
+    if not partida:
+        return jsonify({"error": "Partida no encontrada"}), 404
+
+    estado = partidas_activas.get(pin)
+    evento_inicial = ("estado", resumen_estado_partida(estado)) if estado else None
+    return respuesta_sse(partida["id"], evento_inicial)
+
+
 # ============================================
 # API PARA POLLING (Actualización automática)
 # ============================================
 
 
+@app.route("/api/eventos")
+def api_eventos():
+    """Flujo SSE del jugador: recibe los cambios de estado de su partida al instante"""
+    if "session_id" not in session:
+        return jsonify({"error": "No autorizado"}), 401
+
+    jugador, _, estado = jugador_de_sesion()
+    if not jugador:
+        return jsonify({"error": "Jugador no encontrado"}), 404
+
+    partida_id = jugador["partida_id"]
+    if estado is not None:
+        evento_inicial = ("estado", resumen_estado_partida(estado))
+    else:
+        evento_inicial = ("estado", {"estado": "esperando"})
+    return respuesta_sse(partida_id, evento_inicial)
+
+
 @app.route("/api/estado-juego")
 def api_estado_juego():
     """API para que los jugadores consulten el estado"""
     if "session_id" not in session:
         return jsonify({"error": "No autorizado"}), 401
 
-    jugador = obtener_jugador_por_session(session["session_id"])
+    jugador, pin, estado = jugador_de_sesion()
     if not jugador:
         return jsonify({"error": "Jugador no encontrado"}), 404
 
     partida_id = jugador["partida_id"]
-    pin = None
-    estado = None
-
-    for p_pin, p_estado in partidas_activas.items():
-        if p_estado["partida_id"] == partida_id:
-            pin = p_pin
-            estado = p_estado
-            break
 
     if estado is None:
-        from database import get_db_connection
-
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT estado FROM partidas WHERE id = %s", (partida_id,))
-            partida_db = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            if partida_db and partida_db["estado"] == "esperando":
-                return jsonify(
-                    {
-                        "estado": "esperando",
-                        "mensaje": "Esperando que el host inicie la partida...",
-                    }
-                )
+        partida_db = obtener_partida_por_id(partida_id)
+        if partida_db and partida_db["estado"] == "esperando":
+            return jsonify(
+                {
+                    "estado": "esperando",
+                    "mensaje": "Esperando que el host inicie la partida...",
+                }
+            )
         return jsonify(
             {"estado": "esperando", "mensaje": "Esperando conexión con la partida..."}
         )
 
-    if estado["estado"] == "finalizado":
-        return jsonify({"estado": "finalizado", "redirect": "/podio"})
+    # El JSON del estado se codifica una sola vez por versión y lo comparten
+    # todos los jugadores; si el navegador ya tiene esa versión, basta un 304.
+    etag, cuerpo = partidas_activas.instantanea(pin, codificar_estado_partida)
+    # mi_puntaje es lo único propio del jugador: se añade al JSON compartido y
+    # entra en el ETag, así que el 304 sigue siendo correcto al cambiar
+    mi_puntaje = jugador["puntaje"] or 0
+    etag = f'{etag[:-1]}-{mi_puntaje}"'
+    if request.if_none_match.contains_raw(etag):
+        return Response(status=304, headers={"ETag": etag})
+    cuerpo = cuerpo[:-1] + b', "mi_puntaje": %d}' % mi_puntaje
+
+    return Response(
+        cuerpo,
+        mimetype="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
 
-    tiempo_restante = 0
-    if estado["estado"] == "jugando":
-        if estado["pregunta_actual"] < len(estado["preguntas"]):
-            pregunta = estado["preguntas"][estado["pregunta_actual"]]
-            tiempo_transcurrido = time.time() - estado["tiempo_inicio"]
-            tiempo_restante = max(
-                0, int(pregunta.get("tiempo_limite", 20) - tiempo_transcurrido)
-            )
-        else:
-            return jsonify({"estado": "finalizado", "redirect": "/podio"})
+
+# ============================================
+# MÉTRICAS (sólo desde la propia máquina)
+# ============================================
+
+
+@app.route("/api/metricas")
+def api_metricas():
+    """Contadores internos: pool de conexiones, escritor de respuestas y caché"""
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "No autorizado"}), 403
 
     return jsonify(
         {
-            "estado": estado["estado"],
-            "pregunta_actual": estado["pregunta_actual"],
-            "tiempo_restante": tiempo_restante,
-            "mi_puntaje": jugador["puntaje"],
+            "pool_db": obtener_estadisticas_pool(),
+            "escritor_respuestas": escritor_respuestas.obtener_metricas(),
+            "admision_jugadores": admision_jugadores.obtener_metricas(),
+            "cache_cuestionarios": cache_cuestionarios.obtener_estadisticas(),
+            "perfilador": perfilador.obtener_estadisticas() if perfilador else None,
+            "temporizador": {"tareas_pendientes": temporizador.pendientes()},
+            "eventos_sse": {
+                "suscriptores": canal_eventos.total_suscriptores(),
+                "max_suscriptores": canal_eventos.max_suscriptores,
+            },
         }
     )
 
 
+@app.route("/metrics")
+def metrics():
+    """Las mismas métricas y las latencias en el formato de Prometheus, para su scraper"""
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "No autorizado"}), 403
+
+    return Response(registro_metricas.exponer(), content_type=TIPO_CONTENIDO)
+
+
 # ============================================
 # NUEVAS RUTAS PARA CREAR CUESTIONARIOS
 # ============================================
@@ -813,10 +1407,19 @@ def api_guardar_cuestionario():
         # Pasamos el nombre de usuario que guardamos en la sesión al hacer login.
         usuario_nombre = session["username"]
 
+        # Las imágenes en base64 se guardan como archivo y en la DB queda su URL
+        try:
+            extraer_imagenes_cuestionario(datos_json)
+        except ImagenInvalidaError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
         # Llamamos a la función de base de datos con el NOMBRE, no el ID.
         exito, resultado = guardar_cuestionario_completo(usuario_nombre, datos_json)
+        if exito and not confirmar_peticion():
+            exito, resultado = False, "no se pudo confirmar la transacción"
 
         if exito:
+            cache_cuestionarios.invalidar(resultado)
             flash("¡Cuestionario creado exitosamente!", "success")
             # Redirigir a la página principal (o a un futuro dashboard)
             return jsonify({"success": True, "redirect_url": url_for("index")})
@@ -831,6 +1434,119 @@ def api_guardar_cuestionario():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route("/api/importar-cuestionario", methods=["POST"])
+def api_importar_cuestionario():
+    """
+    Importa un banco de preguntas (CSV, JSON o JSON Lines) subido como archivo.
+    Se procesa por bloques y devuelve los errores de cada fila inválida.
+    """
+    if "user_id" not in session:
+        return jsonify({"success": False, "error": "No autorizado"}), 401
+
+    archivo = request.files.get("archivo")
+    if archivo is None or not archivo.filename:
+        return jsonify({"success": False, "error": "Falta el archivo"}), 400
+
+    formato = request.form.get("formato") or detectar_formato(archivo.filename)
+    if formato not in FORMATOS:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": f"Formato no soportado (usa {', '.join(FORMATOS)})",
+                }
+            ),
+            400,
+        )
+    titulo = (request.form.get("titulo") or "").strip() or archivo.filename.rsplit(".", 1)[0]
+
+    # archivo.stream se lee por trozos; Werkzeug ya lo guarda en disco si es grande
+    informe = importar_banco_preguntas(
+        session["username"], titulo, archivo.stream, formato
+    )
+    codigo_error = 400
+    if informe["exito"] and not confirmar_peticion():
+        informe["exito"] = False
+        informe["error"] = "Error de BD: no se pudo confirmar la transacción"
+        codigo_error = 500
+    if informe["exito"]:
+        cache_cuestionarios.invalidar(informe["kahoot_id"])
+    informe["success"] = informe.pop("exito")
+    return jsonify(informe), (200 if informe["success"] else codigo_error)
+
+
+@app.cli.command("importar-preguntas", with_appcontext=False)
+@click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--titulo", help="Título del cuestionario (por defecto, el nombre del archivo)")
+@click.option("--usuario", default="admin", show_default=True, help="Valor de kahoots.creado_por")
+@click.option("--formato", type=click.Choice(FORMATOS), help="Por defecto, según la extensión")
+def importar_preguntas_cli(archivo, titulo, usuario, formato):
+    """Importa un banco de preguntas: flask --app app importar-preguntas banco.csv"""
+    formato = formato or detectar_formato(archivo)
+    if formato is None:
+        raise click.UsageError("No se reconoce el formato; indícalo con --formato")
+    titulo = titulo or os.path.splitext(os.path.basename(archivo))[0]
+
+    with open(archivo, "rb") as flujo:
+        informe = importar_banco_preguntas(usuario, titulo, flujo, formato)
+
+    for error in informe["errores"]:
+        click.echo(f"  Fila {error['fila']}: {error['error']}", err=True)
+    if informe["total_errores"] > len(informe["errores"]):
+        click.echo(
+            f"  ... y {informe['total_errores'] - len(informe['errores'])} errores más",
+            err=True,
+        )
+    if not informe["exito"]:
+        raise click.ClickException(informe["error"])
+    click.echo(
+        f"✅ Cuestionario {informe['kahoot_id']} '{titulo}': "
+        f"{informe['importadas']} de {informe['filas']} preguntas importadas"
+    )
+
+
+@app.cli.command("crear-partida", with_appcontext=False)
+@click.argument("pin")
+@click.argument("kahoot_id", type=int)
+def crear_partida_cli(pin, kahoot_id):
+    """Crea una partida con ese PIN: flask --app app crear-partida 42777 1"""
+    partida_id = crear_partida(pin, kahoot_id)
+    if partida_id is None:
+        raise click.ClickException("No se pudo crear la partida (¿PIN repetido?)")
+    click.echo(f"✅ Partida {partida_id} creada con PIN {pin}")
+
+
+@app.cli.command("migrar-imagenes", with_appcontext=False)
+def migrar_imagenes_cli():
+    """Pasa a archivo las imágenes en base64 de las preguntas ya guardadas: flask --app app migrar-imagenes"""
+
+    def al_migrar(kahoot_id):
+        # El comando corre con contexto de app (la conexión es la de "petición"):
+        # se confirma antes de subir la versión, para que los procesos que ya
+        # sirven partidas vuelvan a leer el cuestionario con la imagen nueva
+        if confirmar_peticion():
+            cache_cuestionarios.invalidar(kahoot_id)
+
+    migradas = migrar_imagenes_embebidas(al_migrar)
+    click.echo(f"🖼️  {migradas} imágenes en base64 movidas a {CARPETA_IMAGENES}")
+
+
+@app.route("/imagenes/<nombre>")
+def servir_imagen(nombre):
+    """
+    Imágenes de las preguntas. El nombre es el hash del contenido, así que se
+    pueden cachear para siempre; el ETag permite revalidar con un 304.
+    """
+    respuesta = send_from_directory(
+        app.config["UPLOAD_FOLDER"],
+        nombre,
+        max_age=MAX_AGE_IMAGENES,
+        etag=etag_imagen(nombre),
+    )
+    respuesta.cache_control.immutable = True
+    return respuesta
+
+
 # ============================================
 # INICIAR SERVIDOR
 # ============================================
@@ -0,0 +1,535 @@
+# carga_partida.py - Prueba de carga de una partida completa
+# Simula una clase entera jugando contra la app de verdad: miles de jugadores
+# entran por /unirse en oleadas, consultan /api/estado-juego, cargan /jugar y
+# responden por /responder (la mayoría en los primeros segundos, como en clase),
+# mientras un host simulado lleva la partida con /host/<pin>/iniciar,
+# /mostrar-resultado y /siguiente.
+#
+# Al terminar muestra, por ruta, latencias p50/p95/p99, peticiones por segundo
+# y consultas a la DB por petición, y guarda todo en un JSON para compararlo
+# con el de otra versión (--comparar).
+#
+# Uso:
+#   python carga_partida.py --pin 123456 --jugadores 2000 --url http://127.0.0.1:5000
+#   python carga_partida.py --pin 123456 --jugadores 500 --en-proceso
+#   python carga_partida.py --pin 123456 --comparar resultados_carga/anterior.json
+#
+# La partida (con su cuestionario) tiene que existir ya en la DB. Las consultas
+# por petición sólo se ven si el servidor corre con KAHOOT_CONTAR_CONSULTAS=1
+# (con --en-proceso se activa solo).
+
+import argparse
+import collections
+import datetime
+import heapq
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+CARPETA_RESULTADOS = "resultados_carga"
+
+# Segundos máximos de espera por una respuesta del servidor
+ESPERA_PETICION = 30
+
+# Una ruta empeora si su p95 o p99 sube más de este porcentaje (ver --tolerancia)
+TOLERANCIA_REGRESION = 20.0
+
+# ... y además más de estos milisegundos (para no avisar por ruido en rutas rapidísimas)
+MARGEN_REGRESION_MS = 1.0
+
+RE_PREGUNTA_ID = re.compile(r"const preguntaId = (\d+);")
+RE_OPCION_ID = re.compile(r'data-opcion-id="(\d+)"')
+
+
+# ============================================
+# CLIENTES (POR HTTP O DENTRO DEL PROCESO)
+# ============================================
+
+
+class ClienteHTTP:
+    """Un jugador (o el host) hablando con el servidor por HTTP, con sus cookies."""
+
+    def __init__(self, url):
+        partes = urlsplit(url)
+        self.host = partes.hostname
+        self.puerto = partes.port or 80
+        self.cookies = {}
+
+    def peticion(self, metodo, ruta, formulario=None, json_datos=None, cabeceras=None):
+        cabeceras = dict(cabeceras or {})
+        cuerpo = None
+        if formulario is not None:
+            cuerpo = urlencode(formulario).encode("utf-8")
+            cabeceras["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_datos is not None:
+            cuerpo = json.dumps(json_datos).encode("utf-8")
+            cabeceras["Content-Type"] = "application/json"
+        if self.cookies:
+            cabeceras["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+
+        conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=ESPERA_PETICION)
+        try:
+            conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            respuesta = conexion.getresponse()
+            datos = respuesta.read()
+            recibidas = respuesta.getheaders()
+        finally:
+            conexion.close()
+        for nombre, valor in recibidas:
+            if nombre.lower() == "set-cookie":
+                galleta = SimpleCookie()
+                galleta.load(valor)
+                for clave, morsel in galleta.items():
+                    self.cookies[clave] = morsel.value
+        return respuesta.status, {n.lower(): v for n, v in recibidas}, datos
+
+
+class ClienteEnProceso:
+    """Lo mismo, pero llamando a la app de Flask directamente (sin red)."""
+
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def peticion(self, metodo, ruta, formulario=None, json_datos=None, cabeceras=None):
+        respuesta = self._cliente.open(
+            ruta, method=metodo, data=formulario, json=json_datos, headers=cabeceras
+        )
+        return (
+            respuesta.status_code,
+            {n.lower(): v for n, v in respuesta.headers.items()},
+            respuesta.get_data(),
+        )
+
+
+# ============================================
+# MEDICIÓN
+# ============================================
+
+
+def percentil(ordenados, p):
+    """Percentil 'p' (0-100) de una lista ya ordenada, por rango más cercano."""
+    if not ordenados:
+        return None
+    rango = math.ceil(p / 100 * len(ordenados))
+    return ordenados[min(max(rango, 1), len(ordenados)) - 1]
+
+
+class Medidor:
+    """Apunta la latencia, el código y las consultas a la DB de cada petición, por ruta."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {ruta: [(milisegundos, codigo, consultas_db o None)]}
+        self.muestras = collections.defaultdict(list)
+
+    def pedir(self, etiqueta, cliente, metodo, ruta, **kwargs):
+        """Hace la petición y la anota bajo 'etiqueta' (la ruta sin el PIN)."""
+        inicio = time.perf_counter()
+        try:
+            codigo, cabeceras, cuerpo = cliente.peticion(metodo, ruta, **kwargs)
+        except (OSError, http.client.HTTPException):
+            codigo, cabeceras, cuerpo = 0, {}, b""
+        milisegundos = (time.perf_counter() - inicio) * 1000
+        consultas = cabeceras.get("x-consultas-db")
+        with self._lock:
+            self.muestras[etiqueta].append(
+                (milisegundos, codigo, int(consultas) if consultas is not None else None)
+            )
+        return codigo, cabeceras, cuerpo
+
+    def resumen(self, duracion):
+        rutas = {}
+        with self._lock:
+            muestras = {ruta: list(lista) for ruta, lista in self.muestras.items()}
+        for ruta, lista in sorted(muestras.items()):
+            tiempos = sorted(m[0] for m in lista)
+            codigos = collections.Counter(str(m[1]) for m in lista)
+            consultas = [m[2] for m in lista if m[2] is not None]
+            rutas[ruta] = {
+                "peticiones": len(lista),
+                # 0 = sin respuesta (conexión rechazada, timeout...)
+                "errores": sum(1 for m in lista if m[1] == 0 or m[1] >= 500),
+                "codigos": dict(codigos),
+                "rps": round(len(lista) / duracion, 2) if duracion else None,
+                "media_ms": round(sum(tiempos) / len(tiempos), 2),
+                "p50_ms": round(percentil(tiempos, 50), 2),
+                "p95_ms": round(percentil(tiempos, 95), 2),
+                "p99_ms": round(percentil(tiempos, 99), 2),
+                "max_ms": round(tiempos[-1], 2),
+                "consultas_db": round(sum(consultas) / len(consultas), 2) if consultas else None,
+            }
+        return rutas
+
+
+# ============================================
+# PLANIFICADOR DE TAREAS
+# ============================================
+
+
+class Planificador:
+    """
+    Ejecuta las tareas de todos los jugadores a la hora que les toca, en un
+    pool de hilos. Si el pool no da abasto las tareas empiezan tarde; ese
+    retraso se anota para saber si el cuello de botella era el propio cliente.
+    """
+
+    def __init__(self, hilos):
+        self._pool = ThreadPoolExecutor(hilos, thread_name_prefix="jugador")
+        self._cola = []  # heap de (momento, n, tarea, args)
+        self._contador = itertools.count()
+        self._condicion = threading.Condition()
+        self._pendientes = 0  # En la cola o ejecutándose
+        self.retrasos = []
+
+    def agendar(self, momento, tarea, *args):
+        """Programa 'tarea(*args)' para el instante 'momento' (time.monotonic)."""
+        with self._condicion:
+            heapq.heappush(self._cola, (momento, next(self._contador), tarea, args))
+            self._pendientes += 1
+            self._condicion.notify()
+
+    def ejecutar(self):
+        """Lanza las tareas a su hora hasta que no queda ninguna por hacer."""
+        with self._condicion:
+            while self._pendientes:
+                if not self._cola:
+                    self._condicion.wait()
+                    continue
+                espera = self._cola[0][0] - time.monotonic()
+                if espera > 0:
+                    self._condicion.wait(espera)
+                    continue
+                momento, _, tarea, args = heapq.heappop(self._cola)
+                self._pool.submit(self._correr, momento, tarea, args)
+
+    def _correr(self, momento, tarea, args):
+        retraso = time.monotonic() - momento
+        try:
+            tarea(*args)
+        except Exception as e:
+            print(f"Error en una tarea simulada: {e}")
+        finally:
+            with self._condicion:
+                self.retrasos.append(retraso)
+                self._pendientes -= 1
+                self._condicion.notify()
+
+    def cerrar(self):
+        self._pool.shutdown()
+
+
+# ============================================
+# SIMULACIÓN DE LA PARTIDA
+# ============================================
+
+
+class Jugador:
+    def __init__(self, numero, cliente):
+        self.numero = numero
+        self.cliente = cliente
+        self.etag = None  # Último ETag de /api/estado-juego
+        self.pregunta_id = None
+        self.opciones = []
+        self.respondida = None  # pregunta_id ya respondida
+
+
+class PartidaSimulada:
+    def __init__(self, args, nuevo_cliente, medidor):
+        self.args = args
+        self.nuevo_cliente = nuevo_cliente
+        self.medidor = medidor
+        self.pin = args.pin
+        self.host = nuevo_cliente()
+        self.jugadores = [Jugador(i, nuevo_cliente()) for i in range(1, args.jugadores + 1)]
+        self.planificador = Planificador(args.concurrencia)
+        self.preguntas_jugadas = 0
+
+    def pedir_host(self, metodo, sufijo):
+        etiqueta = "/host/<pin>" + sufijo
+        return self.medidor.pedir(etiqueta, self.host, metodo, f"/host/{self.pin}{sufijo}")
+
+    # --- JUGADORES ---
+
+    def unirse(self, jugador):
+        self.medidor.pedir(
+            "/unirse",
+            jugador.cliente,
+            "POST",
+            "/unirse",
+            formulario={"pin": self.pin, "nombre": f"carga{jugador.numero}"},
+        )
+        self.medidor.pedir("/lobby", jugador.cliente, "GET", "/lobby")
+
+    def sondear(self, jugador):
+        cabeceras = {"If-None-Match": jugador.etag} if jugador.etag else None
+        codigo, recibidas, cuerpo = self.medidor.pedir(
+            "/api/estado-juego", jugador.cliente, "GET", "/api/estado-juego", cabeceras=cabeceras
+        )
+        if codigo == 200:
+            jugador.etag = recibidas.get("etag")
+        return codigo, cuerpo
+
+    def ver_pregunta(self, jugador, momento_respuesta):
+        """Primer vistazo a la pregunta nueva: estado, /jugar y respuesta agendada."""
+        self.sondear(jugador)
+        codigo, _, cuerpo = self.medidor.pedir("/jugar", jugador.cliente, "GET", "/jugar")
+        html = cuerpo.decode("utf-8", "replace")
+        encontrada = RE_PREGUNTA_ID.search(html)
+        if codigo != 200 or encontrada is None:
+            return
+        jugador.pregunta_id = int(encontrada.group(1))
+        jugador.opciones = RE_OPCION_ID.findall(html)
+        self.planificador.agendar(max(momento_respuesta, time.monotonic()), self.responder, jugador)
+
+    def responder(self, jugador):
+        if not jugador.opciones or jugador.respondida == jugador.pregunta_id:
+            return
+        tiempo = round(random.uniform(0.5, self.args.duracion_pregunta), 2)
+        self.medidor.pedir(
+            "/responder",
+            jugador.cliente,
+            "POST",
+            "/responder",
+            json_datos={
+                "pregunta_id": jugador.pregunta_id,
+                "opcion_id": int(random.choice(jugador.opciones)),
+                "tiempo_respuesta": tiempo,
+            },
+        )
+        jugador.respondida = jugador.pregunta_id
+
+    # --- FASES ---
+
+    def fase_union(self):
+        """Los jugadores entran en oleadas de --oleada, como al proyectar el PIN."""
+        inicio = time.monotonic()
+        for indice in range(0, len(self.jugadores), self.args.oleada):
+            momento = inicio + (indice // self.args.oleada) * self.args.pausa_oleada
+            for jugador in self.jugadores[indice : indice + self.args.oleada]:
+                self.planificador.agendar(momento + random.uniform(0, 0.5), self.unirse, jugador)
+        self.planificador.ejecutar()
+
+    def fase_pregunta(self):
+        """
+        Una pregunta: cada jugador la ve en su siguiente consulta, responde tras
+        pensar (la mayoría al principio) y sigue consultando el estado hasta el
+        final; el host mira las estadísticas en vivo cada segundo.
+        """
+        inicio = time.monotonic()
+        fin = inicio + self.args.duracion_pregunta
+        intervalo = self.args.intervalo_sondeo
+        for jugador in self.jugadores:
+            primera = inicio + random.uniform(0, intervalo)
+            pensar = random.gammavariate(2, self.args.duracion_pregunta / 8)
+            respuesta = min(primera + pensar, fin - 0.1)
+            self.planificador.agendar(primera, self.ver_pregunta, jugador, respuesta)
+            momento = primera + intervalo
+            while momento < fin:
+                self.planificador.agendar(momento, self.sondear, jugador)
+                momento += intervalo
+        for segundo in range(1, int(self.args.duracion_pregunta)):
+            self.planificador.agendar(inicio + segundo, self.pedir_host, "GET", "/estadisticas")
+        self.planificador.ejecutar()
+
+    def fase_resultado(self):
+        self.pedir_host("POST", "/mostrar-resultado")
+        # Todos ven "mostrando resultado" en su siguiente consulta
+        inicio = time.monotonic()
+        for jugador in self.jugadores:
+            self.planificador.agendar(
+                inicio + random.uniform(0, self.args.intervalo_sondeo), self.sondear, jugador
+            )
+        self.planificador.ejecutar()
+
+    def jugar(self):
+        codigo, _, _ = self.pedir_host("GET", "")
+        if codigo != 200:
+            raise SystemExit(f"La partida con PIN {self.pin} no responde (código {codigo})")
+
+        print(f"👥 Uniendo {len(self.jugadores)} jugadores...")
+        self.fase_union()
+
+        self.pedir_host("POST", "/iniciar")
+        while self.preguntas_jugadas < self.args.preguntas:
+            self.preguntas_jugadas += 1
+            print(f"❓ Pregunta {self.preguntas_jugadas}")
+            self.fase_pregunta()
+            self.fase_resultado()
+            codigo, _, cuerpo = self.pedir_host("POST", "/siguiente")
+            if codigo != 200 or json.loads(cuerpo or b"{}").get("finalizado"):
+                break
+
+        inicio = time.monotonic()
+        for jugador in self.jugadores:
+            self.planificador.agendar(
+                inicio + random.uniform(0, self.args.intervalo_sondeo),
+                self.medidor.pedir,
+                "/podio",
+                jugador.cliente,
+                "GET",
+                "/podio",
+            )
+        self.planificador.ejecutar()
+        self.planificador.cerrar()
+
+
+# ============================================
+# RESULTADOS
+# ============================================
+
+
+def commit_actual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def imprimir_resultados(resultados):
+    print()
+    print(
+        f"{'ruta':34} {'pet.':>7} {'err.':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'consultas':>9}"
+    )
+    for ruta, datos in resultados["rutas"].items():
+        consultas = "-" if datos["consultas_db"] is None else f"{datos['consultas_db']:.2f}"
+        print(
+            f"{ruta:34} {datos['peticiones']:>7} {datos['errores']:>5} {datos['rps']:>8} "
+            f"{datos['p50_ms']:>8} {datos['p95_ms']:>8} {datos['p99_ms']:>8} {consultas:>9}"
+        )
+    print(f"(ms; retraso del propio cliente p95: {resultados['retraso_cliente_p95_ms']} ms)")
+
+
+def comparar(actuales, anteriores, tolerancia):
+    """Lista de regresiones (texto) de 'actuales' respecto a 'anteriores'."""
+    regresiones = []
+    for ruta, datos in actuales["rutas"].items():
+        previos = anteriores["rutas"].get(ruta)
+        if previos is None:
+            continue
+        for clave in ("p95_ms", "p99_ms"):
+            if (
+                datos[clave] > previos[clave] * (1 + tolerancia / 100)
+                and datos[clave] - previos[clave] > MARGEN_REGRESION_MS
+            ):
+                regresiones.append(f"{ruta}: {clave} {previos[clave]} -> {datos[clave]}")
+        # Una consulta más por petición es una regresión aunque hoy vaya rápido
+        if (
+            datos["consultas_db"] is not None
+            and previos.get("consultas_db") is not None
+            and datos["consultas_db"] > previos["consultas_db"] + 0.01
+        ):
+            regresiones.append(
+                f"{ruta}: consultas_db {previos['consultas_db']} -> {datos['consultas_db']}"
+            )
+        if datos["errores"] > previos["errores"]:
+            regresiones.append(f"{ruta}: errores {previos['errores']} -> {datos['errores']}")
+    return regresiones
+
+
+def guardar_resultados(resultados, ruta=None):
+    if ruta is None:
+        fecha = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        ruta = os.path.join(
+            CARPETA_RESULTADOS, f"{fecha}-{resultados['commit'] or 'sin-commit'}.json"
+        )
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    return ruta
+
+
+# ============================================
+# PROGRAMA
+# ============================================
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de una partida completa")
+    parser.add_argument("--pin", required=True, help="PIN de una partida ya creada")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--en-proceso", action="store_true", help="Llamar a la app sin red")
+    parser.add_argument("--jugadores", type=int, default=1000)
+    parser.add_argument("--preguntas", type=int, default=3, help="Máximo de preguntas a jugar")
+    parser.add_argument("--concurrencia", type=int, default=200, help="Hilos del cliente")
+    parser.add_argument("--oleada", type=int, default=100, help="Jugadores que entran a la vez")
+    parser.add_argument("--pausa-oleada", type=float, default=1.0)
+    parser.add_argument("--duracion-pregunta", type=float, default=10.0)
+    parser.add_argument("--intervalo-sondeo", type=float, default=2.0)
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_REGRESION)
+    args = parser.parse_args()
+
+    if args.en_proceso:
+        os.environ.setdefault("KAHOOT_CONTAR_CONSULTAS", "1")
+        from app import app
+
+        def nuevo_cliente():
+            return ClienteEnProceso(app)
+
+        destino = "en proceso"
+    else:
+
+        def nuevo_cliente():
+            return ClienteHTTP(args.url)
+
+        destino = args.url
+
+    medidor = Medidor()
+    partida = PartidaSimulada(args, nuevo_cliente, medidor)
+    print(f"🚀 Partida {args.pin} ({destino}) con {args.jugadores} jugadores")
+    inicio = time.monotonic()
+    partida.jugar()
+    duracion = time.monotonic() - inicio
+
+    resultados = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "destino": destino,
+        "parametros": {
+            clave: valor
+            for clave, valor in vars(args).items()
+            if clave not in ("salida", "comparar", "url")
+        },
+        "preguntas_jugadas": partida.preguntas_jugadas,
+        "duracion_s": round(duracion, 2),
+        "retraso_cliente_p95_ms": round(
+            (percentil(sorted(partida.planificador.retrasos), 95) or 0) * 1000, 2
+        ),
+        "rutas": medidor.resumen(duracion),
+    }
+    imprimir_resultados(resultados)
+    print(f"💾 Resultados guardados en {guardar_resultados(resultados, args.salida)}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anteriores = json.load(f)
+        if anteriores.get("destino") != resultados["destino"]:
+            print(f"⚠️  La ejecución anterior fue contra {anteriores.get('destino')}")
+        regresiones = comparar(resultados, anteriores, args.tolerancia)
+        if regresiones:
+            print(f"❌ {len(regresiones)} regresiones respecto a {args.comparar}:")
+            for texto in regresiones:
+                print(f"   - {texto}")
+            sys.exit(1)
+        print(f"✅ Sin regresiones respecto a {args.comparar}")
+
+
+if __name__ == "__main__":
+    main()
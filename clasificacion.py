@@ -0,0 +1,115 @@
+# clasificacion.py - Tabla de clasificación en memoria de una partida
+# Se construye desde la DB una sola vez al cargar la partida y luego se mantiene
+# al día con cada jugador nuevo y cada punto sumado, así que el top 5 del host
+# y el podio de los jugadores no necesitan ningún ORDER BY en la base de datos.
+
+import bisect
+import threading
+
+
+class Clasificacion:
+    """
+    Jugadores de una partida ordenados por puntaje (desc) y, a igualdad, por id.
+
+    El orden se guarda como una lista ordenada de claves (-puntaje, id): cada
+    cambio de puntaje localiza su posición con búsqueda binaria (O(log n)) y sólo
+    desplaza la lista para insertar, que con los tamaños de una clase es más
+    rápido en Python que cualquier árbol balanceado.
+    """
+
+    def __init__(self, jugadores=()):
+        self._lock = threading.Lock()
+        self._jugadores = {}  # {jugador_id: {'id', 'nombre', 'puntaje'}}
+        self._orden = []  # [(-puntaje, jugador_id)] siempre ordenada
+        for jugador in jugadores:
+            self._jugadores[jugador["id"]] = self._ficha(jugador)
+        self._orden = sorted((-j["puntaje"], j["id"]) for j in self._jugadores.values())
+
+    @staticmethod
+    def _ficha(jugador):
+        return {
+            "id": jugador["id"],
+            "nombre": jugador["nombre"],
+            "puntaje": jugador.get("puntaje") or 0,
+        }
+
+    # --- ACTUALIZACIONES ---
+
+    def agregar_jugador(self, jugador):
+        with self._lock:
+            if jugador["id"] in self._jugadores:
+                return
+            ficha = self._ficha(jugador)
+            self._jugadores[ficha["id"]] = ficha
+            bisect.insort(self._orden, (-ficha["puntaje"], ficha["id"]))
+
+    def sumar_puntos(self, jugador_id, puntos):
+        """Suma puntos a un jugador y lo recoloca en la tabla."""
+        if not puntos:
+            return
+        with self._lock:
+            ficha = self._jugadores.get(jugador_id)
+            if ficha is None:
+                return
+            indice = bisect.bisect_left(self._orden, (-ficha["puntaje"], jugador_id))
+            del self._orden[indice]
+            ficha["puntaje"] += puntos
+            bisect.insort(self._orden, (-ficha["puntaje"], jugador_id))
+
+    def sumar_puntos_lote(self, puntos_por_jugador):
+        """
+        Suma los puntos de varios jugadores de una vez (pares jugador_id, puntos).
+        Devuelve [{'id', 'puntaje'}] con el nuevo total de cada jugador que cambió.
+        """
+        actualizados = {}
+        with self._lock:
+            for jugador_id, puntos in puntos_por_jugador:
+                ficha = self._jugadores.get(jugador_id)
+                if ficha is None or not puntos:
+                    continue
+                indice = bisect.bisect_left(self._orden, (-ficha["puntaje"], jugador_id))
+                del self._orden[indice]
+                ficha["puntaje"] += puntos
+                bisect.insort(self._orden, (-ficha["puntaje"], jugador_id))
+                actualizados[jugador_id] = ficha["puntaje"]
+        return [{"id": j, "puntaje": p} for j, p in actualizados.items()]
+
+    # --- CONSULTAS ---
+
+    def top(self, k):
+        """Los k primeros, como lista de {'id', 'nombre', 'puntaje'}."""
+        with self._lock:
+            return [dict(self._jugadores[j]) for _, j in self._orden[:k]]
+
+    def puntaje(self, jugador_id):
+        with self._lock:
+            ficha = self._jugadores.get(jugador_id)
+            return ficha["puntaje"] if ficha is not None else None
+
+    def todos(self):
+        return self.top(len(self._orden))
+
+    def posicion(self, jugador_id):
+        """Posición (1 = primero) del jugador, o 0 si no está en la partida."""
+        with self._lock:
+            ficha = self._jugadores.get(jugador_id)
+            if ficha is None:
+                return 0
+            return bisect.bisect_left(self._orden, (-ficha["puntaje"], jugador_id)) + 1
+
+    def vecinos(self, jugador_id, cuantos=2):
+        """El jugador con los 'cuantos' que tiene por delante y por detrás."""
+        with self._lock:
+            ficha = self._jugadores.get(jugador_id)
+            if ficha is None:
+                return []
+            indice = bisect.bisect_left(self._orden, (-ficha["puntaje"], jugador_id))
+            desde = max(0, indice - cuantos)
+            tramo = self._orden[desde : indice + cuantos + 1]
+            return [
+                dict(self._jugadores[j], posicion=desde + i + 1)
+                for i, (_, j) in enumerate(tramo)
+            ]
+
+    def __len__(self):
+        return len(self._orden)
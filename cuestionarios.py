@@ -0,0 +1,182 @@
+# cuestionarios.py - Caché de cuestionarios compilados
+# Un cuestionario (preguntas + opciones + clave de respuestas) se lee de la DB
+# con una sola consulta, se compila en un objeto inmutable y se guarda en una
+# caché LRU limitada por memoria. Todas las partidas que usan el mismo
+# cuestionario comparten ese objeto, y /jugar ya no consulta las opciones.
+# Cada entrada guarda la versión del cuestionario en la DB: si otro proceso lo
+# modifica, la versión sube y la copia local se vuelve a leer.
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+from database import (
+    marcar_cuestionario_modificado,
+    obtener_cuestionario_completo,
+    obtener_version_cuestionario,
+)
+from evaluadora import compilar_clave_respuestas
+
+# Memoria máxima (aproximada) que puede ocupar la caché
+MAX_BYTES_CACHE = int(os.environ.get("KAHOOT_CACHE_CUESTIONARIOS_MB", 64)) * 1024 * 1024
+
+# Columnas de la consulta que pertenecen a la opción, no a la pregunta
+COLUMNAS_OPCION = ("opcion_id", "opcion_texto", "opcion_es_correcta")
+
+
+class CuestionarioCompilado:
+    """
+    Cuestionario listo para jugar. No se modifica nunca: las preguntas y opciones
+    son mappings de sólo lectura y la clave usa frozensets.
+
+    - preguntas: tupla de preguntas en orden
+    - pregunta_por_id: {pregunta_id: pregunta}
+    - opciones_por_pregunta: {pregunta_id: tupla de opciones}
+    - opciones: tupla con todas las opciones del cuestionario
+    - clave_respuestas: {pregunta_id: {'validas': frozenset, 'correctas': frozenset}}
+    """
+
+    __slots__ = (
+        "kahoot_id",
+        "preguntas",
+        "pregunta_por_id",
+        "opciones_por_pregunta",
+        "opciones",
+        "clave_respuestas",
+        "tamano",
+    )
+
+    def __init__(self, kahoot_id, filas):
+        preguntas = []
+        opciones_por_pregunta = {}
+        tamano = 0
+
+        for fila in filas:
+            pregunta_id = fila["id"]
+            if pregunta_id not in opciones_por_pregunta:
+                pregunta = {k: v for k, v in fila.items() if k not in COLUMNAS_OPCION}
+                preguntas.append(MappingProxyType(pregunta))
+                opciones_por_pregunta[pregunta_id] = []
+                tamano += _tamano_aproximado(pregunta)
+            if fila["opcion_id"] is not None:
+                opcion = {
+                    "id": fila["opcion_id"],
+                    "pregunta_id": pregunta_id,
+                    "texto": fila["opcion_texto"],
+                    "es_correcta": fila["opcion_es_correcta"],
+                }
+                opciones_por_pregunta[pregunta_id].append(MappingProxyType(opcion))
+                tamano += _tamano_aproximado(opcion)
+
+        self.kahoot_id = kahoot_id
+        self.preguntas = tuple(preguntas)
+        self.pregunta_por_id = MappingProxyType({p["id"]: p for p in preguntas})
+        self.opciones_por_pregunta = MappingProxyType(
+            {pid: tuple(ops) for pid, ops in opciones_por_pregunta.items()}
+        )
+        self.opciones = tuple(
+            opcion for ops in self.opciones_por_pregunta.values() for opcion in ops
+        )
+        clave = compilar_clave_respuestas(self.preguntas, self.opciones)
+        self.clave_respuestas = MappingProxyType(
+            {
+                pid: MappingProxyType(
+                    {
+                        "validas": frozenset(entrada["validas"]),
+                        "correctas": frozenset(entrada["correctas"]),
+                    }
+                )
+                for pid, entrada in clave.items()
+            }
+        )
+        self.tamano = tamano
+
+
+def _tamano_aproximado(fila):
+    """Bytes aproximados de una fila (suficiente para limitar la caché)."""
+    return sys.getsizeof(fila) + sum(sys.getsizeof(v) for v in fila.values())
+
+
+class CacheCuestionarios:
+    """Caché LRU de CuestionarioCompilado por kahoot_id, limitada en bytes."""
+
+    def __init__(
+        self,
+        max_bytes=MAX_BYTES_CACHE,
+        cargar=obtener_cuestionario_completo,
+        leer_version=obtener_version_cuestionario,
+        marcar_modificado=marcar_cuestionario_modificado,
+    ):
+        self.max_bytes = max_bytes
+        self._cargar = cargar
+        self._leer_version = leer_version
+        self._marcar_modificado = marcar_modificado
+        self._entradas = OrderedDict()  # {kahoot_id: (version, CuestionarioCompilado)}
+        self._generaciones = {}  # {kahoot_id: invalidaciones en este proceso}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.estadisticas = {"aciertos": 0, "fallos": 0, "obsoletos": 0, "expulsados": 0}
+
+    def obtener(self, kahoot_id):
+        """
+        Devuelve el cuestionario compilado, leyéndolo de la DB si no está en
+        caché o si su versión en la DB ya no es la de la copia guardada.
+        """
+        kahoot_id = int(kahoot_id)
+        # Si la versión no se puede leer (DB caída) se sirve lo que haya en caché
+        version = self._leer_version(kahoot_id)
+        with self._lock:
+            entrada = self._entradas.get(kahoot_id)
+            if entrada is not None and version in (None, entrada[0]):
+                self._entradas.move_to_end(kahoot_id)
+                self.estadisticas["aciertos"] += 1
+                return entrada[1]
+            self.estadisticas["obsoletos" if entrada is not None else "fallos"] += 1
+            generacion = self._generaciones.get(kahoot_id, 0)
+
+        filas = self._cargar(kahoot_id)
+        if filas is None:
+            # Error de la DB: no guardamos un cuestionario vacío en caché
+            return CuestionarioCompilado(kahoot_id, [])
+        cuestionario = CuestionarioCompilado(kahoot_id, filas)
+
+        with self._lock:
+            if self._generaciones.get(kahoot_id, 0) != generacion:
+                # Se invalidó mientras se leía: esta copia puede ser anterior al
+                # cambio, así que se devuelve pero no se guarda
+                return cuestionario
+            anterior = self._entradas.pop(kahoot_id, None)
+            if anterior is not None:
+                self._bytes -= anterior[1].tamano
+            self._entradas[kahoot_id] = (version, cuestionario)
+            self._bytes += cuestionario.tamano
+            # Expulsar los menos usados; el recién cargado se queda siempre
+            while self._bytes > self.max_bytes and len(self._entradas) > 1:
+                _, (_, expulsado) = self._entradas.popitem(last=False)
+                self._bytes -= expulsado.tamano
+                self.estadisticas["expulsados"] += 1
+        return cuestionario
+
+    def invalidar(self, kahoot_id):
+        """
+        Olvida un cuestionario (al guardarlo o al asignarlo a una partida) y
+        sube su versión en la DB para que los demás procesos también lo olviden.
+        Se llama después de confirmar el cambio.
+        """
+        kahoot_id = int(kahoot_id)
+        with self._lock:
+            self._generaciones[kahoot_id] = self._generaciones.get(kahoot_id, 0) + 1
+            entrada = self._entradas.pop(kahoot_id, None)
+            if entrada is not None:
+                self._bytes -= entrada[1].tamano
+        self._marcar_modificado(kahoot_id)
+
+    def obtener_estadisticas(self):
+        with self._lock:
+            datos = dict(self.estadisticas)
+            datos["cuestionarios"] = len(self._entradas)
+            datos["bytes"] = self._bytes
+            datos["max_bytes"] = self.max_bytes
+        return datos
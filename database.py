@@ -3,11 +3,27 @@
 
 import mysql.connector
 from mysql.connector import Error
+from flask import g, has_app_context, has_request_context, request
+import collections
+import contextvars
+import functools
+import inspect
+import os
+import threading
 import time
 
+from metricas import registro_metricas
+from vigia_consultas import VigiaConsultas, contar_parametros, vigia_config
+
 # ============================================
 # CONFIGURACIÓN DE CONEXIÓN A MYSQL
 # ============================================
+
+# Motor de base de datos: "mysql" (servidor, por defecto) o "sqlite" (un archivo
+# local en modo WAL, ver database_sqlite.py). Las funciones de este módulo son
+# las mismas para los dos.
+MOTOR_DB = os.environ.get("KAHOOT_DB", "mysql")
+
 db_config = {
     "host": "localhost",
     "user": "root",
@@ -15,17 +31,441 @@ db_config = {
     "database": "kahoot_db",  # Debe coincidir con tu SQL dump
 }
 
+# Configuración del pool de conexiones (se puede ajustar con variables de entorno)
+pool_config = {
+    # Máximo de conexiones abiertas a la vez contra MySQL
+    "tamano": int(os.environ.get("KAHOOT_DB_POOL_TAMANO", 10)),
+    # Segundos que una petición espera por una conexión libre antes de rendirse
+    "espera_maxima": float(os.environ.get("KAHOOT_DB_POOL_ESPERA", 5)),
+    # Segundos de vida de una conexión antes de cerrarla y abrir otra nueva
+    "reciclar_despues": float(os.environ.get("KAHOOT_DB_POOL_RECICLAR", 1800)),
+    # Segundos de inactividad tras los cuales se hace ping antes de prestarla
+    "verificar_despues": float(os.environ.get("KAHOOT_DB_POOL_VERIFICAR", 30)),
+}
+
+# Con KAHOOT_CONTAR_CONSULTAS=1 se cuentan además las consultas de cada petición
+# (ver consultas_peticion y carga_partida.py)
+CONTAR_CONSULTAS = os.environ.get("KAHOOT_CONTAR_CONSULTAS") == "1"
+
+# ============================================
+# MÉTRICAS (ver metricas.py)
+# ============================================
+
+duracion_consultas = registro_metricas.histograma(
+    "kahoot_db_consulta_segundos",
+    "Duración de las consultas a la DB por función de database.py",
+    ("funcion",),
+)
+espera_conexion = registro_metricas.histograma(
+    "kahoot_db_espera_conexion_segundos",
+    "Tiempo hasta conseguir una conexión del pool (incluye abrirla si hace falta)",
+)
+registro_metricas.indicador(
+    "kahoot_db_pool_conexiones",
+    "Conexiones del pool abiertas y libres",
+    lambda: {
+        (estado,): obtener_pool().obtener_estadisticas()[estado]
+        for estado in ("abiertas", "libres")
+    },
+    ("estado",),
+)
+
+# Función de este módulo que está ejecutando consultas (ver _medir_funcion)
+_funcion_db = contextvars.ContextVar("funcion_db", default=None)
+
+# Consultas lentas y peticiones con demasiadas consultas (ver vigia_consultas.py)
+vigia_consultas = VigiaConsultas(**vigia_config)
+
+
+class PoolAgotadoError(Error):
+    """No se liberó ninguna conexión del pool dentro del tiempo de espera."""
+
+
+class ConexionPrestada:
+    """
+    Envoltorio de una conexión sacada del pool.
+    Se usa igual que una conexión normal, pero close() la devuelve al pool
+    en lugar de cerrar el socket.
+    """
+
+    def __init__(self, pool, conexion, creada_en):
+        self._pool = pool
+        self._conexion = conexion
+        self._creada_en = creada_en
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+    def cursor(self, *args, **kwargs):
+        return CursorMedido(self._conexion.cursor(*args, **kwargs))
+
+    def close(self):
+        if self._conexion is not None:
+            self._pool.devolver(self._conexion, self._creada_en)
+            self._conexion = None
+
+
+class CursorMedido:
+    """Cursor que anota la duración de cada consulta (y la cuenta en la petición)."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operacion, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.execute(operacion, *args, **kwargs)
+        finally:
+            parametros = args[0] if args else kwargs.get("params")
+            _anotar_consulta(
+                time.perf_counter() - inicio, operacion, contar_parametros(parametros)
+            )
+
+    def executemany(self, operacion, secuencia, *args, **kwargs):
+        # El conector lo manda como un solo INSERT de varias filas
+        secuencia = list(secuencia)
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.executemany(operacion, secuencia, *args, **kwargs)
+        finally:
+            _anotar_consulta(
+                time.perf_counter() - inicio,
+                operacion,
+                sum(contar_parametros(fila) for fila in secuencia),
+            )
+
+
+def _anotar_consulta(duracion, sql, parametros):
+    # Las consultas hechas fuera de las funciones de este módulo (rutas de app.py) van juntas
+    funcion = _funcion_db.get() or "otras"
+    duracion_consultas.observar(duracion, funcion)
+    ruta = None
+    if has_request_context():
+        ruta = request.endpoint or "sin_ruta"
+        if vigia_consultas.revisa_peticiones:
+            g.setdefault("_consultas_peticion", []).append((sql, funcion, duracion))
+    vigia_consultas.anotar(sql, parametros, duracion, funcion, ruta)
+    if CONTAR_CONSULTAS and has_app_context():
+        g._consultas_db = g.get("_consultas_db", 0) + 1
+
+
+def revisar_consultas_peticion(error=None):
+    """Anota la petición actual si hizo demasiadas consultas o repitió la misma muchas veces."""
+    consultas = g.pop("_consultas_peticion", None)
+    if consultas:
+        vigia_consultas.revisar_peticion(request.endpoint or "sin_ruta", consultas)
+
+
+def consultas_peticion():
+    """Consultas a la DB hechas en la petición actual (0 si no se cuentan)."""
+    return g.get("_consultas_db", 0)
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones con tamaño fijo, espera acotada al pedir una conexión,
+    verificación (ping) al prestarla y reciclado de conexiones viejas.
+    'conectar()' abre una conexión nueva del motor que corresponda.
+    """
+
+    def __init__(
+        self, conectar, tamano, espera_maxima, reciclar_despues, verificar_despues
+    ):
+        self.conectar = conectar
+        self.tamano = tamano
+        self.espera_maxima = espera_maxima
+        self.reciclar_despues = reciclar_despues
+        self.verificar_despues = verificar_despues
+
+        # Conexiones libres: (conexion, creada_en, devuelta_en)
+        self._libres = collections.deque()
+        self._abiertas = 0
+        self._condicion = threading.Condition()
+
+        self.estadisticas = {
+            "prestamos": 0,  # Conexiones entregadas
+            "esperas": 0,  # Préstamos que tuvieron que esperar a otra petición
+            "timeouts": 0,  # Préstamos que se rindieron por falta de conexiones
+            "creadas": 0,  # Conexiones nuevas abiertas contra MySQL
+            "recicladas": 0,  # Conexiones cerradas por superar su vida máxima
+            "descartadas": 0,  # Conexiones rotas detectadas al prestarlas
+        }
+
+    def obtener(self):
+        """Presta una conexión, esperando como máximo 'espera_maxima' segundos."""
+        inicio = time.perf_counter()
+        try:
+            return self._obtener(time.monotonic() + self.espera_maxima)
+        finally:
+            espera_conexion.observar(time.perf_counter() - inicio)
+
+    def _obtener(self, limite):
+        entrada = None
+        with self._condicion:
+            ha_esperado = False
+            while True:
+                if self._libres:
+                    entrada = self._libres.pop()
+                    break
+                if self._abiertas < self.tamano:
+                    # Reservamos el hueco; la conexión se abre fuera del lock
+                    self._abiertas += 1
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self.estadisticas["timeouts"] += 1
+                    raise PoolAgotadoError(
+                        msg=f"Pool agotado: {self.tamano} conexiones ocupadas"
+                    )
+                if not ha_esperado:
+                    self.estadisticas["esperas"] += 1
+                    ha_esperado = True
+                self._condicion.wait(restante)
+            self.estadisticas["prestamos"] += 1
+
+        if entrada is not None:
+            conexion = self._validar(*entrada)
+            if conexion is not None:
+                return ConexionPrestada(self, conexion, entrada[1])
+
+        try:
+            conexion = self.conectar()
+        except Exception:
+            self._liberar_hueco()
+            raise
+        with self._condicion:
+            self.estadisticas["creadas"] += 1
+        return ConexionPrestada(self, conexion, time.monotonic())
+
+    def _validar(self, conexion, creada_en, devuelta_en):
+        """Devuelve la conexión si sigue sana, o None si hubo que cerrarla."""
+        ahora = time.monotonic()
+        if ahora - creada_en > self.reciclar_despues:
+            motivo = "recicladas"
+        elif ahora - devuelta_en > self.verificar_despues:
+            try:
+                conexion.ping(reconnect=False)
+                return conexion
+            except Exception:
+                motivo = "descartadas"
+        else:
+            return conexion
+
+        self._cerrar_silenciosamente(conexion)
+        with self._condicion:
+            self.estadisticas[motivo] += 1
+            # El hueco sigue reservado para la conexión que se abrirá a continuación
+        return None
+
+    def devolver(self, conexion, creada_en):
+        """Devuelve una conexión al pool, deshaciendo cualquier transacción abierta."""
+        try:
+            # Sin esto, una lectura dejaría abierta una transacción REPEATABLE READ
+            # y el siguiente usuario de la conexión vería datos viejos.
+            if conexion.in_transaction:
+                conexion.rollback()
+        except Exception:
+            self._cerrar_silenciosamente(conexion)
+            with self._condicion:
+                self.estadisticas["descartadas"] += 1
+            self._liberar_hueco()
+            return
+
+        with self._condicion:
+            self._libres.append((conexion, creada_en, time.monotonic()))
+            self._condicion.notify()
+
+    def _liberar_hueco(self):
+        with self._condicion:
+            self._abiertas -= 1
+            self._condicion.notify()
+
+    @staticmethod
+    def _cerrar_silenciosamente(conexion):
+        try:
+            conexion.close()
+        except Exception:
+            pass
+
+    def obtener_estadisticas(self):
+        with self._condicion:
+            datos = dict(self.estadisticas)
+            datos["abiertas"] = self._abiertas
+            datos["libres"] = len(self._libres)
+            datos["tamano"] = self.tamano
+            datos["motor"] = MOTOR_DB
+        return datos
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool():
+    """Devuelve el pool global, creándolo la primera vez que se necesita."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones(conector_motor(), **pool_config)
+    return _pool
+
+
+def conector_motor(motor=None):
+    """Función que abre una conexión nueva del motor configurado (KAHOOT_DB)."""
+    motor = motor or MOTOR_DB
+    if motor == "sqlite":
+        import database_sqlite
+
+        return database_sqlite.conectar
+    if motor == "mysql":
+        return lambda: mysql.connector.connect(**db_config)
+    raise ValueError(f"Motor de base de datos desconocido: {motor}")
+
+
+class ConexionPeticion:
+    """
+    Unidad de trabajo de una petición HTTP: una sola conexión y una sola
+    transacción compartidas por todos los helpers de este módulo.
+
+    commit() sólo marca que hay cambios; la confirmación real la hace la vista
+    con confirmar_peticion() antes de contestar, para poder avisar al cliente si
+    falla. Lo que quede sin confirmar se confirma al terminar la petición (ver
+    finalizar_conexion_peticion). rollback() sí deshace en el momento y deja la
+    petición marcada como fallida.
+    """
+
+    def __init__(self, conexion):
+        self._conexion = conexion
+        self.cambios_pendientes = False
+        self.fallida = False
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+    def start_transaction(self, *args, **kwargs):
+        # La transacción ya la abre la propia petición
+        pass
+
+    def commit(self):
+        self.cambios_pendientes = True
+
+    def rollback(self):
+        self.fallida = True
+        self._conexion.rollback()
+
+    def close(self):
+        # Se devuelve al pool al terminar la petición, no antes
+        pass
+
+    def confirmar(self):
+        """Confirma ya los cambios pendientes. Devuelve False si no quedaron guardados."""
+        if self.fallida:
+            return False
+        if not self.cambios_pendientes:
+            return True
+        try:
+            self._conexion.commit()
+            self.cambios_pendientes = False
+            return True
+        except Error as e:
+            print(f"Error confirmando la transacción de la petición: {e}")
+            self.rollback()
+            return False
+
+    def finalizar(self, error=None):
+        """Confirma o deshace la transacción y devuelve la conexión al pool."""
+        try:
+            if error is not None or self.fallida:
+                self._conexion.rollback()
+            elif self.cambios_pendientes:
+                self._conexion.commit()
+        except Error as e:
+            print(f"Error cerrando la transacción de la petición: {e}")
+            try:
+                self._conexion.rollback()
+            except Error:
+                pass
+        finally:
+            self._conexion.close()
+
 
 def get_db_connection():
-    """Crea y devuelve una conexión a la base de datos."""
+    """
+    Devuelve una conexión a la base de datos.
+    Dentro de una petición de Flask siempre es la misma (ver ConexionPeticion);
+    fuera de ella (scripts, hilos) se presta una del pool y close() la devuelve.
+    """
+    if has_app_context():
+        conexion = g.get("_conexion_db")
+        if conexion is None:
+            prestada = _prestar_conexion()
+            if prestada is None:
+                return None
+            conexion = g._conexion_db = ConexionPeticion(prestada)
+        return conexion
+    return _prestar_conexion()
+
+
+def _prestar_conexion():
     connection = None
     try:
-        connection = mysql.connector.connect(**db_config)
+        connection = obtener_pool().obtener()
     except Error as e:
-        print(f"Error conectando a MySQL: {e}")
+        print(f"Error conectando a la base de datos: {e}")
     return connection
 
 
+def confirmar_peticion():
+    """
+    Confirma la transacción de la petición actual antes de contestar. Devuelve
+    False si no se pudo (o si algún helper ya la deshizo): la vista debe
+    responder con un error, porque los cambios no se guardaron.
+    """
+    conexion = g.get("_conexion_db") if has_app_context() else None
+    if conexion is None:
+        return True
+    return conexion.confirmar()
+
+
+def finalizar_conexion_peticion(error=None):
+    """Cierra la unidad de trabajo de la petición actual (si llegó a abrirse)."""
+    conexion = g.pop("_conexion_db", None)
+    if conexion is not None:
+        conexion.finalizar(error)
+
+
+def init_app(app):
+    """
+    Registra el cierre de la unidad de trabajo al terminar cada petición y
+    prepara la tabla de secuencias (fuera del camino de /unirse).
+    """
+    preparar_secuencias()
+    preparar_preguntas_liquidadas()
+    preparar_versiones_cuestionarios()
+    app.teardown_appcontext(finalizar_conexion_peticion)
+    app.teardown_request(revisar_consultas_peticion)
+    if CONTAR_CONSULTAS:
+        app.after_request(_cabecera_consultas)
+
+
+def _cabecera_consultas(respuesta):
+    # La lee carga_partida.py para saber cuántas consultas cuesta cada ruta
+    respuesta.headers["X-Consultas-DB"] = str(consultas_peticion())
+    return respuesta
+
+
+def obtener_estadisticas_pool():
+    """Contadores del pool: préstamos, esperas, timeouts, conexiones abiertas..."""
+    return obtener_pool().obtener_estadisticas()
+
+
 # ============================================
 # FUNCIONES DE ACCESO A DATOS
 # ============================================
@@ -48,34 +488,34 @@ def obtener_partida_por_pin(pin):
     return None
 
 
-def obtener_preguntas_por_kahoot(kahoot_id):
+def obtener_partida_por_id(partida_id):
     conn = get_db_connection()
     if conn:
         cursor = conn.cursor(dictionary=True)
         try:
-            # SQL DUMP: La columna se llama 'kahoot_id'
-            cursor.execute(
-                "SELECT * FROM preguntas WHERE kahoot_id = %s ORDER BY orden ASC",
-                (kahoot_id,),
-            )
-            return cursor.fetchall()
+            cursor.execute("SELECT * FROM partidas WHERE id = %s", (partida_id,))
+            return cursor.fetchone()
         except Error as e:
             print(f"Error: {e}")
         finally:
             cursor.close()
             conn.close()
-    return []
+    return None
 
 
-def obtener_opciones_pregunta(pregunta_id):
+def obtener_cuestionario_completo(kahoot_id):
+    """
+    Preguntas y opciones de un cuestionario en una sola consulta (LEFT JOIN).
+    Cada fila es una pregunta (p.*) con una de sus opciones en las columnas
+    opcion_id, opcion_texto y opcion_es_correcta (NULL si no tiene opciones).
+    """
     conn = get_db_connection()
     if conn:
         cursor = conn.cursor(dictionary=True)
         try:
-            # SQL DUMP: La columna se llama 'pregunta_id'
             cursor.execute(
-                "SELECT id, pregunta_id, texto as texto, es_correcta != 0 as es_correcta FROM opciones WHERE pregunta_id = %s",
-                (pregunta_id,),
+                "SELECT p.*, o.id AS opcion_id, o.texto AS opcion_texto, o.es_correcta != 0 AS opcion_es_correcta FROM preguntas p LEFT JOIN opciones o ON o.pregunta_id = p.id WHERE p.kahoot_id = %s ORDER BY p.orden ASC, p.id ASC, o.id ASC",
+                (kahoot_id,),
             )
             return cursor.fetchall()
         except Error as e:
@@ -83,34 +523,233 @@ def obtener_opciones_pregunta(pregunta_id):
         finally:
             cursor.close()
             conn.close()
-    return []
+    return None
 
 
 # --- JUGADORES Y RESPUESTAS ---
 
 
-def registrar_jugador(partida_id, nombre, session_id):
+# Siguiente id libre de las tablas cuyos ids se reservan por bloques
+SQL_TABLA_SECUENCIAS = """CREATE TABLE IF NOT EXISTS secuencias (
+    nombre VARCHAR(64) PRIMARY KEY,
+    siguiente BIGINT NOT NULL
+)"""
+
+# Primera fila de la secuencia, detrás del último jugador que exista. Con IGNORE
+# dos procesos que la siembran a la vez no chocan: el segundo no hace nada
+SQL_SEMBRAR_SECUENCIA_JUGADORES = (
+    "INSERT IGNORE INTO secuencias (nombre, siguiente) "
+    "SELECT 'jugadores_sesion', COALESCE(MAX(id), 0) + 1 FROM jugadores_sesion"
+)
+
+
+def preparar_secuencias():
+    """
+    Crea la tabla de secuencias y su fila de jugadores si faltan. Se llama al
+    arrancar: en MySQL un CREATE TABLE hace commit implícito y no debe ir en
+    cada reserva.
+    """
+    conn = _prestar_conexion()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_TABLA_SECUENCIAS)
+        cursor.execute(SQL_SEMBRAR_SECUENCIA_JUGADORES)
+        conn.commit()
+        return True
+    except Error as e:
+        print(f"Error preparando la tabla de secuencias: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+    return False
+
+
+# Preguntas cuyos puntos ya se repartieron, para que una partida que se recarga
+# a mitad (reinicio del proceso) sepa cuáles le quedan por liquidar
+SQL_TABLA_PREGUNTAS_LIQUIDADAS = """CREATE TABLE IF NOT EXISTS preguntas_liquidadas (
+    partida_id INT NOT NULL,
+    pregunta_id INT NOT NULL,
+    PRIMARY KEY (partida_id, pregunta_id)
+)"""
+
+
+def preparar_preguntas_liquidadas():
+    """Crea la tabla preguntas_liquidadas si falta (al arrancar, como las secuencias)."""
+    conn = _prestar_conexion()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_TABLA_PREGUNTAS_LIQUIDADAS)
+        conn.commit()
+        return True
+    except Error as e:
+        print(f"Error preparando la tabla de preguntas liquidadas: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+    return False
+
+
+# Versión de cada cuestionario: sube cada vez que se modifica, para que la
+# caché de cuestionarios de cada proceso sepa que su copia es vieja
+SQL_TABLA_VERSIONES_CUESTIONARIOS = """CREATE TABLE IF NOT EXISTS versiones_cuestionarios (
+    kahoot_id INT PRIMARY KEY,
+    version BIGINT NOT NULL
+)"""
+
+
+def preparar_versiones_cuestionarios():
+    """Crea la tabla versiones_cuestionarios si falta (al arrancar, como las secuencias)."""
+    conn = _prestar_conexion()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_TABLA_VERSIONES_CUESTIONARIOS)
+        conn.commit()
+        return True
+    except Error as e:
+        print(f"Error preparando la tabla de versiones de cuestionarios: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+    return False
+
+
+def obtener_version_cuestionario(kahoot_id):
+    """Versión actual del cuestionario (0 si nunca se modificó), o None si falla."""
     conn = get_db_connection()
     if conn:
-        cursor = conn.cursor(dictionary=True)
+        cursor = conn.cursor()
         try:
-            sql = "INSERT INTO jugadores_sesion (partida_id, nombre, session_id, puntaje) VALUES (%s, %s, %s, 0)"
-            cursor.execute(sql, (partida_id, nombre, session_id))
-            conn.commit()
-            jugador_id = cursor.lastrowid
             cursor.execute(
-                "SELECT * FROM jugadores_sesion WHERE id = %s", (jugador_id,)
+                "SELECT version FROM versiones_cuestionarios WHERE kahoot_id = %s",
+                (kahoot_id,),
             )
-            return cursor.fetchone()
+            fila = cursor.fetchone()
+            return fila[0] if fila else 0
         except Error as e:
             print(f"Error: {e}")
-            conn.rollback()
         finally:
             cursor.close()
             conn.close()
     return None
 
 
+def marcar_cuestionario_modificado(kahoot_id):
+    """
+    Sube la versión del cuestionario. Va en su propia transacción y se llama
+    después de confirmar el cambio: quien vea la versión nueva ya ve los datos
+    nuevos.
+    """
+    conn = _prestar_conexion()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute(
+            "INSERT IGNORE INTO versiones_cuestionarios (kahoot_id, version) VALUES (%s, 0)",
+            (kahoot_id,),
+        )
+        cursor.execute(
+            "UPDATE versiones_cuestionarios SET version = version + 1 WHERE kahoot_id = %s",
+            (kahoot_id,),
+        )
+        conn.commit()
+        return True
+    except Error as e:
+        print(f"Error marcando el cuestionario {kahoot_id} como modificado: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+    return False
+
+
+def reservar_ids_jugadores(cantidad):
+    """
+    Reserva 'cantidad' ids consecutivos de jugadores_sesion y devuelve el
+    primero (o None si falla). Va en su propia transacción, no en la de la
+    petición: un id ya repartido no se vuelve a dar aunque la petición falle,
+    y varios procesos pueden reservar a la vez sin pisarse.
+    """
+    conn = _prestar_conexion()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    sql_reservar = "UPDATE secuencias SET siguiente = siguiente + %s WHERE nombre = 'jugadores_sesion'"
+    try:
+        conn.start_transaction()
+        cursor.execute(sql_reservar, (cantidad,))
+        if cursor.rowcount == 0:
+            # Sin fila todavía (la DB no respondía al arrancar): se siembra y se repite
+            cursor.execute(SQL_SEMBRAR_SECUENCIA_JUGADORES)
+            cursor.execute(sql_reservar, (cantidad,))
+        cursor.execute(
+            "SELECT siguiente FROM secuencias WHERE nombre = 'jugadores_sesion'"
+        )
+        siguiente = cursor.fetchone()[0]
+        conn.commit()
+        return siguiente - cantidad
+    except Error as e:
+        print(f"Error reservando ids de jugadores: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+    return None
+
+
+def registrar_jugadores_lote(jugadores):
+    """
+    Guarda un lote de jugadores con sus ids ya reservados, en un solo INSERT
+    multi-fila. 'jugadores' es una lista de tuplas
+    (jugador_id, partida_id, nombre, session_id).
+
+    Retorna una lista de booleanos (uno por jugador). Si el lote falla entero
+    (p. ej. la partida de uno ya no existe), se reintenta jugador a jugador.
+    """
+    if not jugadores:
+        return []
+    conn = get_db_connection()
+    if not conn:
+        return [False] * len(jugadores)
+
+    cursor = conn.cursor()
+    try:
+        filas = ", ".join(["(%s, %s, %s, %s, 0)"] * len(jugadores))
+        valores = [valor for jugador in jugadores for valor in jugador]
+        cursor.execute(
+            "INSERT INTO jugadores_sesion (id, partida_id, nombre, session_id, puntaje) VALUES "
+            + filas,
+            valores,
+        )
+        conn.commit()
+        return [True] * len(jugadores)
+    except Error as e:
+        print(f"Error guardando lote de {len(jugadores)} jugadores: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if len(jugadores) == 1:
+        return [False]
+    return [registrar_jugadores_lote([jugador])[0] for jugador in jugadores]
+
+
 def obtener_jugadores_partida(partida_id):
     conn = get_db_connection()
     if conn:
@@ -163,13 +802,71 @@ def registrar_respuesta(jugador_id, pregunta_id, opcion_id, tiempo_respuesta):
     return False
 
 
-def obtener_respuestas_pregunta(pregunta_id, partida_id):
+def registrar_respuestas_lote(respuestas):
+    """
+    Guarda un lote de respuestas en una sola transacción: un INSERT multi-fila en
+    'respuestas' y un único UPDATE con los puntos sumados por jugador.
+    'respuestas' es una lista de tuplas
+    (jugador_id, pregunta_id, opcion_id, tiempo_respuesta, puntos_a_sumar).
+
+    Retorna una lista de booleanos (uno por respuesta). Si el lote falla entero
+    (p. ej. una fila duplicada), se reintenta fila a fila para no perder el resto.
+    """
+    if not respuestas:
+        return []
+    conn = get_db_connection()
+    if not conn:
+        return [False] * len(respuestas)
+
+    cursor = conn.cursor()
+    try:
+        filas = ", ".join(["(%s, %s, %s, %s)"] * len(respuestas))
+        valores = []
+        puntos_por_jugador = {}
+        for jugador_id, pregunta_id, opcion_id, tiempo, puntos in respuestas:
+            valores.extend((jugador_id, pregunta_id, opcion_id, tiempo))
+            if puntos > 0:
+                puntos_por_jugador[jugador_id] = (
+                    puntos_por_jugador.get(jugador_id, 0) + puntos
+                )
+        cursor.execute(
+            "INSERT INTO respuestas (jugador_id, pregunta_id, opcion_id, tiempo_respuesta) VALUES "
+            + filas,
+            valores,
+        )
+
+        if puntos_por_jugador:
+            casos = " ".join(["WHEN %s THEN %s"] * len(puntos_por_jugador))
+            ids = ", ".join(["%s"] * len(puntos_por_jugador))
+            valores = []
+            for jugador_id, puntos in puntos_por_jugador.items():
+                valores.extend((jugador_id, puntos))
+            valores.extend(puntos_por_jugador.keys())
+            cursor.execute(
+                f"UPDATE jugadores_sesion SET puntaje = puntaje + CASE id {casos} ELSE 0 END WHERE id IN ({ids})",
+                valores,
+            )
+
+        conn.commit()
+        return [True] * len(respuestas)
+    except Error as e:
+        print(f"Error guardando lote de {len(respuestas)} respuestas: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+
+    return [registrar_respuesta_y_puntaje(*r) for r in respuestas]
+
+
+def obtener_respuestas_partida(partida_id):
+    """Tuplas (jugador_id, pregunta_id, opcion_id, tiempo_respuesta) de todas las respuestas de la partida."""
     conn = get_db_connection()
     if conn:
-        cursor = conn.cursor(dictionary=True)
+        cursor = conn.cursor()
         try:
-            sql = """SELECT r.* FROM respuestas r JOIN jugadores_sesion js ON r.jugador_id = js.id WHERE r.pregunta_id = %s AND js.partida_id = %s"""
-            cursor.execute(sql, (pregunta_id, partida_id))
+            sql = """SELECT r.jugador_id, r.pregunta_id, r.opcion_id, r.tiempo_respuesta FROM respuestas r JOIN jugadores_sesion js ON r.jugador_id = js.id WHERE js.partida_id = %s"""
+            cursor.execute(sql, (partida_id,))
             return cursor.fetchall()
         except Error as e:
             print(f"Error: {e}")
@@ -179,24 +876,20 @@ def obtener_respuestas_pregunta(pregunta_id, partida_id):
     return []
 
 
-def actualizar_puntaje_jugador(jugador_id, nuevo_puntaje):
+def obtener_respuestas_pregunta(pregunta_id, partida_id):
     conn = get_db_connection()
     if conn:
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         try:
-            cursor.execute(
-                "UPDATE jugadores_sesion SET puntaje = %s WHERE id = %s",
-                (nuevo_puntaje, jugador_id),
-            )
-            conn.commit()
-            return True
+            sql = """SELECT r.* FROM respuestas r JOIN jugadores_sesion js ON r.jugador_id = js.id WHERE r.pregunta_id = %s AND js.partida_id = %s"""
+            cursor.execute(sql, (pregunta_id, partida_id))
+            return cursor.fetchall()
         except Error as e:
             print(f"Error: {e}")
-            conn.rollback()
         finally:
             cursor.close()
             conn.close()
-    return False
+    return []
 
 
 def obtener_ranking(partida_id):
@@ -217,24 +910,6 @@ def obtener_ranking(partida_id):
     return []
 
 
-def jugador_ya_respondio(jugador_id, pregunta_id):
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute(
-                "SELECT COUNT(*) FROM respuestas WHERE jugador_id = %s AND pregunta_id = %s",
-                (jugador_id, pregunta_id),
-            )
-            return cursor.fetchone()[0] > 0
-        except Error as e:
-            print(f"Error: {e}")
-        finally:
-            cursor.close()
-            conn.close()
-    return False
-
-
 def actualizar_estado_partida(partida_id, nuevo_estado):
     conn = get_db_connection()
     if conn:
@@ -261,12 +936,15 @@ def reiniciar_partida_db(partida_id):
         cursor = conn.cursor()
         try:
             cursor.execute(
-                "DELETE r FROM respuestas r INNER JOIN jugadores_sesion js ON r.jugador_id = js.id WHERE js.partida_id = %s",
+                "DELETE FROM respuestas WHERE jugador_id IN (SELECT id FROM jugadores_sesion WHERE partida_id = %s)",
                 (partida_id,),
             )
             cursor.execute(
                 "DELETE FROM jugadores_sesion WHERE partida_id = %s", (partida_id,)
             )
+            cursor.execute(
+                "DELETE FROM preguntas_liquidadas WHERE partida_id = %s", (partida_id,)
+            )
             cursor.execute(
                 "UPDATE partidas SET estado = 'esperando' WHERE id = %s", (partida_id,)
             )
@@ -305,6 +983,11 @@ def obtener_usuario_por_username(username_or_email):
 # ============================================
 # FUNCIÓN DE GUARDADO (ADAPTADA AL SQL DUMP)
 # ============================================
+
+# Máximo de filas por INSERT multi-fila (acota el tamaño de cada sentencia)
+FILAS_POR_INSERT = 500
+
+
 def guardar_cuestionario_completo(usuario_nombre, datos_json):
     """
     Guarda en 'kahoots' y 'preguntas' según la estructura del SQL dump.
@@ -328,37 +1011,8 @@ def guardar_cuestionario_completo(usuario_nombre, datos_json):
         )
         kahoot_id = cursor.lastrowid  # Obtenemos el ID del nuevo kahoot
 
-        # 2. Insertar Preguntas
-        preguntas_lista = datos_json.get("preguntas", [])
-        for i, p_data in enumerate(preguntas_lista):
-            orden = i + 1
-            # SQL DUMP: la columna de enlace es 'kahoot_id'
-            cursor.execute(
-                "INSERT INTO preguntas (kahoot_id, texto, tipo, tiempo_limite, imagen_url, orden) VALUES (%s, %s, %s, %s, %s, %s)",
-                (
-                    kahoot_id,
-                    p_data["pregunta"],
-                    p_data["tipo_pregunta"],
-                    20,
-                    p_data.get("imagen"),
-                    orden,
-                ),
-            )
-            pregunta_id = cursor.lastrowid
-
-            # 3. Insertar Opciones
-            if (
-                p_data["tipo_pregunta"] != "abierta"
-            ):  # Asumiendo que 'abierta' no tiene opciones
-                opciones = p_data.get("opciones", [])
-                correctas = p_data.get("correctas", [])
-                for j, texto_op in enumerate(opciones):
-                    es_correcta = (j + 1) in correctas
-                    # SQL DUMP: la columna de enlace es 'pregunta_id', texto es 'texto'
-                    cursor.execute(
-                        "INSERT INTO opciones (pregunta_id, texto, es_correcta) VALUES (%s, %s, %s)",
-                        (pregunta_id, texto_op, es_correcta),
-                    )
+        # 2. Insertar Preguntas y 3. Opciones, con INSERTs multi-fila
+        _insertar_preguntas(cursor, kahoot_id, datos_json.get("preguntas", []), 1)
 
         conn.commit()
         return True, kahoot_id
@@ -372,23 +1026,198 @@ def guardar_cuestionario_completo(usuario_nombre, datos_json):
         conn.close()
 
 
-def actualizar_puntajes_totales(jugadores_actualizados):
+def importar_cuestionario_por_bloques(usuario_nombre, titulo, bloques):
+    """
+    Crea un cuestionario a partir de un iterable de bloques (listas de preguntas
+    con el mismo formato que guardar_cuestionario_completo). Los bloques se
+    consumen de uno en uno dentro de una sola transacción, así que el banco de
+    preguntas nunca está entero en memoria.
+
+    Retorna (True, kahoot_id, importadas) o (False, mensaje, 0).
+    """
     conn = get_db_connection()
     if not conn:
-        return jugadores_actualizados
+        return False, "Error de conexión", 0
+
     cursor = conn.cursor()
     try:
-        sql = "UPDATE jugadores_sesion SET puntaje = %s WHERE id = %s"
-        datos = [(j["puntaje"], j["id"]) for j in jugadores_actualizados]
-        cursor.executemany(sql, datos)
+        conn.start_transaction()
+        cursor.execute(
+            "INSERT INTO kahoots (titulo, creado_por) VALUES (%s, %s)",
+            (titulo, usuario_nombre),
+        )
+        kahoot_id = cursor.lastrowid
+
+        importadas = 0
+        for bloque in bloques:
+            _insertar_preguntas(cursor, kahoot_id, bloque, importadas + 1)
+            importadas += len(bloque)
+
+        if not importadas:
+            conn.rollback()
+            return False, "No hay ninguna pregunta válida para importar", 0
         conn.commit()
+        return True, kahoot_id, importadas
+
     except Exception as e:
-        print(f"Error: {e}")
         conn.rollback()
+        print(f"Error SQL al importar: {e}")
+        return False, str(e), 0
     finally:
         cursor.close()
         conn.close()
-    return jugadores_actualizados
+
+
+def _insertar_preguntas(cursor, kahoot_id, preguntas_lista, orden_inicial):
+    """
+    Inserta preguntas y opciones de un cuestionario con INSERTs multi-fila.
+    Los ids de las preguntas se leen después por (kahoot_id, orden): con
+    innodb_autoinc_lock_mode=2 un INSERT multi-fila no garantiza ids seguidos.
+    """
+    if not preguntas_lista:
+        return
+    orden_final = orden_inicial + len(preguntas_lista) - 1
+
+    for desde in range(0, len(preguntas_lista), FILAS_POR_INSERT):
+        tramo = preguntas_lista[desde : desde + FILAS_POR_INSERT]
+        valores = []
+        for i, p_data in enumerate(tramo, start=orden_inicial + desde):
+            valores.extend(
+                (
+                    kahoot_id,
+                    p_data["pregunta"],
+                    p_data["tipo_pregunta"],
+                    p_data.get("tiempo_limite") or 20,
+                    p_data.get("imagen"),
+                    i,
+                )
+            )
+        filas = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(tramo))
+        cursor.execute(
+            "INSERT INTO preguntas (kahoot_id, texto, tipo, tiempo_limite, imagen_url, orden) VALUES "
+            + filas,
+            valores,
+        )
+
+    cursor.execute(
+        "SELECT orden, id FROM preguntas WHERE kahoot_id = %s AND orden BETWEEN %s AND %s",
+        (kahoot_id, orden_inicial, orden_final),
+    )
+    id_por_orden = dict(cursor.fetchall())
+
+    # Opciones de todas las preguntas ('correctas' son posiciones desde 1)
+    opciones = []
+    for i, p_data in enumerate(preguntas_lista, start=orden_inicial):
+        correctas = p_data.get("correctas") or []
+        for j, texto_op in enumerate(p_data.get("opciones") or []):
+            opciones.append((id_por_orden[i], texto_op, (j + 1) in correctas))
+
+    for desde in range(0, len(opciones), FILAS_POR_INSERT):
+        tramo = opciones[desde : desde + FILAS_POR_INSERT]
+        filas = ", ".join(["(%s, %s, %s)"] * len(tramo))
+        cursor.execute(
+            "INSERT INTO opciones (pregunta_id, texto, es_correcta) VALUES " + filas,
+            [valor for opcion in tramo for valor in opcion],
+        )
+
+
+def guardar_liquidacion(partida_id, pregunta_id, jugadores_actualizados):
+    """
+    Guarda la liquidación de una pregunta en una sola transacción: la marca en
+    preguntas_liquidadas y el puntaje total de sus jugadores con un único UPDATE.
+    Retorna True si se guardó.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return False
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute(
+            "INSERT IGNORE INTO preguntas_liquidadas (partida_id, pregunta_id) VALUES (%s, %s)",
+            (partida_id, pregunta_id),
+        )
+        if jugadores_actualizados:
+            casos = " ".join(["WHEN %s THEN %s"] * len(jugadores_actualizados))
+            ids = ", ".join(["%s"] * len(jugadores_actualizados))
+            datos = []
+            for j in jugadores_actualizados:
+                datos.extend((j["id"], j["puntaje"]))
+            datos.extend(j["id"] for j in jugadores_actualizados)
+            cursor.execute(
+                f"UPDATE jugadores_sesion SET puntaje = CASE id {casos} END WHERE id IN ({ids})",
+                datos,
+            )
+        conn.commit()
+        return True
+    except Error as e:
+        print(f"Error guardando la liquidación de la pregunta {pregunta_id}: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+    return False
+
+
+def obtener_preguntas_liquidadas(partida_id):
+    """Conjunto de pregunta_id de la partida cuyos puntos ya se repartieron."""
+    conn = get_db_connection()
+    if conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT pregunta_id FROM preguntas_liquidadas WHERE partida_id = %s",
+                (partida_id,),
+            )
+            return {fila[0] for fila in cursor.fetchall()}
+        except Error as e:
+            print(f"Error: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+    return set()
+
+
+def obtener_preguntas_con_imagen_embebida(desde_id=0, limite=20):
+    """
+    Preguntas cuya imagen_url todavía es un data: URL (base64), en orden de id.
+    Se recorren por tramos a partir de 'desde_id' para migrarlas poco a poco.
+    """
+    conn = get_db_connection()
+    if conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(
+                "SELECT id, kahoot_id, imagen_url FROM preguntas WHERE id > %s AND imagen_url LIKE %s ORDER BY id ASC LIMIT %s",
+                (desde_id, "data:%", limite),
+            )
+            return cursor.fetchall()
+        except Error as e:
+            print(f"Error al buscar imágenes embebidas: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+    return []
+
+
+def actualizar_imagen_pregunta(pregunta_id, imagen_url):
+    conn = get_db_connection()
+    if conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE preguntas SET imagen_url = %s WHERE id = %s",
+                (imagen_url, pregunta_id),
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            print(f"Error al actualizar imagen de la pregunta: {e}")
+            conn.rollback()
+        finally:
+            cursor.close()
+            conn.close()
+    return False
 
 
 # ============================================
@@ -414,6 +1243,27 @@ def obtener_todos_kahoots():
     return []
 
 
+def crear_partida(pin, kahoot_id):
+    """Crea una partida 'esperando' con ese PIN y cuestionario. Devuelve su id o None."""
+    conn = get_db_connection()
+    if conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO partidas (pin, kahoot_id, estado) VALUES (%s, %s, 'esperando')",
+                (pin, kahoot_id),
+            )
+            conn.commit()
+            return cursor.lastrowid
+        except Error as e:
+            print(f"Error al crear la partida: {e}")
+            conn.rollback()
+        finally:
+            cursor.close()
+            conn.close()
+    return None
+
+
 def actualizar_kahoot_partida(partida_id, nuevo_kahoot_id):
     """
     Actualiza una partida para que use un cuestionario (kahoot_id) diferente.
@@ -432,7 +1282,7 @@ def actualizar_kahoot_partida(partida_id, nuevo_kahoot_id):
             # 2. Por seguridad, limpiamos jugadores y respuestas anteriores si se cambia el cuestionario
             #    (Reutilizamos la lógica de reinicio que ya tenías, pero sin la parte de UPDATE partida)
             cursor.execute(
-                "DELETE r FROM respuestas r INNER JOIN jugadores_sesion js ON r.jugador_id = js.id WHERE js.partida_id = %s",
+                "DELETE FROM respuestas WHERE jugador_id IN (SELECT id FROM jugadores_sesion WHERE partida_id = %s)",
                 (partida_id,),
             )
             cursor.execute(
@@ -455,27 +1305,6 @@ def actualizar_kahoot_partida(partida_id, nuevo_kahoot_id):
 # ============================================
 
 
-def verificar_si_es_correcta(opcion_id):
-    """Verifica en la BD si una opción ID específica es la respuesta correcta."""
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        try:
-            # MySQL devuelve 1 para true, 0 para false
-            sql = "SELECT es_correcta FROM opciones WHERE id = %s"
-            cursor.execute(sql, (opcion_id,))
-            resultado = cursor.fetchone()
-            if resultado:
-                # Devolvemos True si es 1, False si es 0
-                return resultado[0] == 1
-        except Error as e:
-            print(f"Error verificando opción: {e}")
-        finally:
-            cursor.close()
-            conn.close()
-    return False
-
-
 def registrar_respuesta_y_puntaje(
     jugador_id, pregunta_id, opcion_id, tiempo, puntos_a_sumar
 ):
@@ -505,3 +1334,46 @@ def registrar_respuesta_y_puntaje(
             cursor.close()
             conn.close()
     return False
+
+
+# ============================================
+# MÉTRICAS POR FUNCIÓN
+# ============================================
+
+# Funciones de infraestructura que no son de acceso a datos
+_SIN_MEDIR = {
+    "obtener_pool",
+    "conector_motor",
+    "get_db_connection",
+    "finalizar_conexion_peticion",
+    "init_app",
+    "obtener_estadisticas_pool",
+    "consultas_peticion",
+    "revisar_consultas_peticion",
+}
+
+
+def _medir_funcion(funcion):
+    """Hace que las consultas de 'funcion' se anoten con su nombre (ver _anotar_consulta)."""
+
+    @functools.wraps(funcion)
+    def medida(*args, **kwargs):
+        marca = _funcion_db.set(funcion.__name__)
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _funcion_db.reset(marca)
+
+    return medida
+
+
+# Se envuelven aquí, al final, para que las que se importan desde app.py
+# (y las que se llaman entre sí) ya sean las medidas
+for _nombre, _funcion in list(globals().items()):
+    if (
+        inspect.isfunction(_funcion)
+        and _funcion.__module__ == __name__
+        and not _nombre.startswith("_")
+        and _nombre not in _SIN_MEDIR
+    ):
+        globals()[_nombre] = _medir_funcion(_funcion)
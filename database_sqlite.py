@@ -0,0 +1,228 @@
+# database_sqlite.py - Motor SQLite (modo WAL) para database.py
+# Con KAHOOT_DB=sqlite las funciones de database.py trabajan sobre un archivo
+# SQLite local en vez de contra un servidor MySQL: para instalaciones pequeñas
+# en una sola máquina (sin viajes por la red a la DB) y para correr pruebas y
+# benchmarks sin MySQL.
+#
+# Las conexiones imitan la parte de mysql.connector que usa database.py
+# (cursor(dictionary=True), parámetros %s, lastrowid, start_transaction,
+# in_transaction, ping...), así que el SQL y el pool son los mismos para los
+# dos motores. Los errores de SQLite se convierten en ErrorSQLite, subclase del
+# Error de mysql.connector, para que los 'except Error' de siempre los atrapen.
+
+import os
+import sqlite3
+import threading
+
+from mysql.connector import Error
+
+RUTA_DB = os.environ.get("KAHOOT_DB_RUTA", "kahoot_db.sqlite3")
+
+# Milisegundos que una conexión espera si otra tiene la base de datos bloqueada
+ESPERA_BLOQUEO_MS = 5000
+
+# Las mismas tablas que usa database.py en MySQL
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS kahoots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    titulo TEXT NOT NULL,
+    creado_por TEXT,
+    fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS preguntas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kahoot_id INTEGER NOT NULL REFERENCES kahoots(id) ON DELETE CASCADE,
+    texto TEXT NOT NULL,
+    tipo TEXT,
+    tiempo_limite INTEGER DEFAULT 20,
+    imagen_url TEXT,
+    orden INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_preguntas_kahoot ON preguntas (kahoot_id, orden);
+CREATE TABLE IF NOT EXISTS opciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pregunta_id INTEGER NOT NULL REFERENCES preguntas(id) ON DELETE CASCADE,
+    texto TEXT NOT NULL,
+    es_correcta INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_opciones_pregunta ON opciones (pregunta_id);
+CREATE TABLE IF NOT EXISTS partidas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pin TEXT NOT NULL UNIQUE,
+    kahoot_id INTEGER REFERENCES kahoots(id),
+    estado TEXT DEFAULT 'esperando',
+    fecha_inicio TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS jugadores_sesion (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    partida_id INTEGER NOT NULL REFERENCES partidas(id) ON DELETE CASCADE,
+    nombre TEXT NOT NULL,
+    session_id TEXT,
+    puntaje INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jugadores_partida ON jugadores_sesion (partida_id);
+CREATE INDEX IF NOT EXISTS idx_jugadores_session ON jugadores_sesion (session_id);
+CREATE TABLE IF NOT EXISTS respuestas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    jugador_id INTEGER NOT NULL REFERENCES jugadores_sesion(id) ON DELETE CASCADE,
+    pregunta_id INTEGER NOT NULL,
+    opcion_id INTEGER,
+    tiempo_respuesta REAL,
+    UNIQUE (jugador_id, pregunta_id)
+);
+CREATE TABLE IF NOT EXISTS preguntas_liquidadas (
+    partida_id INTEGER NOT NULL,
+    pregunta_id INTEGER NOT NULL,
+    PRIMARY KEY (partida_id, pregunta_id)
+);
+CREATE TABLE IF NOT EXISTS versiones_cuestionarios (
+    kahoot_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS secuencias (
+    nombre TEXT PRIMARY KEY,
+    siguiente INTEGER NOT NULL
+);
+"""
+
+_esquemas_creados = set()
+_lock_esquema = threading.Lock()
+
+
+class ErrorSQLite(Error):
+    """Error de SQLite con la forma del de mysql.connector."""
+
+
+def _traducir_sql(sql):
+    # mysql.connector usa %s como marcador; sqlite3, ?
+    return sql.replace("%s", "?").replace("INSERT IGNORE", "INSERT OR IGNORE")
+
+
+def _fila_a_dict(cursor, fila):
+    return {columna[0]: valor for columna, valor in zip(cursor.description, fila)}
+
+
+class CursorSQLite:
+    """Cursor con la interfaz de un cursor de mysql.connector."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, parametros=()):
+        try:
+            self._cursor.execute(_traducir_sql(sql), parametros or ())
+        except sqlite3.Error as e:
+            raise ErrorSQLite(msg=str(e)) from e
+        return self
+
+    def executemany(self, sql, secuencia):
+        try:
+            self._cursor.executemany(_traducir_sql(sql), secuencia)
+        except sqlite3.Error as e:
+            raise ErrorSQLite(msg=str(e)) from e
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionSQLite:
+    """
+    Conexión a SQLite con la interfaz de una de mysql.connector.
+    Igual que en MySQL (autocommit desactivado), la primera escritura abre una
+    transacción que dura hasta commit() o rollback().
+    """
+
+    def __init__(self, ruta):
+        # El pool presta la conexión a distintos hilos (a uno cada vez)
+        self._conexion = sqlite3.connect(
+            ruta, timeout=ESPERA_BLOQUEO_MS / 1000, check_same_thread=False
+        )
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute("PRAGMA foreign_keys=ON")
+        self._conexion.execute(f"PRAGMA busy_timeout={ESPERA_BLOQUEO_MS}")
+
+    def cursor(self, dictionary=False, **kwargs):
+        cursor = self._conexion.cursor()
+        if dictionary:
+            cursor.row_factory = _fila_a_dict
+        return CursorSQLite(cursor)
+
+    @property
+    def in_transaction(self):
+        return self._conexion.in_transaction
+
+    def start_transaction(self):
+        # IMMEDIATE toma el bloqueo de escritura al empezar: una transacción que
+        # lee y luego escribe no puede fallar a medias por otra escritura en WAL
+        if not self._conexion.in_transaction:
+            self._ejecutar_control("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self._ejecutar_control(self._conexion.commit)
+
+    def rollback(self):
+        self._ejecutar_control(self._conexion.rollback)
+
+    def ping(self, reconnect=False):
+        self._ejecutar_control("SELECT 1")
+
+    def close(self):
+        self._conexion.close()
+
+    def _ejecutar_control(self, orden):
+        try:
+            if callable(orden):
+                orden()
+            else:
+                self._conexion.execute(orden)
+        except sqlite3.Error as e:
+            raise ErrorSQLite(msg=str(e)) from e
+
+
+def crear_esquema(ruta=RUTA_DB):
+    """Crea las tablas que falten (una vez por archivo y proceso)."""
+    with _lock_esquema:
+        if ruta in _esquemas_creados:
+            return
+        conexion = sqlite3.connect(ruta, timeout=ESPERA_BLOQUEO_MS / 1000)
+        try:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.executescript(ESQUEMA)
+        finally:
+            conexion.close()
+        _esquemas_creados.add(ruta)
+
+
+def conectar(ruta=RUTA_DB):
+    """Abre una conexión al archivo (creando las tablas la primera vez)."""
+    try:
+        crear_esquema(ruta)
+        return ConexionSQLite(ruta)
+    except sqlite3.Error as e:
+        raise ErrorSQLite(msg=f"No se pudo abrir {ruta}: {e}") from e
@@ -0,0 +1,296 @@
+# enrutador.py - Modo "cada partida en un solo worker"
+# Alternativa a compartir el estado (registro_compartido.py): se arrancan N
+# procesos worker con el estado en memoria de siempre y delante un enrutador
+# que manda todas las peticiones de una partida al mismo worker, elegido por
+# el hash del PIN. Así el estado, la clasificación y los buffers de respuestas
+# de cada partida están enteros en la memoria de un solo proceso y las rutas
+# calientes no necesitan consultar a nadie más; las partidas se reparten entre
+# los núcleos.
+#
+# El PIN sale de la URL (/host/<pin>/...), del formulario de /unirse o, para las
+# rutas de los jugadores, de su sesión (app.py guarda session["pin"] al unirse).
+# Lo que no tiene PIN (login, editor, estáticos...) va a cualquier worker.
+#
+# Uso:  python enrutador.py --workers 4 --puerto 5000
+
+import argparse
+import http.client
+import itertools
+import os
+import subprocess
+import sys
+import time
+import zlib
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.serving import run_simple
+
+# La misma clave que app.py, para poder leer la cookie de sesión
+SECRET_KEY = os.environ.get("KAHOOT_SECRET_KEY", "kahoot_secreto_2024")
+
+# Rutas de jugador cuyo PIN se saca de la sesión
+RUTAS_JUGADOR = (
+    "/lobby",
+    "/jugar",
+    "/responder",
+    "/podio",
+    "/api/estado-juego",
+    "/api/eventos",
+)
+
+# Rutas que sólo se sirven a clientes de la propia máquina
+RUTAS_LOCALES = ("/api/metricas", "/metrics")
+
+# Cabeceras que no se reenvían (son de cada conexión, no del mensaje)
+CABECERAS_SALTO = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Tamaño máximo del formulario de /unirse que el enrutador lee para sacar el PIN
+MAX_BYTES_FORMULARIO = 64 * 1024
+
+# Segundos de espera a un worker (las conexiones SSE pueden durar mucho más:
+# el worker manda un latido cada pocos segundos)
+ESPERA_WORKER = 60
+
+
+def worker_de_pin(pin, total_workers):
+    """Índice del worker dueño de un PIN (estable: sólo depende del PIN)."""
+    return zlib.crc32(str(pin).encode("utf-8")) % total_workers
+
+
+class Enrutador:
+    """Aplicación WSGI que reenvía cada petición al worker dueño de su PIN."""
+
+    def __init__(self, puertos, host_workers="127.0.0.1"):
+        self.puertos = list(puertos)
+        self.host_workers = host_workers
+        self._turno = itertools.count()
+        app_sesion = Flask("enrutador")
+        app_sesion.secret_key = SECRET_KEY
+        self._sesiones = SecureCookieSessionInterface().get_signing_serializer(
+            app_sesion
+        )
+        self._nombre_cookie = app_sesion.config["SESSION_COOKIE_NAME"]
+
+    # --- ELECCIÓN DEL WORKER ---
+
+    def pin_de_peticion(self, environ, cuerpo):
+        ruta = environ.get("PATH_INFO", "")
+        if ruta.startswith("/host/"):
+            return ruta.split("/")[2] or None
+        if ruta == "/unirse" and cuerpo:
+            valores = parse_qs(cuerpo.decode("utf-8", "replace")).get("pin")
+            return valores[0].strip().replace(" ", "") if valores else None
+        if ruta in RUTAS_JUGADOR:
+            return self.pin_de_sesion(environ)
+        return None
+
+    def pin_de_sesion(self, environ):
+        cookies = SimpleCookie()
+        try:
+            cookies.load(environ.get("HTTP_COOKIE", ""))
+        except Exception:
+            return None
+        galleta = cookies.get(self._nombre_cookie)
+        if galleta is None:
+            return None
+        try:
+            return self._sesiones.loads(galleta.value).get("pin")
+        except Exception:
+            # Firma inválida o cookie de otra clave: que la trate cualquier worker
+            return None
+
+    def elegir_puerto(self, pin):
+        if pin:
+            return self.puertos[worker_de_pin(pin, len(self.puertos))]
+        return self.puertos[next(self._turno) % len(self.puertos)]
+
+    # --- REENVÍO ---
+
+    def __call__(self, environ, start_response):
+        ruta = environ.get("PATH_INFO", "")
+        local = environ.get("REMOTE_ADDR") in ("127.0.0.1", "::1")
+        if ruta in RUTAS_LOCALES and not local:
+            # Detrás del enrutador todos los workers ven 127.0.0.1: filtramos aquí
+            start_response("403 FORBIDDEN", [("Content-Type", "text/plain")])
+            return [b"No autorizado"]
+
+        cuerpo = self._leer_cuerpo(environ)
+        if cuerpo is None:
+            start_response(
+                "413 REQUEST ENTITY TOO LARGE", [("Content-Type", "text/plain")]
+            )
+            return [b"Formulario demasiado grande"]
+        puerto = self.elegir_puerto(self.pin_de_peticion(environ, cuerpo))
+
+        destino = ruta
+        if environ.get("QUERY_STRING"):
+            destino += "?" + environ["QUERY_STRING"]
+        cabeceras = self._cabeceras_peticion(environ)
+
+        conexion = http.client.HTTPConnection(
+            self.host_workers, puerto, timeout=ESPERA_WORKER
+        )
+        try:
+            if cuerpo is False:
+                # Cuerpo sin leer: se pasa tal cual, por trozos
+                conexion.putrequest(
+                    environ["REQUEST_METHOD"],
+                    destino,
+                    skip_host="HTTP_HOST" in environ,
+                    skip_accept_encoding=True,
+                )
+                for nombre, valor in cabeceras:
+                    conexion.putheader(nombre, valor)
+                conexion.endheaders()
+                self._copiar_cuerpo(environ, conexion)
+            else:
+                conexion.request(
+                    environ["REQUEST_METHOD"], destino, body=cuerpo, headers=dict(cabeceras)
+                )
+            respuesta = conexion.getresponse()
+        except OSError as e:
+            conexion.close()
+            start_response("502 BAD GATEWAY", [("Content-Type", "text/plain")])
+            return [f"Worker no disponible ({puerto}): {e}".encode("utf-8")]
+
+        start_response(
+            f"{respuesta.status} {respuesta.reason}",
+            [
+                (nombre, valor)
+                for nombre, valor in respuesta.getheaders()
+                if nombre.lower() not in CABECERAS_SALTO
+            ],
+        )
+        return self._transmitir(respuesta, conexion)
+
+    def _leer_cuerpo(self, environ):
+        """
+        Lee el cuerpo sólo si hace falta para elegir worker (/unirse).
+        Devuelve los bytes, None si es demasiado grande, o False si no se leyó.
+        """
+        if environ.get("PATH_INFO") != "/unirse":
+            return False
+        try:
+            largo = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            largo = 0
+        if largo > MAX_BYTES_FORMULARIO:
+            return None
+        return environ["wsgi.input"].read(largo) if largo else b""
+
+    @staticmethod
+    def _copiar_cuerpo(environ, conexion):
+        try:
+            restante = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            restante = 0
+        entrada = environ["wsgi.input"]
+        while restante > 0:
+            trozo = entrada.read(min(restante, 64 * 1024))
+            if not trozo:
+                break
+            conexion.send(trozo)
+            restante -= len(trozo)
+
+    @staticmethod
+    def _cabeceras_peticion(environ):
+        cabeceras = []
+        for clave, valor in environ.items():
+            if clave.startswith("HTTP_"):
+                nombre = clave[5:].replace("_", "-").title()
+                if nombre.lower() not in CABECERAS_SALTO:
+                    cabeceras.append((nombre, valor))
+        if environ.get("CONTENT_TYPE"):
+            cabeceras.append(("Content-Type", environ["CONTENT_TYPE"]))
+        if environ.get("CONTENT_LENGTH"):
+            cabeceras.append(("Content-Length", environ["CONTENT_LENGTH"]))
+        reenviado = environ.get("HTTP_X_FORWARDED_FOR")
+        cliente = environ.get("REMOTE_ADDR", "")
+        cabeceras = [c for c in cabeceras if c[0] != "X-Forwarded-For"]
+        cabeceras.append(
+            ("X-Forwarded-For", f"{reenviado}, {cliente}" if reenviado else cliente)
+        )
+        return cabeceras
+
+    @staticmethod
+    def _transmitir(respuesta, conexion):
+        # read1 devuelve en cuanto hay datos: los eventos SSE no se quedan retenidos
+        try:
+            while True:
+                trozo = respuesta.read1(64 * 1024)
+                if not trozo:
+                    break
+                yield trozo
+        finally:
+            conexion.close()
+
+
+# ============================================
+# ARRANQUE DE WORKERS Y ENRUTADOR
+# ============================================
+
+
+def arrancar_workers(total, puerto_base):
+    """Lanza 'total' procesos worker con la app en los puertos puerto_base, +1, ..."""
+    procesos = []
+    for i in range(total):
+        entorno = dict(os.environ, KAHOOT_WORKER=str(i), KAHOOT_WORKERS=str(total))
+        procesos.append(
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "--worker",
+                    str(puerto_base + i),
+                ],
+                env=entorno,
+            )
+        )
+    return procesos
+
+
+def servir_worker(puerto):
+    from app import app
+
+    app.run(host="127.0.0.1", port=puerto, threaded=True, debug=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Enrutador por PIN delante de varios workers de la app"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--puerto", type=int, default=5000)
+    parser.add_argument("--puerto-workers", type=int, default=5101)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        servir_worker(args.worker)
+        return
+
+    procesos = arrancar_workers(args.workers, args.puerto_workers)
+    puertos = [args.puerto_workers + i for i in range(args.workers)]
+    print(f"🔀 Enrutador en :{args.puerto} -> {args.workers} workers en {puertos}")
+    try:
+        time.sleep(1)  # Dejamos que los workers abran su puerto
+        run_simple("0.0.0.0", args.puerto, Enrutador(puertos), threaded=True)
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+
+
+if __name__ == "__main__":
+    main()
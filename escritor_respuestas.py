@@ -0,0 +1,184 @@
+# escritor_respuestas.py - Escritura agrupada (group commit) de respuestas
+# Al empezar cada pregunta llegan cientos de respuestas en uno o dos segundos.
+# En lugar de un INSERT + UPDATE + COMMIT por respuesta, /responder las deja en
+# una cola y un hilo las escribe en lotes: una transacción cada pocos
+# milisegundos o cada N respuestas, lo que ocurra antes.
+#
+# EscritorLotes es la mecánica general (cola, ventana, lote, resguardos); la
+# usan también las altas de jugadores (ver admision_jugadores.py).
+
+import atexit
+import os
+import threading
+import time
+
+escritor_config = {
+    # Milisegundos que se esperan a que lleguen más respuestas antes de escribir
+    "ventana_ms": float(os.environ.get("KAHOOT_RESPUESTAS_VENTANA_MS", 10)),
+    # Máximo de respuestas por lote (se escribe en cuanto se llena)
+    "tamano_lote": int(os.environ.get("KAHOOT_RESPUESTAS_LOTE", 200)),
+}
+
+
+class ResguardoRespuesta:
+    """Resguardo que recibe quien encola; se resuelve cuando su lote se confirma."""
+
+    def __init__(self):
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+        self._al_resolver = []
+        self.exito = None
+
+    def resolver(self, exito):
+        with self._lock:
+            self.exito = exito
+            self._evento.set()
+            funciones, self._al_resolver = self._al_resolver, []
+        for funcion in funciones:
+            try:
+                funcion(exito)
+            except Exception as e:
+                print(f"Error atendiendo el resultado de una escritura: {e}")
+
+    def al_resolver(self, funcion):
+        """Llama a 'funcion(exito)' cuando se resuelva (ya mismo si ya se resolvió)."""
+        with self._lock:
+            if not self._evento.is_set():
+                self._al_resolver.append(funcion)
+                return
+        funcion(self.exito)
+
+    def esperar(self, timeout=None):
+        """True/False según se guardó o no; None si se agotó el tiempo de espera."""
+        if not self._evento.wait(timeout):
+            return None
+        return self.exito
+
+
+class EscritorLotes:
+    """
+    Cola de elementos pendientes y un hilo que los guarda en lotes.
+
+    'guardar_lote' recibe una lista de elementos y devuelve una lista de
+    booleanos con el resultado de cada uno (ver database.registrar_respuestas_lote).
+    """
+
+    nombre = "escritor-lotes"
+
+    def __init__(self, guardar_lote, ventana_ms=10, tamano_lote=200):
+        self._guardar_lote = guardar_lote
+        self.ventana = ventana_ms / 1000.0
+        self.tamano_lote = tamano_lote
+
+        self._pendientes = []  # [(elemento, resguardo, encolado_en)]
+        self._condicion = threading.Condition()
+        self._hilo = None
+
+        self.metricas = {
+            "lotes_escritos": 0,
+            "escritos": 0,
+            "fallidos": 0,
+            "ultimo_lote": 0,  # Elementos en el último lote
+            "max_lote": 0,  # Lote más grande escrito hasta ahora
+            "ultima_escritura_ms": 0.0,  # Duración de la última transacción
+            "max_espera_ms": 0.0,  # Mayor tiempo que un elemento pasó en la cola
+        }
+
+    def _encolar(self, elemento, capacidad=None):
+        """
+        Añade un elemento a la cola y devuelve su resguardo, o None si ya hay
+        'capacidad' elementos esperando.
+        """
+        resguardo = ResguardoRespuesta()
+        with self._condicion:
+            if capacidad is not None and len(self._pendientes) >= capacidad:
+                return None
+            self._arrancar()
+            self._pendientes.append((elemento, resguardo, time.monotonic()))
+            self._condicion.notify()
+        return resguardo
+
+    def pendientes(self):
+        with self._condicion:
+            return len(self._pendientes)
+
+    def _arrancar(self):
+        # El hilo se arranca con el primer elemento, no al importar el módulo
+        if self._hilo is None:
+            self._hilo = threading.Thread(
+                target=self._bucle, name=self.nombre, daemon=True
+            )
+            self._hilo.start()
+            atexit.register(self.vaciar)
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                while not self._pendientes:
+                    self._condicion.wait()
+                # Dejamos que el lote se llene durante la ventana
+                limite = time.monotonic() + self.ventana
+                while len(self._pendientes) < self.tamano_lote:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicion.wait(restante)
+                lote = self._tomar_lote()
+            self._escribir(lote)
+
+    def _tomar_lote(self):
+        lote = self._pendientes[: self.tamano_lote]
+        del self._pendientes[: self.tamano_lote]
+        return lote
+
+    def _escribir(self, lote):
+        inicio = time.monotonic()
+        try:
+            resultados = self._guardar_lote([elemento for elemento, _, _ in lote])
+        except Exception as e:
+            print(f"Error en {self.nombre}: {e}")
+            resultados = [False] * len(lote)
+        fin = time.monotonic()
+
+        for (_, resguardo, _), exito in zip(lote, resultados):
+            resguardo.resolver(exito)
+
+        escritas = sum(1 for exito in resultados if exito)
+        with self._condicion:
+            m = self.metricas
+            m["lotes_escritos"] += 1
+            m["escritos"] += escritas
+            m["fallidos"] += len(lote) - escritas
+            m["ultimo_lote"] = len(lote)
+            m["max_lote"] = max(m["max_lote"], len(lote))
+            m["ultima_escritura_ms"] = (fin - inicio) * 1000
+            m["max_espera_ms"] = max(
+                m["max_espera_ms"], (inicio - lote[0][2]) * 1000
+            )
+
+    def vaciar(self):
+        """Escribe en el momento todo lo pendiente (se llama al cerrar el proceso)."""
+        while True:
+            with self._condicion:
+                lote = self._tomar_lote()
+            if not lote:
+                return
+            self._escribir(lote)
+
+    def obtener_metricas(self):
+        with self._condicion:
+            datos = dict(self.metricas)
+            datos["pendientes"] = len(self._pendientes)
+        datos["ventana_ms"] = self.ventana * 1000
+        datos["tamano_lote"] = self.tamano_lote
+        return datos
+
+
+class EscritorRespuestas(EscritorLotes):
+    """Respuestas de /responder, guardadas con database.registrar_respuestas_lote."""
+
+    nombre = "escritor-respuestas"
+
+    def encolar(self, jugador_id, pregunta_id, opcion_id, tiempo, puntos):
+        """Añade una respuesta a la cola y devuelve su resguardo."""
+        return self._encolar((jugador_id, pregunta_id, opcion_id, tiempo, puntos))
@@ -0,0 +1,203 @@
+# estres_registro.py - Prueba de estrés del registro de partidas
+# Lanza muchos hilos contra un mismo RegistroPartidas y comprueba que:
+#
+#   - quien lee una partida sin lock ve siempre una instantánea coherente
+#     (las claves de control corresponden a un mismo cambio y la versión
+#     nunca retrocede)
+#   - de varias respuestas simultáneas de un jugador sólo se acepta una
+#   - cada pregunta se liquida una sola vez, con todas sus respuestas
+#   - altas y bajas concurrentes dejan los dos índices coherentes
+#
+# Uso:  python estres_registro.py [--hilos 16] [--segundos 5] [--compartido]
+# Con --compartido se prueba RegistroPartidasSQLite sobre un archivo temporal.
+# Termina con código 1 si encuentra algún fallo.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from evaluadora import nuevas_estadisticas_pregunta
+from registro_partidas import RegistroPartidas
+
+PREGUNTAS = [{"id": i, "tiempo_limite": 20} for i in range(1, 6)]
+
+
+def nuevo_registro(compartido):
+    if not compartido:
+        return RegistroPartidas()
+    from registro_compartido import RegistroPartidasSQLite
+
+    ruta = os.path.join(tempfile.mkdtemp(prefix="estres_registro_"), "estado.sqlite3")
+    return RegistroPartidasSQLite(ruta)
+
+
+def crear_partida(registro, pin, partida_id):
+    return registro.crear(
+        pin,
+        partida_id,
+        PREGUNTAS,
+        estadisticas={p["id"]: nuevas_estadisticas_pregunta(()) for p in PREGUNTAS},
+    )
+
+
+class Fallos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lista = []
+
+    def anotar(self, mensaje):
+        with self._lock:
+            if len(self.lista) < 20:
+                self.lista.append(mensaje)
+
+
+# ============================================
+# ESCENARIOS
+# ============================================
+
+
+def escritor(registro, pin, fin, fallos):
+    """Avanza la partida como lo haría el host; cada cambio deja estado == 'p<n>'."""
+    while time.monotonic() < fin:
+        with registro.bloquear(pin):
+            estado = registro.get(pin)
+            if estado is None:
+                continue
+            siguiente = estado["pregunta_actual"] + 1
+            registro.actualizar(
+                pin,
+                estado=f"p{siguiente}",
+                pregunta_actual=siguiente,
+                tiempo_inicio=float(siguiente),
+            )
+
+
+def lector(registro, pines, fin, fallos):
+    """Lee sin lock y comprueba que cada instantánea es coherente consigo misma."""
+    vistas = {}
+    while time.monotonic() < fin:
+        pin = random.choice(pines)
+        estado = registro.get(pin)
+        if estado is None:
+            continue
+        pregunta = estado["pregunta_actual"]
+        if pregunta and (
+            estado["estado"] != f"p{pregunta}" or estado["tiempo_inicio"] != pregunta
+        ):
+            fallos.anotar(f"Instantánea incoherente en {pin}: {estado['estado']}/{pregunta}")
+        clave = (pin, estado["partida_id"])
+        if estado["version"] < vistas.get(clave, 0):
+            fallos.anotar(f"La versión de {pin} retrocedió")
+        vistas[clave] = estado["version"]
+
+
+def respuestas(registro, pin, hilos, fallos):
+    """Todos los hilos responden a la vez por los mismos jugadores."""
+    jugadores = range(1, 201)
+    aceptadas = [0] * hilos
+    barrera = threading.Barrier(hilos)
+
+    def responder(indice):
+        barrera.wait()
+        for jugador_id in jugadores:
+            if registro.marcar_respondida(pin, 1, jugador_id):
+                aceptadas[indice] += 1
+                registro.registrar_respuesta(pin, 1, jugador_id, None, 1.0, True)
+
+    lanzar([threading.Thread(target=responder, args=(i,)) for i in range(hilos)])
+    if sum(aceptadas) != len(jugadores):
+        fallos.anotar(f"Respuestas aceptadas: {sum(aceptadas)} de {len(jugadores)}")
+
+    cierres = []
+    barrera = threading.Barrier(hilos)
+
+    def cerrar():
+        barrera.wait()
+        resultado = registro.cerrar_pregunta(pin, 1)
+        if resultado is not None:
+            cierres.append(resultado)
+
+    lanzar([threading.Thread(target=cerrar) for _ in range(hilos)])
+    if len(cierres) != 1:
+        fallos.anotar(f"La pregunta se liquidó {len(cierres)} veces")
+    elif sorted(cierres[0][0]) != list(jugadores):
+        fallos.anotar(f"Se liquidaron {len(cierres[0][0])} respuestas de {len(jugadores)}")
+
+
+def altas_y_bajas(registro, pines, fin, fallos):
+    """Recrea y elimina partidas al azar (con partida_id nuevos) mientras otros leen."""
+    while time.monotonic() < fin:
+        pin = random.choice(pines)
+        if random.random() < 0.5:
+            registro.eliminar(pin)
+        else:
+            crear_partida(registro, pin, random.randrange(10_000, 1_000_000))
+        partida_id = random.randrange(10_000, 1_000_000)
+        _, estado = registro.buscar_por_partida_id(partida_id)
+        if estado is not None and estado["partida_id"] != partida_id:
+            fallos.anotar(f"Índice inverso incoherente para la partida {partida_id}")
+
+
+def lanzar(hilos):
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+
+# ============================================
+# PROGRAMA
+# ============================================
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de estrés del registro de partidas")
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--compartido", action="store_true")
+    args = parser.parse_args()
+
+    registro = nuevo_registro(args.compartido)
+    fallos = Fallos()
+    # Una excepción en cualquier hilo también es un fallo
+    threading.excepthook = lambda e: fallos.anotar(
+        f"{e.thread.name}: {e.exc_type.__name__}: {e.exc_value}"
+    )
+
+    # 1. Respuestas simultáneas y una sola liquidación
+    crear_partida(registro, "R1", 1)
+    respuestas(registro, "R1", args.hilos, fallos)
+
+    # 2. Host, jugadores leyendo y partidas que se crean y se borran, a la vez
+    pines = [f"P{i}" for i in range(8)]
+    for i, pin in enumerate(pines, start=2):
+        crear_partida(registro, pin, i)
+    fin = time.monotonic() + args.segundos
+    hilos = [threading.Thread(target=escritor, args=(registro, pin, fin, fallos)) for pin in pines]
+    hilos += [
+        threading.Thread(target=lector, args=(registro, pines, fin, fallos))
+        for _ in range(args.hilos)
+    ]
+    hilos.append(threading.Thread(target=altas_y_bajas, args=(registro, pines, fin, fallos)))
+    lanzar(hilos)
+
+    for pin, estado in registro.items():
+        encontrado, _ = registro.buscar_por_partida_id(estado["partida_id"])
+        if encontrado != pin:
+            fallos.anotar(f"La partida {estado['partida_id']} no se encuentra por su id")
+
+    modo = "compartido (SQLite)" if args.compartido else "en memoria"
+    if fallos.lista:
+        print(f"❌ Registro {modo}: {len(fallos.lista)} fallos")
+        for mensaje in fallos.lista:
+            print(f"   - {mensaje}")
+        sys.exit(1)
+    print(f"✅ Registro {modo}: sin fallos con {args.hilos} hilos durante {args.segundos}s")
+
+
+if __name__ == "__main__":
+    main()
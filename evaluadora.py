@@ -1,6 +1,8 @@
 # evaluadora.py - Función Evaluadora (Grupo Jean Pierre Lubin)
 # Calcula los puntajes basándose en respuestas correctas y tiempo
 
+from array import array
+
 
 def calcular_puntajes(respuestas_pregunta, tiempo_limite=20):
     """
@@ -27,37 +29,103 @@ def calcular_puntajes(respuestas_pregunta, tiempo_limite=20):
         }
     """
 
-    resultados = []
+    puntos = calcular_puntajes_lote(
+        [r.get("tiempo_respuesta", tiempo_limite) for r in respuestas_pregunta],
+        [r.get("es_correcta", False) for r in respuestas_pregunta],
+        tiempo_limite,
+    )
 
-    # Puntaje base por respuesta correcta
-    PUNTAJE_BASE = 1000
+    return [
+        {
+            "jugador_id": respuesta["jugador_id"],
+            "nombre": respuesta.get("nombre", "Anónimo"),
+            "puntos_ganados": puntos_respuesta,
+            "respuesta_correcta": respuesta.get("es_correcta", False),
+        }
+        for respuesta, puntos_respuesta in zip(respuestas_pregunta, puntos)
+    ]
 
-    for respuesta in respuestas_pregunta:
-        puntos = 200
 
-        if respuesta.get("es_correcta", False):
-            # Calcular puntos basados en el tiempo
-            # Mientras más rápido, más puntos
-            tiempo = respuesta.get("tiempo_respuesta", tiempo_limite)
+# Puntaje base por respuesta correcta
+PUNTAJE_BASE = 1000
 
-            # Fórmula: puntos = base * (tiempo_restante / tiempo_total)
-            # Si respondió en 5 segundos de 20: 1000 * (15/20) = 750 puntos
-            tiempo_restante = max(0, tiempo_limite - tiempo)
-            factor_tiempo = tiempo_restante / tiempo_limite
 
-            # Mínimo 500 puntos por respuesta correcta, máximo 1000
-            puntos = int(PUNTAJE_BASE * (0.5 + 0.5 * factor_tiempo))
+def calcular_puntajes_lote(tiempos, correctas, tiempo_limite=20):
+    """
+    Calcula los puntos de todas las respuestas de una pregunta en una sola
+    pasada. No es aritmética vectorizada: es un bucle de Python sobre los arrays
+    paralelos, sin crear un dict por respuesta ni consultar la DB.
 
-        resultados.append(
-            {
-                "jugador_id": respuesta["jugador_id"],
-                "nombre": respuesta.get("nombre", "Anónimo"),
-                "puntos_ganados": puntos,
-                "respuesta_correcta": respuesta.get("es_correcta", False),
-            }
-        )
+    Parámetros:
+    - tiempos: Secuencia (p. ej. array('d')) con los segundos de cada respuesta
+    - correctas: Secuencia paralela (p. ej. array('b')) con 1 si fue correcta
+    - tiempo_limite: Tiempo máximo para responder (default 20 segundos)
+
+    Retorna:
+    - array('l') paralelo con los puntos de cada respuesta:
+      0 si es incorrecta; entre 500 y 1000 si es correcta, más cuanto más rápida
+    """
+
+    limite = float(tiempo_limite) if tiempo_limite else 20.0
+    mitad = PUNTAJE_BASE * 0.5
+
+    # Fórmula: puntos = base * (0.5 + 0.5 * tiempo_restante / tiempo_total)
+    # Si respondió en 5 segundos de 20: 1000 * (0.5 + 0.5 * 15/20) = 875 puntos
+    return array(
+        "l",
+        (
+            int(mitad + mitad * (limite - min(max(t, 0.0), limite)) / limite)
+            if c
+            else 0
+            for t, c in zip(tiempos, correctas)
+        ),
+    )
+
+
+def calcular_puntos_respuesta(es_correcta, tiempo, tiempo_limite=20):
+    """Puntos de una sola respuesta, con la misma fórmula que calcular_puntajes_lote."""
+
+    return calcular_puntajes_lote((tiempo,), (1 if es_correcta else 0,), tiempo_limite)[0]
+
+
+def compilar_clave_respuestas(preguntas, opciones):
+    """
+    Compila la clave de respuestas de un cuestionario para evaluar en memoria.
 
-    return resultados
+    Parámetros:
+    - preguntas: Lista de preguntas del cuestionario (con 'id')
+    - opciones: Lista de todas sus opciones con 'id', 'pregunta_id' y 'es_correcta'
+
+    Retorna:
+    - Diccionario {pregunta_id: {'validas': set(ids), 'correctas': set(ids)}}
+    """
+
+    clave = {p["id"]: {"validas": set(), "correctas": set()} for p in preguntas}
+
+    for opcion in opciones:
+        entrada = clave.get(opcion["pregunta_id"])
+        if entrada is None:
+            continue
+        entrada["validas"].add(opcion["id"])
+        if opcion["es_correcta"]:
+            entrada["correctas"].add(opcion["id"])
+
+    return clave
+
+
+def evaluar_respuesta(clave_respuestas, pregunta_id, opcion_id):
+    """
+    Evalúa una respuesta con la clave compilada, sin consultar la base de datos.
+
+    Retorna:
+    - True si la opción es correcta, False si es incorrecta
+    - None si la opción no pertenece a esa pregunta
+    """
+
+    entrada = clave_respuestas.get(pregunta_id)
+    if entrada is None or opcion_id not in entrada["validas"]:
+        return None
+    return opcion_id in entrada["correctas"]
 
 
 def actualizar_puntajes_totales(jugadores_actuales, resultados_pregunta):
@@ -143,8 +211,6 @@ def generar_estadisticas_pregunta(respuestas, opciones):
     """
 
     total_respuestas = len(respuestas)
-    correctas = sum(1 for r in respuestas if r.get("es_correcta", False))
-    incorrectas = total_respuestas - correctas
 
     # Contar respuestas por opción
     conteo_opciones = {}
@@ -155,10 +221,18 @@ def generar_estadisticas_pregunta(respuestas, opciones):
             "es_correcta": opcion["es_correcta"],
         }
 
+    correctas = 0
     for respuesta in respuestas:
         opcion_id = respuesta.get("opcion_id")
         if opcion_id in conteo_opciones:
             conteo_opciones[opcion_id]["cantidad"] += 1
+        # Las filas de 'respuestas' no traen es_correcta: se saca de la opción
+        es_correcta = respuesta.get("es_correcta")
+        if es_correcta is None and opcion_id in conteo_opciones:
+            es_correcta = conteo_opciones[opcion_id]["es_correcta"]
+        if es_correcta:
+            correctas += 1
+    incorrectas = total_respuestas - correctas
 
     return {
         "total_respuestas": total_respuestas,
@@ -169,3 +243,114 @@ def generar_estadisticas_pregunta(respuestas, opciones):
         ),
         "por_opcion": conteo_opciones,
     }
+
+
+# ============================================
+# ESTADÍSTICAS INCREMENTALES POR PREGUNTA
+# ============================================
+
+# Límites superiores (en segundos) de los tramos del histograma de tiempos;
+# el último tramo recoge todo lo que pase del último límite
+LIMITES_HISTOGRAMA = (1, 2, 3, 5, 8, 13, 20)
+
+
+def nuevas_estadisticas_pregunta(opciones):
+    """
+    Crea los contadores vacíos de una pregunta, que luego se actualizan con
+    sumar_respuesta_estadisticas() cada vez que se acepta una respuesta.
+
+    Parámetros:
+    - opciones: Lista de opciones de la pregunta
+
+    Retorna:
+    - Diccionario de contadores
+    """
+
+    return {
+        "total_respuestas": 0,
+        "correctas": 0,
+        "suma_tiempos": 0.0,
+        "histograma": [0] * (len(LIMITES_HISTOGRAMA) + 1),
+        "por_opcion": {
+            opcion["id"]: {
+                "texto": opcion["texto"],
+                "cantidad": 0,
+                "es_correcta": opcion["es_correcta"],
+            }
+            for opcion in opciones
+        },
+    }
+
+
+def nuevas_estadisticas_cuestionario(preguntas, opciones):
+    """Contadores vacíos para cada pregunta: {pregunta_id: estadisticas}."""
+
+    opciones_por_pregunta = {p["id"]: [] for p in preguntas}
+    for opcion in opciones:
+        if opcion["pregunta_id"] in opciones_por_pregunta:
+            opciones_por_pregunta[opcion["pregunta_id"]].append(opcion)
+
+    return {
+        pregunta_id: nuevas_estadisticas_pregunta(lista)
+        for pregunta_id, lista in opciones_por_pregunta.items()
+    }
+
+
+def sumar_respuesta_estadisticas(
+    estadisticas, opcion_id, es_correcta, tiempo, cantidad=1
+):
+    """
+    Suma una respuesta aceptada a los contadores de su pregunta
+    (con cantidad=-1, la resta: una respuesta que al final no se guardó).
+    """
+
+    estadisticas["total_respuestas"] += cantidad
+    if es_correcta:
+        estadisticas["correctas"] += cantidad
+    estadisticas["suma_tiempos"] += tiempo * cantidad
+
+    tramo = 0
+    while tramo < len(LIMITES_HISTOGRAMA) and tiempo > LIMITES_HISTOGRAMA[tramo]:
+        tramo += 1
+    estadisticas["histograma"][tramo] += cantidad
+
+    opcion = estadisticas["por_opcion"].get(opcion_id)
+    if opcion is not None:
+        opcion["cantidad"] += cantidad
+
+
+def resumir_estadisticas(estadisticas):
+    """
+    Convierte los contadores en el mismo formato que generar_estadisticas_pregunta,
+    más el tiempo promedio y el histograma de tiempos. Coste O(opciones).
+    """
+
+    total_respuestas = estadisticas["total_respuestas"]
+    correctas = estadisticas["correctas"]
+
+    histograma = [
+        {"hasta": limite, "cantidad": cantidad}
+        for limite, cantidad in zip(
+            LIMITES_HISTOGRAMA + (None,), estadisticas["histograma"]
+        )
+    ]
+
+    return {
+        "total_respuestas": total_respuestas,
+        "correctas": correctas,
+        "incorrectas": total_respuestas - correctas,
+        "porcentaje_acierto": round(
+            (correctas / total_respuestas * 100) if total_respuestas > 0 else 0, 1
+        ),
+        "por_opcion": {
+            opcion_id: dict(opcion)
+            for opcion_id, opcion in estadisticas["por_opcion"].items()
+        },
+        "tiempo_promedio": round(
+            (estadisticas["suma_tiempos"] / total_respuestas)
+            if total_respuestas > 0
+            else 0,
+            2,
+        ),
+        "histograma_tiempos": histograma,
+    }
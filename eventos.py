@@ -0,0 +1,109 @@
+# eventos.py - Canal de eventos en tiempo real (Server-Sent Events)
+# Cada partida (por su partida_id) tiene sus suscriptores: el host y los jugadores.
+# Las rutas que cambian el estado del juego publican un evento y todos los
+# navegadores conectados lo reciben al instante, sin tener que hacer polling.
+#
+# Cada flujo abierto ocupa un hilo del worker mientras el cliente siga conectado
+# (gunicorn -w 4 --threads 8 son 32 hilos en total). Por eso cada proceso admite
+# como mucho KAHOOT_MAX_SUSCRIPTORES_SSE flujos; al resto se le contesta 503 y
+# sus páginas siguen con el polling de respaldo, que no retiene ningún hilo.
+
+import json
+import os
+import queue
+import threading
+
+# Segundos sin eventos tras los que se manda un comentario para mantener viva
+# la conexión (y detectar clientes que ya se fueron)
+INTERVALO_LATIDO = 15
+
+# Eventos que se guardan por suscriptor; si un cliente no los lee, se le desconecta
+MAX_EVENTOS_PENDIENTES = 100
+
+# Milisegundos que espera el navegador antes de reconectar si se corta
+REINTENTO_MS = 3000
+
+# Flujos abiertos a la vez en este proceso (0 = sin límite). Por defecto la
+# mitad de los hilos de cada worker con --threads 8: la otra mitad queda libre
+# para el polling y las rutas del host
+MAX_SUSCRIPTORES = int(os.environ.get("KAHOOT_MAX_SUSCRIPTORES_SSE", 4))
+
+
+class CanalEventos:
+    """Publicación/suscripción de eventos por partida (clave: partida_id)."""
+
+    def __init__(self, max_suscriptores=MAX_SUSCRIPTORES):
+        self.max_suscriptores = max_suscriptores
+        self._suscriptores = {}  # {partida_id: set(colas)}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def suscribir(self, partida_id):
+        """Cola de eventos del nuevo suscriptor, o None si el proceso ya tiene el máximo."""
+        cola = queue.Queue(maxsize=MAX_EVENTOS_PENDIENTES)
+        with self._lock:
+            if self.max_suscriptores and self._total >= self.max_suscriptores:
+                return None
+            self._suscriptores.setdefault(partida_id, set()).add(cola)
+            self._total += 1
+        return cola
+
+    def desuscribir(self, partida_id, cola):
+        with self._lock:
+            colas = self._suscriptores.get(partida_id)
+            if colas is not None and cola in colas:
+                colas.discard(cola)
+                self._total -= 1
+                if not colas:
+                    del self._suscriptores[partida_id]
+
+    def publicar(self, partida_id, tipo, datos):
+        """Envía un evento a todos los suscriptores de la partida."""
+        mensaje = f"event: {tipo}\ndata: {json.dumps(datos)}\n\n"
+        with self._lock:
+            colas = list(self._suscriptores.get(partida_id, ()))
+        for cola in colas:
+            try:
+                cola.put_nowait(mensaje)
+            except queue.Full:
+                # Cliente demasiado lento: descartamos lo pendiente y le cerramos
+                # el flujo; al reconectar recibe el estado actual completo
+                self.desuscribir(partida_id, cola)
+                with cola.mutex:
+                    cola.queue.clear()
+                cola.put_nowait(None)
+
+    def total_suscriptores(self, partida_id=None):
+        with self._lock:
+            if partida_id is not None:
+                return len(self._suscriptores.get(partida_id, ()))
+            return sum(len(colas) for colas in self._suscriptores.values())
+
+    def partidas_suscritas(self):
+        """Conjunto de partida_id con algún suscriptor en este proceso."""
+        with self._lock:
+            return set(self._suscriptores)
+
+    def flujo(self, partida_id, cola, evento_inicial=None):
+        """
+        Generador con el cuerpo de la respuesta text/event-stream, para la 'cola'
+        que devolvió suscribir(partida_id).
+        evento_inicial es un (tipo, datos) opcional que se manda nada más conectar,
+        para que el cliente no se pierda lo que pasó mientras reconectaba.
+        """
+        try:
+            yield f"retry: {REINTENTO_MS}\n\n"
+            if evento_inicial is not None:
+                tipo, datos = evento_inicial
+                yield f"event: {tipo}\ndata: {json.dumps(datos)}\n\n"
+            while True:
+                try:
+                    mensaje = cola.get(timeout=INTERVALO_LATIDO)
+                except queue.Empty:
+                    yield ": latido\n\n"
+                    continue
+                if mensaje is None:
+                    return
+                yield mensaje
+        finally:
+            self.desuscribir(partida_id, cola)
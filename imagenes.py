@@ -0,0 +1,234 @@
+# imagenes.py - Imágenes de las preguntas guardadas como archivos
+# El editor de cuestionarios manda cada imagen como data: URL (base64). Antes de
+# guardar el cuestionario se decodifica y se escribe en static/uploads con el
+# hash de su contenido como nombre, más copias reducidas para móviles; en la DB
+# sólo queda la URL. Como el nombre cambia si cambia el contenido, el navegador
+# puede guardarla en caché para siempre.
+
+import base64
+import binascii
+import functools
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+from database import actualizar_imagen_pregunta, obtener_preguntas_con_imagen_embebida
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Sin Pillow se guarda sólo el original, sin variantes
+    Image = None
+
+CARPETA_IMAGENES = os.path.join("static", "uploads")
+
+# URL pública bajo la que se sirven (ver la ruta servir_imagen de app.py)
+PREFIJO_URL = "/imagenes/"
+
+# Anchos (px) de las copias reducidas para pantallas pequeñas
+ANCHOS_VARIANTES = (320, 640)
+
+# Tamaño máximo de una imagen ya decodificada
+MAX_BYTES_IMAGEN = int(os.environ.get("KAHOOT_IMAGEN_MAX_MB", 5)) * 1024 * 1024
+
+# Tipos aceptados, reconocidos por los primeros bytes y no por lo que diga el
+# data: URL (así no se cuela un SVG con scripts haciéndose pasar por PNG)
+FIRMAS = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+# Formatos de Pillow de los que se generan variantes (un GIF animado no)
+FORMATOS_PILLOW = {"png": "PNG", "jpg": "JPEG", "webp": "WEBP"}
+
+
+class ImagenInvalidaError(ValueError):
+    """El data: URL no contiene una imagen aceptable."""
+
+
+# ============================================
+# DECODIFICAR Y GUARDAR
+# ============================================
+
+
+def es_data_url(valor):
+    return isinstance(valor, str) and valor.startswith("data:")
+
+
+def detectar_extension(contenido):
+    for firma, extension in FIRMAS:
+        if contenido.startswith(firma):
+            return extension
+    if contenido[:4] == b"RIFF" and contenido[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def decodificar_data_url(data_url):
+    """Devuelve (bytes, extensión) de un data: URL en base64."""
+    cabecera, separador, datos = data_url.partition(",")
+    if not separador or not cabecera.endswith(";base64"):
+        raise ImagenInvalidaError("La imagen no viene codificada en base64")
+    # Límite antes de decodificar: el base64 ocupa 4/3 de los bytes reales
+    if len(datos) > MAX_BYTES_IMAGEN * 4 // 3 + 4:
+        raise ImagenInvalidaError("La imagen es demasiado grande")
+    try:
+        contenido = base64.b64decode(datos, validate=True)
+    except (binascii.Error, ValueError):
+        raise ImagenInvalidaError("El base64 de la imagen no es válido")
+    extension = detectar_extension(contenido)
+    if extension is None:
+        raise ImagenInvalidaError("Formato de imagen no admitido (PNG, JPG, GIF o WEBP)")
+    return contenido, extension
+
+
+def guardar_imagen(contenido, extension, carpeta=CARPETA_IMAGENES):
+    """
+    Escribe la imagen (y sus variantes) con su hash como nombre y devuelve la
+    URL del original. Si ya existía no se vuelve a escribir.
+    """
+    digest = hashlib.sha256(contenido).hexdigest()[:32]
+    nombre = f"{digest}.{extension}"
+    ruta = os.path.join(carpeta, nombre)
+    if not os.path.exists(ruta):
+        os.makedirs(carpeta, exist_ok=True)
+        # Las variantes primero: si existe el original, existen sus variantes
+        _generar_variantes(contenido, digest, extension, carpeta)
+        _escribir_atomico(ruta, contenido)
+    return PREFIJO_URL + nombre
+
+
+def _escribir_atomico(ruta, contenido):
+    # Se escribe a un temporal y se renombra, así nunca se sirve un archivo a medias
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def _generar_variantes(contenido, digest, extension, carpeta):
+    formato = FORMATOS_PILLOW.get(extension)
+    if Image is None or formato is None:
+        return
+    try:
+        with Image.open(BytesIO(contenido)) as original:
+            original = ImageOps.exif_transpose(original)
+            for ancho in ANCHOS_VARIANTES:
+                if original.width <= ancho:
+                    break
+                copia = original.copy()
+                copia.thumbnail((ancho, original.height))
+                if formato == "JPEG" and copia.mode not in ("RGB", "L"):
+                    copia = copia.convert("RGB")
+                salida = BytesIO()
+                copia.save(salida, formato, optimize=True)
+                _escribir_atomico(
+                    os.path.join(carpeta, f"{digest}_w{ancho}.{extension}"),
+                    salida.getvalue(),
+                )
+    except Exception as e:
+        # Sin variantes la imagen sigue funcionando, sólo pesa más
+        print(f"No se pudieron generar variantes de la imagen {digest}: {e}")
+
+
+def extraer_imagen(valor):
+    """Si 'valor' es un data: URL lo guarda como archivo y devuelve su URL."""
+    if not es_data_url(valor):
+        return valor
+    contenido, extension = decodificar_data_url(valor)
+    return guardar_imagen(contenido, extension)
+
+
+def extraer_imagenes_cuestionario(datos_json):
+    """
+    Etapa previa a guardar_cuestionario_completo: cambia en cada pregunta la
+    imagen en base64 por la URL del archivo. Lanza ImagenInvalidaError si
+    alguna imagen no se puede aceptar.
+    """
+    for numero, p_data in enumerate(datos_json.get("preguntas", []), start=1):
+        # El editor manda el nombre original en 'imagen' y el contenido en 'imagenBase64'
+        embebida = p_data.pop("imagenBase64", None)
+        if not es_data_url(embebida):
+            embebida = p_data.get("imagen")
+        if es_data_url(embebida):
+            try:
+                p_data["imagen"] = extraer_imagen(embebida)
+            except ImagenInvalidaError as e:
+                raise ImagenInvalidaError(f"Pregunta {numero}: {e}")
+    return datos_json
+
+
+# ============================================
+# SERVIR
+# ============================================
+
+
+def etag_imagen(nombre):
+    """El ETag es el hash del contenido, que ya forma parte del nombre."""
+    return nombre.split(".", 1)[0]
+
+
+def srcset_imagen(imagen_url, carpeta=CARPETA_IMAGENES):
+    """
+    Valor del atributo srcset con las variantes disponibles de una imagen,
+    o "" si no es una imagen guardada por este módulo o no tiene variantes.
+    """
+    if not imagen_url or not imagen_url.startswith(PREFIJO_URL):
+        return ""
+    # Las variantes se escriben antes que el original: hasta que exista pueden
+    # estar a medio generar y el resultado no se puede guardar en caché
+    if not os.path.exists(os.path.join(carpeta, imagen_url[len(PREFIJO_URL) :])):
+        return ""
+    return _srcset_imagen_completa(imagen_url, carpeta)
+
+
+@functools.lru_cache(maxsize=4096)
+def _srcset_imagen_completa(imagen_url, carpeta):
+    digest, _, extension = imagen_url[len(PREFIJO_URL) :].partition(".")
+    candidatas = []
+    for ancho in ANCHOS_VARIANTES:
+        nombre = f"{digest}_w{ancho}.{extension}"
+        if os.path.exists(os.path.join(carpeta, nombre)):
+            candidatas.append(f"{PREFIJO_URL}{nombre} {ancho}w")
+    if not candidatas:
+        return ""
+    # Hay variantes, así que Pillow está instalado: falta el ancho del original
+    try:
+        with Image.open(os.path.join(carpeta, f"{digest}.{extension}")) as original:
+            candidatas.append(f"{imagen_url} {original.width}w")
+    except Exception:
+        pass
+    return ", ".join(candidatas)
+
+
+# ============================================
+# MIGRACIÓN DE LAS PREGUNTAS YA GUARDADAS
+# ============================================
+
+
+def migrar_imagenes_embebidas(al_migrar=None, tamano_tramo=20):
+    """
+    Recorre las preguntas con imagen en base64 y las pasa a archivo.
+    'al_migrar(kahoot_id)' se llama por cada pregunta actualizada (para
+    invalidar la caché de cuestionarios). Devuelve cuántas se migraron.
+    """
+    migradas = 0
+    ultimo_id = 0
+    while True:
+        filas = obtener_preguntas_con_imagen_embebida(ultimo_id, tamano_tramo)
+        if not filas:
+            return migradas
+        for fila in filas:
+            ultimo_id = fila["id"]
+            try:
+                imagen_url = extraer_imagen(fila["imagen_url"])
+            except (ImagenInvalidaError, OSError) as e:
+                # Se deja como está y se sigue con las demás
+                print(f"No se pudo migrar la imagen de la pregunta {fila['id']}: {e}")
+                continue
+            if actualizar_imagen_pregunta(fila["id"], imagen_url):
+                migradas += 1
+                if al_migrar is not None:
+                    al_migrar(fila["kahoot_id"])
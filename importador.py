@@ -0,0 +1,318 @@
+# importador.py - Importación de bancos de preguntas desde CSV o JSON
+# El archivo se lee fila a fila y se inserta en bloques de tamaño fijo, así que
+# un banco de miles de preguntas no se carga nunca entero en memoria. Cada fila
+# se valida por separado: las inválidas se informan con su número y el resto se
+# importa igual.
+#
+# CSV (con cabecera): pregunta, tipo_pregunta, tipo_respuesta, tiempo_limite,
+#   imagen, opcion_1 ... opcion_N, correctas ("1" o "1;3", posiciones desde 1)
+# JSON: una lista de objetos o un objeto por línea (JSON Lines), con las mismas
+#   claves que manda el editor: pregunta, tipo_pregunta, tipo_respuesta,
+#   tiempo_limite, imagen, opciones (lista) y correctas (lista de posiciones)
+
+import csv
+import io
+import json
+
+from database import importar_cuestionario_por_bloques
+from imagenes import ImagenInvalidaError, es_data_url, extraer_imagen
+
+# Preguntas que se insertan de una vez
+TAMANO_BLOQUE = 200
+
+# Errores que se devuelven con detalle (el resto sólo se cuentan)
+MAX_ERRORES_REPORTADOS = 100
+
+# Tamaño máximo de un objeto del JSON (una imagen en base64 entra de sobra)
+MAX_BYTES_FILA_JSON = 8 * 1024 * 1024
+
+# Bytes que se leen del archivo en cada paso
+TAMANO_LECTURA = 64 * 1024
+
+TIPOS_PREGUNTA = ("texto", "imagen", "mixta")
+TIPOS_RESPUESTA = ("unica", "multiple", "abierta")
+MAX_OPCIONES = 6
+MAX_LARGO_TEXTO = 500
+TIEMPO_MINIMO, TIEMPO_MAXIMO = 5, 240
+
+FORMATOS = ("csv", "json", "jsonl")
+
+
+class FilaInvalidaError(ValueError):
+    """Una fila del archivo no es una pregunta válida."""
+
+
+class ArchivoInvalidoError(ValueError):
+    """El archivo no se puede seguir leyendo (p. ej. JSON roto a mitad)."""
+
+
+# ============================================
+# LECTURA POR FILAS
+# ============================================
+
+
+def leer_filas_csv(flujo):
+    """Genera (numero_de_linea, pregunta en el formato del editor) de un CSV binario."""
+    # Una imagen en base64 no cabe en el límite por defecto de un campo (128 KB)
+    csv.field_size_limit(max(csv.field_size_limit(), MAX_BYTES_FILA_JSON))
+    texto = io.TextIOWrapper(flujo, encoding="utf-8-sig", newline="")
+    lector = csv.DictReader(texto)
+    if not lector.fieldnames or "pregunta" not in lector.fieldnames:
+        raise ArchivoInvalidoError("El CSV debe tener cabecera con la columna 'pregunta'")
+    columnas_opcion = sorted(
+        (c for c in lector.fieldnames if c.startswith("opcion_")),
+        key=lambda c: int(c[len("opcion_") :]) if c[len("opcion_") :].isdigit() else 0,
+    )
+    for fila in lector:
+        opciones = [(fila.get(c) or "").strip() for c in columnas_opcion]
+        correctas = (fila.get("correctas") or "").replace(",", ";").split(";")
+        yield lector.line_num, {
+            "pregunta": fila.get("pregunta"),
+            "tipo_pregunta": fila.get("tipo_pregunta") or "texto",
+            "tipo_respuesta": fila.get("tipo_respuesta") or None,
+            "tiempo_limite": fila.get("tiempo_limite") or None,
+            "imagen": fila.get("imagen") or None,
+            # Las columnas de opción vacías no cuentan (como en el editor)
+            "opciones": [o for o in opciones if o],
+            "correctas": [c.strip() for c in correctas if c.strip()],
+            "_posiciones": [i + 1 for i, o in enumerate(opciones) if o],
+        }
+
+
+def leer_filas_json(flujo):
+    """
+    Genera (numero_de_objeto, objeto) de una lista JSON o de JSON Lines, leyendo
+    el archivo por trozos y decodificando cada objeto en cuanto está completo.
+    """
+    decodificador = json.JSONDecoder()
+    lector = io.TextIOWrapper(flujo, encoding="utf-8-sig")
+    buffer = ""
+    fin_archivo = False
+    en_lista = None  # True si es una lista JSON, False si son JSON Lines
+    numero = 0
+
+    while True:
+        # Saltamos separadores entre objetos
+        buffer = buffer.lstrip()
+        if en_lista is None and buffer:
+            en_lista = buffer.startswith("[")
+            if en_lista:
+                buffer = buffer[1:]
+            continue
+        if en_lista and buffer.startswith(","):
+            buffer = buffer[1:]
+            continue
+        if en_lista and buffer.startswith("]"):
+            return
+        if not buffer:
+            if fin_archivo:
+                if en_lista:
+                    raise ArchivoInvalidoError("La lista JSON no está cerrada")
+                return
+            trozo = lector.read(TAMANO_LECTURA)
+            buffer += trozo
+            fin_archivo = not trozo
+            continue
+
+        try:
+            objeto, fin = decodificador.raw_decode(buffer)
+        except json.JSONDecodeError as e:
+            # En JSON Lines, si ya tenemos la línea entera el error es definitivo
+            linea_completa = not en_lista and "\n" in buffer
+            if not (fin_archivo or linea_completa or len(buffer) >= MAX_BYTES_FILA_JSON):
+                # El objeto sigue en el siguiente trozo
+                trozo = lector.read(TAMANO_LECTURA)
+                buffer += trozo
+                fin_archivo = not trozo
+                continue
+            numero += 1
+            salto = buffer.find("\n")
+            if en_lista or salto < 0:
+                raise ArchivoInvalidoError(f"JSON inválido en el objeto {numero}: {e.msg}")
+            # En JSON Lines se puede seguir con la línea siguiente
+            buffer = buffer[salto + 1 :]
+            yield numero, FilaInvalidaError(f"JSON inválido: {e.msg}")
+            continue
+
+        numero += 1
+        buffer = buffer[fin:]
+        yield numero, objeto
+
+
+# ============================================
+# VALIDACIÓN
+# ============================================
+
+
+def validar_pregunta(datos):
+    """Devuelve la pregunta normalizada o lanza FilaInvalidaError."""
+    if isinstance(datos, Exception):
+        raise datos
+    if not isinstance(datos, dict):
+        raise FilaInvalidaError("Cada pregunta debe ser un objeto")
+
+    texto = str(datos.get("pregunta") or "").strip()
+    tipo_pregunta = str(datos.get("tipo_pregunta") or "texto").strip().lower()
+    if tipo_pregunta not in TIPOS_PREGUNTA:
+        raise FilaInvalidaError(f"tipo_pregunta debe ser uno de {', '.join(TIPOS_PREGUNTA)}")
+    if tipo_pregunta != "imagen" and not texto:
+        raise FilaInvalidaError("Falta el texto de la pregunta")
+    if len(texto) > MAX_LARGO_TEXTO:
+        raise FilaInvalidaError(f"La pregunta supera los {MAX_LARGO_TEXTO} caracteres")
+
+    imagen = datos.get("imagen") or None
+    if tipo_pregunta != "texto" and not imagen:
+        raise FilaInvalidaError("Falta la imagen de la pregunta")
+    if imagen is not None:
+        imagen = str(imagen).strip()
+        if not (
+            es_data_url(imagen)
+            or imagen.startswith(("http://", "https://", "/imagenes/", "/static/"))
+        ):
+            raise FilaInvalidaError("La imagen debe ser una URL o un data: URL en base64")
+
+    tiempo = datos.get("tiempo_limite") or 20
+    try:
+        tiempo = int(tiempo)
+    except (TypeError, ValueError):
+        raise FilaInvalidaError("tiempo_limite debe ser un número de segundos")
+    if not TIEMPO_MINIMO <= tiempo <= TIEMPO_MAXIMO:
+        raise FilaInvalidaError(
+            f"tiempo_limite debe estar entre {TIEMPO_MINIMO} y {TIEMPO_MAXIMO} segundos"
+        )
+
+    opciones = datos.get("opciones") or []
+    if not isinstance(opciones, list):
+        raise FilaInvalidaError("opciones debe ser una lista")
+    opciones = [str(o).strip() for o in opciones]
+    if any(not o for o in opciones):
+        raise FilaInvalidaError("Hay opciones vacías")
+    if any(len(o) > MAX_LARGO_TEXTO for o in opciones):
+        raise FilaInvalidaError(f"Una opción supera los {MAX_LARGO_TEXTO} caracteres")
+    if len(opciones) > MAX_OPCIONES:
+        raise FilaInvalidaError(f"Como máximo {MAX_OPCIONES} opciones por pregunta")
+
+    correctas = datos.get("correctas") or []
+    if not isinstance(correctas, list):
+        raise FilaInvalidaError("correctas debe ser una lista de posiciones")
+    try:
+        correctas = sorted({int(c) for c in correctas})
+    except (TypeError, ValueError):
+        raise FilaInvalidaError("correctas debe contener posiciones numéricas (desde 1)")
+    # En el CSV las posiciones se refieren a las columnas, aunque haya huecos
+    posiciones = datos.get("_posiciones")
+    if posiciones is not None:
+        if any(c not in posiciones for c in correctas):
+            raise FilaInvalidaError("Una opción correcta apunta a una columna vacía")
+        correctas = [posiciones.index(c) + 1 for c in correctas]
+    if any(not 1 <= c <= len(opciones) for c in correctas):
+        raise FilaInvalidaError("Una posición de 'correctas' no corresponde a ninguna opción")
+
+    tipo_respuesta = datos.get("tipo_respuesta")
+    if not tipo_respuesta:
+        if not opciones:
+            tipo_respuesta = "abierta"
+        else:
+            tipo_respuesta = "multiple" if len(correctas) > 1 else "unica"
+    tipo_respuesta = str(tipo_respuesta).strip().lower()
+    if tipo_respuesta not in TIPOS_RESPUESTA:
+        raise FilaInvalidaError(f"tipo_respuesta debe ser uno de {', '.join(TIPOS_RESPUESTA)}")
+    if tipo_respuesta == "abierta":
+        if opciones:
+            raise FilaInvalidaError("Una pregunta abierta no lleva opciones")
+    else:
+        if len(opciones) < 2:
+            raise FilaInvalidaError("Hacen falta al menos 2 opciones")
+        if not correctas:
+            raise FilaInvalidaError("Marca al menos una opción correcta")
+        if tipo_respuesta == "unica" and len(correctas) != 1:
+            raise FilaInvalidaError("Una pregunta de respuesta única lleva una sola correcta")
+
+    # Las imágenes en base64 se pasan a archivo como al guardar desde el editor
+    if es_data_url(imagen):
+        try:
+            imagen = extraer_imagen(imagen)
+        except ImagenInvalidaError as e:
+            raise FilaInvalidaError(str(e))
+
+    return {
+        "pregunta": texto,
+        "tipo_pregunta": tipo_pregunta,
+        "tipo_respuesta": tipo_respuesta,
+        "tiempo_limite": tiempo,
+        "imagen": imagen,
+        "opciones": opciones,
+        "correctas": correctas,
+    }
+
+
+# ============================================
+# IMPORTACIÓN
+# ============================================
+
+
+def nuevo_informe():
+    return {"filas": 0, "importadas": 0, "total_errores": 0, "errores": []}
+
+
+def anotar_error(informe, fila, mensaje):
+    informe["total_errores"] += 1
+    if len(informe["errores"]) < MAX_ERRORES_REPORTADOS:
+        informe["errores"].append({"fila": fila, "error": mensaje})
+
+
+def bloques_validos(filas, informe, tamano_bloque=TAMANO_BLOQUE):
+    """Agrupa en bloques las preguntas válidas y anota en el informe las inválidas."""
+    bloque = []
+    try:
+        for numero, datos in filas:
+            informe["filas"] += 1
+            try:
+                bloque.append(validar_pregunta(datos))
+            except FilaInvalidaError as e:
+                anotar_error(informe, numero, str(e))
+                continue
+            if len(bloque) >= tamano_bloque:
+                yield bloque
+                bloque = []
+    except (ArchivoInvalidoError, UnicodeDecodeError, csv.Error) as e:
+        # El archivo está roto (o cortado): no se importa nada a medias
+        anotar_error(informe, informe["filas"] + 1, f"Lectura interrumpida: {e}")
+        raise ArchivoInvalidoError(f"No se pudo leer el archivo: {e}")
+    if bloque:
+        yield bloque
+
+
+def detectar_formato(nombre_archivo):
+    extension = nombre_archivo.rsplit(".", 1)[-1].lower() if "." in nombre_archivo else ""
+    if extension == "ndjson":
+        return "jsonl"
+    return extension if extension in FORMATOS else None
+
+
+def importar_banco_preguntas(
+    usuario_nombre, titulo, flujo, formato, tamano_bloque=TAMANO_BLOQUE
+):
+    """
+    Importa un banco de preguntas desde un flujo binario (archivo subido o
+    abierto en disco). Devuelve el informe:
+    {'exito', 'kahoot_id', 'filas', 'importadas', 'total_errores', 'errores'}
+    """
+    informe = nuevo_informe()
+    if formato == "csv":
+        filas = leer_filas_csv(flujo)
+    elif formato in ("json", "jsonl"):
+        filas = leer_filas_json(flujo)
+    else:
+        raise ValueError(f"Formato no soportado: {formato} (usa {', '.join(FORMATOS)})")
+
+    exito, resultado, importadas = importar_cuestionario_por_bloques(
+        usuario_nombre, titulo, bloques_validos(filas, informe, tamano_bloque)
+    )
+    informe["exito"] = exito
+    informe["importadas"] = importadas
+    if exito:
+        informe["kahoot_id"] = resultado
+    else:
+        informe["error"] = resultado
+    return informe
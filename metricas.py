@@ -0,0 +1,201 @@
+# metricas.py - Métricas de la app en el formato de texto de Prometheus
+# Contadores, histogramas e indicadores mínimos (sin depender de
+# prometheus_client) y un registro que los expone todos juntos en /metrics.
+# Cada valor vive en este proceso: con varios workers, cada uno da los suyos.
+#
+#   peticiones = registro_metricas.histograma("kahoot_peticion_segundos", "...", ("endpoint",))
+#   peticiones.observar(0.012, "jugar")
+
+import threading
+import time
+
+from flask import g, request
+
+# Límites (segundos) de los histogramas de latencia: de 1 ms a 10 s
+LIMITES_LATENCIA = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores, extra=""):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class Contador:
+    """Valor que sólo crece (total de peticiones, de respuestas...), por etiquetas."""
+
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *valores_etiquetas, cantidad=1):
+        with self._lock:
+            self._valores[valores_etiquetas] = (
+                self._valores.get(valores_etiquetas, 0) + cantidad
+            )
+
+    def lineas(self):
+        with self._lock:
+            valores = list(self._valores.items())
+        for etiquetas, valor in valores:
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}"
+
+
+class Histograma:
+    """Reparto de valores (latencias) en tramos acumulados, con su suma y cuenta."""
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}  # {etiquetas: [cuentas por tramo..., suma, cuenta]}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_etiquetas):
+        tramo = 0
+        while tramo < len(self.limites) and valor > self.limites[tramo]:
+            tramo += 1
+        with self._lock:
+            serie = self._series.get(valores_etiquetas)
+            if serie is None:
+                serie = self._series[valores_etiquetas] = [0] * (len(self.limites) + 3)
+            serie[tramo] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def lineas(self):
+        with self._lock:
+            series = [(e, list(s)) for e, s in self._series.items()]
+        for etiquetas, serie in series:
+            acumulado = 0
+            for limite, cuenta in zip(self.limites + (float("inf"),), serie):
+                acumulado += cuenta
+                le = _etiquetas(self.etiquetas, etiquetas, f'le="{_numero(limite)}"')
+                yield f"{self.nombre}_bucket{le} {acumulado}"
+            base = _etiquetas(self.etiquetas, etiquetas)
+            yield f"{self.nombre}_sum{base} {_numero(serie[-2])}"
+            yield f"{self.nombre}_count{base} {serie[-1]}"
+
+
+class Indicador:
+    """
+    Valor que sube y baja, leído en el momento de exponer las métricas.
+    'leer()' devuelve un número o un dict {tupla de etiquetas: número}.
+    """
+
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, leer, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._leer = leer
+
+    def lineas(self):
+        valores = self._leer()
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        for etiquetas, valor in valores.items():
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}"
+
+
+class RegistroMetricas:
+    """Todas las métricas de la app, para exponerlas de una vez."""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            # Registrar dos veces el mismo nombre devuelve la ya existente
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def indicador(self, nombre, ayuda, leer, etiquetas=()):
+        return self._registrar(Indicador(nombre, ayuda, leer, etiquetas))
+
+    def exponer(self):
+        """Texto con todas las métricas en el formato de exposición de Prometheus."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        salida = []
+        for metrica in metricas:
+            try:
+                lineas = list(metrica.lineas())
+            except Exception as e:
+                # Un indicador que falla no debe dejar sin métricas al resto
+                print(f"Error leyendo la métrica {metrica.nombre}: {e}")
+                continue
+            salida.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            salida.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            salida.extend(lineas)
+        return "\n".join(salida) + "\n"
+
+
+registro_metricas = RegistroMetricas()
+
+# ============================================
+# LATENCIA DE LAS PETICIONES
+# ============================================
+
+latencia_peticiones = registro_metricas.histograma(
+    "kahoot_peticion_segundos",
+    "Duración de las peticiones HTTP por endpoint de Flask",
+    ("endpoint", "metodo"),
+)
+peticiones_total = registro_metricas.contador(
+    "kahoot_peticiones_total",
+    "Peticiones HTTP atendidas por endpoint y código de respuesta",
+    ("endpoint", "metodo", "codigo"),
+)
+
+
+def _marcar_inicio():
+    g._inicio_peticion = time.perf_counter()
+
+
+def _medir_peticion(respuesta):
+    inicio = g.pop("_inicio_peticion", None)
+    if inicio is not None:
+        # Por endpoint y no por URL: /host/<pin> es una sola serie para todos los PIN
+        endpoint = request.endpoint or "sin_ruta"
+        latencia_peticiones.observar(time.perf_counter() - inicio, endpoint, request.method)
+        peticiones_total.incrementar(endpoint, request.method, str(respuesta.status_code))
+    return respuesta
+
+
+def init_app(app):
+    """Mide la duración de todas las peticiones de la app."""
+    app.before_request(_marcar_inicio)
+    app.after_request(_medir_peticion)
@@ -0,0 +1,214 @@
+# perfilador.py - Perfilado por muestreo de peticiones reales
+# Con KAHOOT_PERFILAR activado, una fracción de las peticiones (y las que traen
+# la cabecera X-Perfilar desde la sesión del host) se perfilan: un hilo
+# toma cada pocos milisegundos la pila de los hilos que las atienden. No usa
+# sys.setprofile, así que no frena el resto del código y se pueden perfilar
+# muchas peticiones a la vez.
+#
+# Las muestras se juntan por ruta y se escriben en formato "folded" (una pila
+# por línea, con los marcos separados por ';' y el número de muestras), el que
+# leen flamegraph.pl, speedscope o inferno:
+#
+#   perfiles/<pid>/responder.folded   una por endpoint de Flask
+#   perfiles/<pid>/todas.folded       todas, con el endpoint como raíz
+#
+#   KAHOOT_PERFILAR=0.02 python app.py      (0 = sólo las de la cabecera)
+#   flamegraph.pl perfiles/*/todas.folded > llamas.svg
+
+import atexit
+import collections
+import os
+import random
+import sys
+import threading
+import time
+
+from flask import g, request, session
+
+# Milisegundos entre dos muestras de la pila
+INTERVALO_MS = float(os.environ.get("KAHOOT_PERFILAR_INTERVALO_MS", 5))
+
+# Carpeta donde se escriben los perfiles
+CARPETA_PERFILES = os.environ.get("KAHOOT_PERFILES", "perfiles")
+
+# Segundos entre dos escrituras de los archivos (sólo si hay muestras nuevas)
+ESCRIBIR_CADA = 5
+
+# Marcos de pila como máximo en cada muestra (los más cercanos a la raíz)
+MAX_PROFUNDIDAD = 120
+
+CABECERA = "X-Perfilar"
+
+
+def _nombre_marco(marco):
+    codigo = marco.f_code
+    # Las plantillas de Jinja compiladas tienen la ruta de la plantilla como archivo
+    return f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}"
+
+
+class Perfilador:
+    """Muestreador de las pilas de las peticiones perfiladas, agrupadas por ruta."""
+
+    def __init__(self, fraccion, intervalo, carpeta):
+        self.fraccion = fraccion
+        self.intervalo = intervalo
+        self.carpeta = carpeta
+        self._activas = {}  # id de hilo -> (ruta, Counter de pilas)
+        self._por_ruta = {}  # ruta -> Counter de pilas
+        self._peticiones = collections.Counter()
+        self._lock = threading.Lock()
+        self._hay_activas = threading.Event()
+        self._pendiente = False
+        self._hilo = None
+
+    # --- PETICIONES ---
+
+    def debe_perfilar(self, pedida):
+        """Perfilar esta petición: la pidió el host (cabecera) o le tocó por sorteo."""
+        return pedida or (self.fraccion > 0 and random.random() < self.fraccion)
+
+    def empezar(self, ruta):
+        """Empieza a muestrear el hilo actual, que atiende una petición a 'ruta'."""
+        self._arrancar_hilo()
+        with self._lock:
+            self._activas[threading.get_ident()] = (ruta, collections.Counter())
+            self._hay_activas.set()
+
+    def terminar(self):
+        """Deja de muestrear el hilo actual y suma sus muestras a las de su ruta."""
+        with self._lock:
+            ruta, pilas = self._activas.pop(threading.get_ident(), (None, None))
+            if not self._activas:
+                self._hay_activas.clear()
+            if ruta is None:
+                return
+            self._por_ruta.setdefault(ruta, collections.Counter()).update(pilas)
+            self._peticiones[ruta] += 1
+            self._pendiente = True
+
+    # --- MUESTREO ---
+
+    def _arrancar_hilo(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(
+                    target=self._muestrear, name="perfilador", daemon=True
+                )
+                self._hilo.start()
+                atexit.register(self.escribir)
+
+    def _muestrear(self):
+        ultima_escritura = time.monotonic()
+        while True:
+            # Sin peticiones perfiladas el hilo duerme hasta que llegue alguna
+            if self._hay_activas.wait(ESCRIBIR_CADA):
+                self._tomar_muestra()
+                time.sleep(self.intervalo)
+            if time.monotonic() - ultima_escritura >= ESCRIBIR_CADA:
+                self.escribir()
+                ultima_escritura = time.monotonic()
+
+    def _tomar_muestra(self):
+        marcos = sys._current_frames()
+        try:
+            with self._lock:
+                for hilo, (_, pilas) in self._activas.items():
+                    marco = marcos.get(hilo)
+                    if marco is not None:
+                        pilas[self._pila(marco)] += 1
+        finally:
+            # Sin referencias a los marcos de otros hilos más de lo necesario
+            del marcos
+
+    @staticmethod
+    def _pila(marco):
+        nombres = []
+        while marco is not None:
+            nombres.append(_nombre_marco(marco))
+            marco = marco.f_back
+        nombres.reverse()
+        return ";".join(nombres[:MAX_PROFUNDIDAD])
+
+    # --- SALIDA ---
+
+    def escribir(self):
+        """Escribe los archivos .folded con todas las muestras hasta ahora."""
+        with self._lock:
+            if not self._pendiente:
+                return
+            por_ruta = {ruta: dict(pilas) for ruta, pilas in self._por_ruta.items()}
+            self._pendiente = False
+
+        carpeta = os.path.join(self.carpeta, str(os.getpid()))
+        try:
+            os.makedirs(carpeta, exist_ok=True)
+            todas = []
+            for ruta, pilas in por_ruta.items():
+                lineas = [f"{pila} {muestras}" for pila, muestras in pilas.items()]
+                _escribir_atomico(os.path.join(carpeta, f"{ruta}.folded"), lineas)
+                todas.extend(f"{ruta};{linea}" for linea in lineas)
+            _escribir_atomico(os.path.join(carpeta, "todas.folded"), todas)
+        except OSError as e:
+            print(f"Error escribiendo los perfiles en {carpeta}: {e}")
+
+    def obtener_estadisticas(self):
+        with self._lock:
+            return {
+                "peticiones_perfiladas": dict(self._peticiones),
+                "muestras": {
+                    ruta: sum(pilas.values()) for ruta, pilas in self._por_ruta.items()
+                },
+                "activas": len(self._activas),
+            }
+
+
+def _escribir_atomico(ruta, lineas):
+    # Se escribe a un temporal y se renombra: nunca se lee un perfil a medias
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write("\n".join(lineas) + "\n" if lineas else "")
+    os.replace(temporal, ruta)
+
+
+# ============================================
+# INTEGRACIÓN CON FLASK
+# ============================================
+
+
+def _peticion_pide_perfil():
+    # La cabecera sólo cuenta con la sesión del host. No basta con venir de
+    # 127.0.0.1: detrás del enrutador (enrutador.py) llegan así todas
+    return request.headers.get(CABECERA) == "1" and "user_id" in session
+
+
+def init_app(app):
+    """
+    Activa el perfilado si KAHOOT_PERFILAR tiene la fracción de peticiones a
+    perfilar. Devuelve el Perfilador, o None si está desactivado.
+    """
+    valor = os.environ.get("KAHOOT_PERFILAR")
+    if not valor:
+        return None
+    perfilador = Perfilador(float(valor), INTERVALO_MS / 1000, CARPETA_PERFILES)
+
+    def empezar():
+        if perfilador.debe_perfilar(_peticion_pide_perfil()):
+            g._perfilando = True
+            perfilador.empezar(request.endpoint or "sin_ruta")
+
+    def terminar(error=None):
+        if g.pop("_perfilando", False):
+            perfilador.terminar()
+
+    def terminar_respuesta(respuesta):
+        # Las respuestas en streaming (SSE) terminan aquí: no se muestrea la espera
+        terminar()
+        return respuesta
+
+    app.before_request(empezar)
+    app.after_request(terminar_respuesta)
+    app.teardown_request(terminar)
+    print(f"🔬 Perfilando el {perfilador.fraccion:.0%} de las peticiones en {CARPETA_PERFILES}/")
+    return perfilador
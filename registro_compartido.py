@@ -0,0 +1,605 @@
+# registro_compartido.py - Estado de las partidas compartido entre procesos
+# Con un solo proceso basta RegistroPartidas (todo en memoria). Para repartir la
+# carga entre varios workers (gunicorn -w 4, por ejemplo) la parte del estado
+# que tiene que ser la misma en todos vive en un archivo SQLite en modo WAL:
+#
+#   - el estado de control de cada partida (estado, pregunta, hora de inicio,
+#     versión) y el índice partida_id -> PIN
+#   - quién respondió cada pregunta, con su opción, tiempo y si acertó
+#   - qué preguntas ya se liquidaron
+#   - la clasificación (jugadores y puntajes)
+#
+# Cada worker conserva su copia local de la partida (preguntas, clave de
+# respuestas...) y la pone al día en cuanto ve que la versión compartida cambió.
+# Como WAL permite leer mientras otro proceso escribe, comprobar la versión en
+# cada petición cuesta una lectura local de microsegundos.
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from array import array
+
+from clasificacion import Clasificacion
+from evaluadora import (
+    nuevas_estadisticas_pregunta,
+    resumir_estadisticas,
+    sumar_respuesta_estadisticas,
+)
+from registro_partidas import RegistroPartidas
+
+RUTA_ESTADO = os.environ.get(
+    "KAHOOT_ESTADO_RUTA",
+    os.path.join(tempfile.gettempdir(), "kahoot_estado_partidas.sqlite3"),
+)
+
+# Milisegundos que un proceso espera si otro tiene el archivo bloqueado
+ESPERA_BLOQUEO_MS = 5000
+
+# Segundos entre comprobaciones del vigilante de cambios (ver VigilanteCambios)
+INTERVALO_VIGILANCIA = 0.25
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS partidas (
+    pin TEXT PRIMARY KEY,
+    partida_id INTEGER NOT NULL UNIQUE,
+    estado TEXT NOT NULL,
+    pregunta_actual INTEGER NOT NULL,
+    tiempo_inicio REAL NOT NULL,
+    version INTEGER NOT NULL,
+    version_clasificacion INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS respuestas (
+    pin TEXT NOT NULL,
+    pregunta_id INTEGER NOT NULL,
+    jugador_id INTEGER NOT NULL,
+    opcion_id INTEGER,
+    tiempo REAL,
+    correcta INTEGER,
+    confirmada INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (pin, pregunta_id, jugador_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS liquidadas (
+    pin TEXT NOT NULL,
+    pregunta_id INTEGER NOT NULL,
+    PRIMARY KEY (pin, pregunta_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jugadores (
+    orden INTEGER PRIMARY KEY AUTOINCREMENT,
+    pin TEXT NOT NULL,
+    jugador_id INTEGER NOT NULL,
+    nombre TEXT,
+    puntaje INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (pin, jugador_id)
+);
+"""
+
+
+class AlmacenSQLite:
+    """Conexiones (una por hilo) al archivo SQLite compartido por los procesos."""
+
+    def __init__(self, ruta=RUTA_ESTADO):
+        self.ruta = ruta
+        self._local = threading.local()
+        # executescript confirma por su cuenta, así que va fuera de la transacción
+        self.conexion().executescript(ESQUEMA)
+        with self.transaccion() as conn:
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+            # La época distingue ETags de archivos de estado distintos
+            conn.execute(
+                "INSERT OR IGNORE INTO meta VALUES ('epoca', ?)",
+                (int.from_bytes(os.urandom(4), "big"),),
+            )
+
+    def conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: autocommit, y BEGIN explícito donde hace falta
+            conn = sqlite3.connect(
+                self.ruta, timeout=ESPERA_BLOQUEO_MS / 1000, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={ESPERA_BLOQUEO_MS}")
+            self._local.conn = conn
+        return conn
+
+    def transaccion(self):
+        return _Transaccion(self.conexion())
+
+    def consultar(self, sql, parametros=()):
+        return self.conexion().execute(sql, parametros).fetchall()
+
+    def consultar_uno(self, sql, parametros=()):
+        return self.conexion().execute(sql, parametros).fetchone()
+
+    def ejecutar(self, sql, parametros=()):
+        """Ejecuta una escritura suelta y devuelve cuántas filas cambió."""
+        return self.conexion().execute(sql, parametros).rowcount
+
+
+class _Transaccion:
+    """BEGIN IMMEDIATE ... COMMIT (o ROLLBACK si hubo una excepción)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, tipo, valor, traza):
+        self.conn.execute("ROLLBACK" if tipo else "COMMIT")
+        return False
+
+
+def _siguiente_version(conn):
+    """Versión nueva, única entre todos los procesos (dentro de una transacción)."""
+    return conn.execute(
+        "UPDATE meta SET valor = valor + 1 WHERE clave = 'version' RETURNING valor"
+    ).fetchone()[0]
+
+
+def _control_de_fila(fila):
+    """Estado de control de una fila (partida_id, estado, pregunta_actual, tiempo_inicio, version)."""
+    _, estado, pregunta_actual, tiempo_inicio, version = fila
+    return {
+        "estado": estado,
+        "pregunta_actual": pregunta_actual,
+        "tiempo_inicio": tiempo_inicio,
+        "version": version,
+    }
+
+
+class ClasificacionCompartida:
+    """
+    Clasificación guardada en el almacén, con la misma interfaz que Clasificacion.
+    Las escrituras van directas al almacén; las lecturas usan una Clasificacion
+    local que se reconstruye sólo cuando otro proceso la cambió.
+    """
+
+    def __init__(self, almacen, pin):
+        self._almacen = almacen
+        self._pin = pin
+        self._version = None
+        self._local = Clasificacion()
+        self._lock = threading.Lock()
+
+    def _vigente(self):
+        fila = self._almacen.consultar_uno(
+            "SELECT version_clasificacion FROM partidas WHERE pin = ?", (self._pin,)
+        )
+        version = fila[0] if fila else None
+        with self._lock:
+            if version != self._version:
+                jugadores = [
+                    {"id": j, "nombre": n, "puntaje": p}
+                    for j, n, p in self._almacen.consultar(
+                        "SELECT jugador_id, nombre, puntaje FROM jugadores WHERE pin = ?",
+                        (self._pin,),
+                    )
+                ]
+                self._local = Clasificacion(jugadores)
+                self._version = version
+            return self._local
+
+    # --- ACTUALIZACIONES ---
+
+    def agregar_jugador(self, jugador):
+        with self._almacen.transaccion() as conn:
+            insertado = conn.execute(
+                "INSERT OR IGNORE INTO jugadores (pin, jugador_id, nombre, puntaje) VALUES (?, ?, ?, ?)",
+                (self._pin, jugador["id"], jugador["nombre"], jugador.get("puntaje") or 0),
+            ).rowcount
+            if insertado:
+                conn.execute(
+                    "UPDATE partidas SET version_clasificacion = version_clasificacion + 1 WHERE pin = ?",
+                    (self._pin,),
+                )
+
+    def sumar_puntos(self, jugador_id, puntos):
+        self.sumar_puntos_lote([(jugador_id, puntos)])
+
+    def sumar_puntos_lote(self, puntos_por_jugador):
+        pares = [(p, self._pin, j) for j, p in puntos_por_jugador if p]
+        if not pares:
+            return []
+        with self._almacen.transaccion() as conn:
+            conn.executemany(
+                "UPDATE jugadores SET puntaje = puntaje + ? WHERE pin = ? AND jugador_id = ?",
+                pares,
+            )
+            conn.execute(
+                "UPDATE partidas SET version_clasificacion = version_clasificacion + 1 WHERE pin = ?",
+                (self._pin,),
+            )
+            ids = {j for _, _, j in pares}
+            marcas = ", ".join("?" * len(ids))
+            filas = conn.execute(
+                f"SELECT jugador_id, puntaje FROM jugadores WHERE pin = ? AND jugador_id IN ({marcas})",
+                (self._pin, *ids),
+            ).fetchall()
+        return [{"id": j, "puntaje": p} for j, p in filas]
+
+    # --- CONSULTAS ---
+
+    def top(self, k):
+        return self._vigente().top(k)
+
+    def puntaje(self, jugador_id):
+        return self._vigente().puntaje(jugador_id)
+
+    def todos(self):
+        return self._vigente().todos()
+
+    def posicion(self, jugador_id):
+        return self._vigente().posicion(jugador_id)
+
+    def vecinos(self, jugador_id, cuantos=2):
+        return self._vigente().vecinos(jugador_id, cuantos)
+
+    def __len__(self):
+        return len(self._vigente())
+
+
+class RegistroPartidasSQLite(RegistroPartidas):
+    """
+    RegistroPartidas cuyo estado compartido vive en un AlmacenSQLite, para
+    correr varios procesos worker sin sesiones fijas.
+
+    'cargar(pin)' se llama cuando otro proceso ya tiene la partida y este todavía
+    no tiene su copia local; debe terminar llamando a crear() (en app.py es
+    garantizar_estado_partida_en_memoria). crear() adopta entonces el estado
+    compartido en vez de reiniciarlo.
+    """
+
+    compartido = True
+
+    def __init__(self, ruta=RUTA_ESTADO, cargar=None):
+        super().__init__()
+        self.almacen = AlmacenSQLite(ruta)
+        self.cargar = cargar
+        self._epoca = str(
+            self.almacen.consultar_uno("SELECT valor FROM meta WHERE clave = 'epoca'")[0]
+        )
+        self._cargando = set()
+        self._lock_carga = threading.Lock()
+
+    # --- ALTAS Y BAJAS ---
+
+    def _nueva_clasificacion(self, pin, jugadores):
+        # Los jugadores se guardan en el almacén desde _control_inicial
+        return ClasificacionCompartida(self.almacen, pin)
+
+    def _control_inicial(self, pin, partida_id, estado, jugadores, previas, liquidadas):
+        with self.almacen.transaccion() as conn:
+            fila = conn.execute(
+                "SELECT partida_id, estado, pregunta_actual, tiempo_inicio, version FROM partidas WHERE pin = ?",
+                (pin,),
+            ).fetchone()
+            if fila is not None and fila[0] == partida_id:
+                # Otro proceso ya la tiene: nos sumamos a su estado
+                return _control_de_fila(fila)
+
+            version = _siguiente_version(conn)
+            for tabla in ("respuestas", "liquidadas", "jugadores"):
+                conn.execute(f"DELETE FROM {tabla} WHERE pin = ?", (pin,))
+            conn.execute("DELETE FROM partidas WHERE pin = ? OR partida_id = ?", (pin, partida_id))
+            conn.execute(
+                "INSERT INTO partidas (pin, partida_id, estado, pregunta_actual, tiempo_inicio, version) VALUES (?, ?, ?, ?, ?, ?)",
+                (pin, partida_id, estado, 0, 0, version),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO jugadores (pin, jugador_id, nombre, puntaje) VALUES (?, ?, ?, ?)",
+                [(pin, j["id"], j["nombre"], j.get("puntaje") or 0) for j in jugadores],
+            )
+            # Las ya guardadas en la DB: no se aceptan repetidas y las de preguntas
+            # sin liquidar entran en el reparto al cerrarlas
+            conn.executemany(
+                "INSERT OR IGNORE INTO respuestas (pin, pregunta_id, jugador_id, opcion_id, tiempo, correcta, confirmada) VALUES (?, ?, ?, ?, ?, ?, 1)",
+                [
+                    (pin, pregunta_id, jugador_id, opcion_id, tiempo, correcta)
+                    for jugador_id, pregunta_id, opcion_id, tiempo, correcta in previas
+                ],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO liquidadas VALUES (?, ?)",
+                [(pin, pregunta_id) for pregunta_id in liquidadas],
+            )
+        return {
+            "estado": estado,
+            "pregunta_actual": 0,
+            "tiempo_inicio": 0,
+            "version": version,
+        }
+
+    def eliminar(self, pin):
+        with self.bloquear(pin):
+            with self.almacen.transaccion() as conn:
+                for tabla in ("respuestas", "liquidadas", "jugadores", "partidas"):
+                    conn.execute(f"DELETE FROM {tabla} WHERE pin = ?", (pin,))
+            return self._quitar(pin)
+
+    # --- SINCRONIZACIÓN ---
+
+    def _sincronizar(self, pin):
+        """Pone al día la copia local con el almacén; devuelve el estado o None."""
+        fila = self.almacen.consultar_uno(
+            "SELECT partida_id, estado, pregunta_actual, tiempo_inicio, version FROM partidas WHERE pin = ?",
+            (pin,),
+        )
+        estado_partida = self._por_pin.get(pin)
+        if fila is None:
+            if estado_partida is not None:
+                self._quitar(pin)
+            return None
+
+        if estado_partida is None or estado_partida["partida_id"] != fila[0]:
+            with self._lock_carga:
+                if pin in self._cargando or self.cargar is None:
+                    return estado_partida
+                self._cargando.add(pin)
+            try:
+                self.cargar(pin)
+            finally:
+                with self._lock_carga:
+                    self._cargando.discard(pin)
+            return self._por_pin.get(pin)
+
+        if estado_partida["version"] == fila[4]:
+            return estado_partida
+        # Otro proceso la cambió: se publica una instantánea nueva con su estado,
+        # salvo que otro hilo ya haya publicado una igual o más reciente
+        with self.bloquear(pin):
+            actual = self._por_pin.get(pin)
+            if (
+                actual is not None
+                and actual["partida_id"] == fila[0]
+                and actual["version"] < fila[4]
+            ):
+                actual = dict(actual, **_control_de_fila(fila))
+                self._publicar(pin, actual)
+            return actual
+
+    def actualizar(self, pin, **cambios):
+        """Publica en el almacén (y en local) el estado de control con los 'cambios' y una versión nueva."""
+        with self.bloquear(pin):
+            with self.almacen.transaccion() as conn:
+                fila = conn.execute(
+                    "SELECT partida_id, estado, pregunta_actual, tiempo_inicio, version FROM partidas WHERE pin = ?",
+                    (pin,),
+                ).fetchone()
+                if fila is None:
+                    raise KeyError(pin)
+                # Se parte del estado del almacén, por si otro proceso lo cambió
+                estado_partida = dict(self._por_pin[pin], **_control_de_fila(fila))
+                estado_partida.update(cambios)
+                estado_partida["version"] = _siguiente_version(conn)
+                conn.execute(
+                    "UPDATE partidas SET estado = ?, pregunta_actual = ?, tiempo_inicio = ?, version = ? WHERE pin = ?",
+                    (
+                        estado_partida["estado"],
+                        estado_partida["pregunta_actual"],
+                        estado_partida["tiempo_inicio"],
+                        estado_partida["version"],
+                        pin,
+                    ),
+                )
+            self._publicar(pin, estado_partida)
+        return estado_partida
+
+    def versiones(self, partida_ids):
+        """{partida_id: (pin, version)} de las partidas indicadas que están activas."""
+        partida_ids = list(partida_ids)
+        if not partida_ids:
+            return {}
+        marcas = ", ".join("?" * len(partida_ids))
+        return {
+            partida_id: (pin, version)
+            for pin, partida_id, version in self.almacen.consultar(
+                f"SELECT pin, partida_id, version FROM partidas WHERE partida_id IN ({marcas})",
+                partida_ids,
+            )
+        }
+
+    def ultimo_jugador(self, pin):
+        """'orden' del último jugador que entró en la partida (0 si ninguno)."""
+        fila = self.almacen.consultar_uno(
+            "SELECT MAX(orden) FROM jugadores WHERE pin = ?", (pin,)
+        )
+        return fila[0] or 0
+
+    def jugadores_desde(self, pin, orden):
+        """Jugadores que entraron después de 'orden': [(orden, {'id', 'nombre', 'puntaje'})]."""
+        return [
+            (o, {"id": j, "nombre": n, "puntaje": p})
+            for o, j, n, p in self.almacen.consultar(
+                "SELECT orden, jugador_id, nombre, puntaje FROM jugadores WHERE pin = ? AND orden > ? ORDER BY orden",
+                (pin, orden),
+            )
+        ]
+
+    # --- RESPUESTAS ---
+
+    def ya_respondio(self, pin, pregunta_id, jugador_id):
+        return (
+            self.almacen.consultar_uno(
+                "SELECT 1 FROM respuestas WHERE pin = ? AND pregunta_id = ? AND jugador_id = ?",
+                (pin, pregunta_id, jugador_id),
+            )
+            is not None
+        )
+
+    def marcar_respondida(self, pin, pregunta_id, jugador_id):
+        # La clave primaria hace atómica la comprobación entre procesos
+        return (
+            self.almacen.ejecutar(
+                "INSERT OR IGNORE INTO respuestas (pin, pregunta_id, jugador_id) VALUES (?, ?, ?)",
+                (pin, pregunta_id, jugador_id),
+            )
+            == 1
+        )
+
+    def desmarcar_respondida(self, pin, pregunta_id, jugador_id):
+        self.almacen.ejecutar(
+            "DELETE FROM respuestas WHERE pin = ? AND pregunta_id = ? AND jugador_id = ? AND confirmada = 0",
+            (pin, pregunta_id, jugador_id),
+        )
+
+    def pregunta_cerrada(self, pin, pregunta_id):
+        return (
+            self.almacen.consultar_uno(
+                "SELECT 1 FROM liquidadas WHERE pin = ? AND pregunta_id = ?",
+                (pin, pregunta_id),
+            )
+            is not None
+        )
+
+    def registrar_respuesta(
+        self, pin, pregunta_id, jugador_id, opcion_id, tiempo, es_correcta
+    ):
+        # Una sola sentencia: no se confirma si otro proceso ya la liquidó
+        return (
+            self.almacen.ejecutar(
+                "UPDATE respuestas SET opcion_id = ?, tiempo = ?, correcta = ?, confirmada = 1 WHERE pin = ? AND pregunta_id = ? AND jugador_id = ?"
+                " AND NOT EXISTS (SELECT 1 FROM liquidadas WHERE pin = ? AND pregunta_id = ?)",
+                (
+                    opcion_id, tiempo, 1 if es_correcta else 0,
+                    pin, pregunta_id, jugador_id, pin, pregunta_id,
+                ),
+            )
+            == 1
+        )
+
+    def retirar_respuesta(
+        self, pin, pregunta_id, jugador_id, opcion_id, tiempo, es_correcta
+    ):
+        return (
+            self.almacen.ejecutar(
+                "UPDATE respuestas SET confirmada = 0 WHERE pin = ? AND pregunta_id = ? AND jugador_id = ?"
+                " AND NOT EXISTS (SELECT 1 FROM liquidadas WHERE pin = ? AND pregunta_id = ?)",
+                (pin, pregunta_id, jugador_id, pin, pregunta_id),
+            )
+            == 1
+        )
+
+    def cerrar_pregunta(self, pin, pregunta_id):
+        with self.almacen.transaccion() as conn:
+            # Sólo el primer proceso que la cierra la liquida
+            if not conn.execute(
+                "INSERT OR IGNORE INTO liquidadas VALUES (?, ?)", (pin, pregunta_id)
+            ).rowcount:
+                return None
+            filas = conn.execute(
+                "SELECT jugador_id, tiempo, correcta FROM respuestas WHERE pin = ? AND pregunta_id = ? AND confirmada = 1",
+                (pin, pregunta_id),
+            ).fetchall()
+        return (
+            array("q", (f[0] for f in filas)),
+            array("d", (f[1] for f in filas)),
+            array("b", (f[2] for f in filas)),
+        )
+
+    def estadisticas_pregunta(self, pin, pregunta_id):
+        # Las respuestas llegan por todos los procesos: se cuentan en el almacén
+        estado_partida = self._por_pin[pin]
+        estadisticas = nuevas_estadisticas_pregunta(
+            estado_partida["opciones_por_pregunta"].get(pregunta_id, ())
+        )
+        for opcion_id, correcta, tiempo in self.almacen.consultar(
+            "SELECT opcion_id, correcta, tiempo FROM respuestas WHERE pin = ? AND pregunta_id = ? AND confirmada = 1",
+            (pin, pregunta_id),
+        ):
+            sumar_respuesta_estadisticas(estadisticas, opcion_id, correcta, tiempo)
+        return resumir_estadisticas(estadisticas)
+
+    # --- CONSULTAS ---
+
+    def get(self, pin, default=None):
+        estado_partida = self._sincronizar(pin)
+        return default if estado_partida is None else estado_partida
+
+    def buscar_por_partida_id(self, partida_id):
+        fila = self.almacen.consultar_uno(
+            "SELECT pin FROM partidas WHERE partida_id = ?", (partida_id,)
+        )
+        if fila is None:
+            return None, None
+        estado_partida = self._sincronizar(fila[0])
+        if estado_partida is None:
+            return None, None
+        return fila[0], estado_partida
+
+    def __contains__(self, pin):
+        return self._sincronizar(pin) is not None
+
+    def __getitem__(self, pin):
+        estado_partida = self._sincronizar(pin)
+        if estado_partida is None:
+            raise KeyError(pin)
+        return estado_partida
+
+
+class VigilanteCambios:
+    """
+    Hilo que lleva a los clientes SSE de este proceso los cambios hechos en
+    otros procesos: cada INTERVALO_VIGILANCIA segundos compara la versión de las
+    partidas con suscriptores y publica el nuevo estado y los jugadores nuevos.
+
+    'resumir(estado)' construye los datos del evento "estado" (en app.py,
+    resumen_estado_partida).
+    """
+
+    def __init__(self, registro, canal, resumir, intervalo=INTERVALO_VIGILANCIA):
+        self.registro = registro
+        self.canal = canal
+        self.resumir = resumir
+        self.intervalo = intervalo
+        self._publicadas = {}  # {partida_id: version}
+        self._ultimo_jugador = {}  # {partida_id: orden}
+        self._hilo = None
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(
+                target=self._bucle, name="vigilante-cambios", daemon=True
+            )
+            self._hilo.start()
+        return self
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.revisar()
+            except Exception as e:
+                print(f"Error en el vigilante de cambios: {e}")
+
+    def revisar(self):
+        suscritas = self.canal.partidas_suscritas()
+        for partida_id in list(self._publicadas):
+            if partida_id not in suscritas:
+                self._publicadas.pop(partida_id, None)
+                self._ultimo_jugador.pop(partida_id, None)
+
+        for partida_id, (pin, version) in self.registro.versiones(suscritas).items():
+            if partida_id not in self._ultimo_jugador:
+                # Los que ya estaban vienen en la página; sólo avisamos de los nuevos
+                self._ultimo_jugador[partida_id] = self.registro.ultimo_jugador(pin)
+            else:
+                for orden, jugador in self.registro.jugadores_desde(
+                    pin, self._ultimo_jugador[partida_id]
+                ):
+                    self.canal.publicar(partida_id, "jugador", jugador)
+                    self._ultimo_jugador[partida_id] = orden
+
+            if self._publicadas.get(partida_id) != version:
+                estado = self.registro.get(pin)
+                if estado is not None:
+                    self.canal.publicar(partida_id, "estado", self.resumir(estado))
+                self._publicadas[partida_id] = version
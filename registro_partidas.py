@@ -0,0 +1,354 @@
+# registro_partidas.py - Registro en memoria de las partidas activas
+# Guarda el estado de cada partida por PIN y un índice inverso partida_id -> PIN,
+# para que las rutas de los jugadores (que sólo conocen su partida_id) no tengan
+# que recorrer todas las partidas en cada consulta.
+# Cada estado lleva una versión que crece con cada cambio; el JSON que consultan
+# los jugadores se guarda ya codificado y sólo se regenera al cambiar la versión.
+# También se lleva, por pregunta, el conjunto de jugadores que ya respondieron.
+#
+# Concurrencia: el estado de control de una partida (estado, pregunta_actual,
+# tiempo_inicio, version) nunca se modifica en el sitio. Cada cambio publica un
+# dict nuevo (copia superficial con los cambios) que sustituye al anterior de
+# una sola asignación, así que quien lee una partida ve siempre una instantánea
+# coherente sin tomar ningún lock. Los cambios de una misma partida se
+# serializan con un lock de su franja (lock striping: NUM_FRANJAS locks
+# repartidos por hash del PIN, en vez de uno global o uno por partida).
+
+import itertools
+import threading
+import uuid
+import zlib
+from array import array
+
+from clasificacion import Clasificacion
+from evaluadora import (
+    evaluar_respuesta,
+    resumir_estadisticas,
+    sumar_respuesta_estadisticas,
+)
+
+# Locks por franja de partidas (ver bloquear())
+NUM_FRANJAS = 64
+
+# Claves del estado de control; sólo cambian a través de actualizar()
+CLAVES_CONTROL = ("estado", "pregunta_actual", "tiempo_inicio")
+
+
+class RegistroPartidas:
+    """
+    Diccionario de partidas activas {pin: estado} con índice inverso por partida_id.
+
+    Se usa como un dict normal (pin in registro, registro[pin], registro.get(pin),
+    del registro[pin]) y además permite buscar_por_partida_id() en O(1).
+    Ambos índices se actualizan siempre juntos.
+
+    Todo vive en este proceso, así que sólo sirve con un único worker; para
+    varios procesos ver registro_compartido.RegistroPartidasSQLite.
+    """
+
+    # True si el estado se comparte con otros procesos
+    compartido = False
+
+    def __init__(self):
+        self._por_pin = {}
+        self._pin_por_partida_id = {}
+        # {pin: (version, etag, cuerpo)} con el último JSON codificado
+        self._instantaneas = {}
+        # Las versiones nunca se repiten dentro del proceso (ni al recrear un PIN),
+        # y el prefijo evita confundir ETags de un reinicio anterior del servidor
+        self._versiones = itertools.count(1)
+        self._epoca = uuid.uuid4().hex[:8]
+        # Protege que los dos índices cambien juntos en altas y bajas
+        self._lock_indices = threading.Lock()
+        self._franjas = [threading.RLock() for _ in range(NUM_FRANJAS)]
+
+    def bloquear(self, pin):
+        """
+        Lock (reentrante) de la franja de la partida. Se toma para cambiar una
+        partida (rutas del host, carga desde la DB); leerla no lo necesita.
+        """
+        return self._franjas[zlib.crc32(str(pin).encode("utf-8")) % NUM_FRANJAS]
+
+    # --- ALTAS Y BAJAS ---
+
+    def crear(
+        self,
+        pin,
+        partida_id,
+        preguntas,
+        clave_respuestas=None,
+        opciones_por_pregunta=None,
+        respuestas_previas=(),
+        liquidadas=(),
+        jugadores=(),
+        estadisticas=None,
+        estado="esperando",
+    ):
+        """
+        Crea (o reemplaza) el estado en memoria de una partida y lo devuelve.
+        'respuestas_previas' son tuplas (jugador_id, pregunta_id, opcion_id, tiempo)
+        ya guardadas en la DB, para no aceptar respuestas repetidas si la partida
+        se recarga a mitad; las de preguntas que no están en 'liquidadas' (los
+        pregunta_id ya liquidados) vuelven a su buffer para repartir sus puntos.
+        'jugadores' son los ya registrados, con los que se arma la clasificación.
+        'estadisticas' son los contadores por pregunta (ver evaluadora).
+        """
+        respondidas = {p["id"]: set() for p in preguntas}
+        # Respuestas de cada pregunta en arrays paralelos, para liquidar los
+        # puntos de todas de una vez al cerrar la pregunta
+        respuestas_pregunta = {
+            p["id"]: {
+                "jugadores": array("q"),
+                "tiempos": array("d"),
+                "correctas": array("b"),
+            }
+            for p in preguntas
+        }
+        liquidadas = set(liquidadas)
+        previas = []
+        for jugador_id, pregunta_id, opcion_id, tiempo in respuestas_previas:
+            respondidas.setdefault(pregunta_id, set()).add(jugador_id)
+            correcta = 1 if evaluar_respuesta(clave_respuestas or {}, pregunta_id, opcion_id) else 0
+            previas.append((jugador_id, pregunta_id, opcion_id, tiempo or 0, correcta))
+            buffer = respuestas_pregunta.get(pregunta_id)
+            if buffer is not None and pregunta_id not in liquidadas:
+                buffer["jugadores"].append(jugador_id)
+                buffer["tiempos"].append(tiempo or 0)
+                buffer["correctas"].append(correcta)
+
+        estado_partida = {
+            "preguntas": preguntas,
+            "pregunta_por_id": {p["id"]: p for p in preguntas},
+            # {pregunta_id: {'validas': set(ids), 'correctas': set(ids)}}
+            "clave_respuestas": clave_respuestas or {},
+            # {pregunta_id: tupla de opciones} para pintar /jugar sin ir a la DB
+            "opciones_por_pregunta": opciones_por_pregunta or {},
+            # {pregunta_id: set(jugador_id)} de quienes ya respondieron
+            "respondidas": respondidas,
+            "lock_respuestas": threading.Lock(),
+            "clasificacion": self._nueva_clasificacion(pin, jugadores),
+            # {pregunta_id: contadores}; se modifican bajo lock_respuestas
+            "estadisticas": estadisticas or {},
+            # Buffers de respuestas por pregunta y preguntas ya liquidadas
+            "respuestas_pregunta": respuestas_pregunta,
+            "liquidadas": liquidadas,
+            "partida_id": partida_id,
+        }
+        with self.bloquear(pin):
+            estado_partida.update(
+                self._control_inicial(
+                    pin, partida_id, estado, jugadores, previas, liquidadas
+                )
+            )
+            with self._lock_indices:
+                self._quitar_sin_lock(pin)
+                self._por_pin[pin] = estado_partida
+                self._pin_por_partida_id[partida_id] = pin
+        return estado_partida
+
+    def _control_inicial(self, pin, partida_id, estado, jugadores, previas, liquidadas):
+        """
+        Estado de control de una partida recién creada (claves de CLAVES_CONTROL y
+        version). 'previas' son tuplas (jugador_id, pregunta_id, opcion_id, tiempo,
+        correcta) de las respuestas ya guardadas.
+        """
+        return {
+            "estado": estado,
+            "pregunta_actual": 0,
+            "tiempo_inicio": 0,  # No ha empezado la primera pregunta
+            "version": next(self._versiones),
+        }
+
+    def _nueva_clasificacion(self, pin, jugadores):
+        return Clasificacion(jugadores)
+
+    def eliminar(self, pin):
+        """Quita una partida de memoria (reinicio o cambio de cuestionario)."""
+        return self._quitar(pin)
+
+    def _quitar(self, pin):
+        with self.bloquear(pin), self._lock_indices:
+            return self._quitar_sin_lock(pin)
+
+    def _quitar_sin_lock(self, pin):
+        estado_partida = self._por_pin.pop(pin, None)
+        self._instantaneas.pop(pin, None)
+        if estado_partida is not None:
+            partida_id = estado_partida["partida_id"]
+            if self._pin_por_partida_id.get(partida_id) == pin:
+                del self._pin_por_partida_id[partida_id]
+        return estado_partida
+
+    # --- VERSIONES ---
+
+    def actualizar(self, pin, **cambios):
+        """
+        Publica una nueva instantánea de la partida con los 'cambios' (claves de
+        CLAVES_CONTROL) y una versión nueva, que invalida su JSON en caché.
+        Devuelve la instantánea nueva.
+        """
+        with self.bloquear(pin):
+            estado_partida = dict(self._por_pin[pin], **cambios)
+            estado_partida["version"] = next(self._versiones)
+            self._publicar(pin, estado_partida)
+        return estado_partida
+
+    def _publicar(self, pin, estado_partida):
+        # Se llama con el lock de la franja tomado
+        with self._lock_indices:
+            if pin in self._por_pin:
+                self._por_pin[pin] = estado_partida
+
+    def instantanea(self, pin, codificar):
+        """
+        Devuelve (etag, cuerpo) del estado de la partida.
+        'codificar(estado)' sólo se llama si la versión cambió desde la última vez.
+        """
+        estado_partida = self._por_pin[pin]
+        version = estado_partida["version"]
+        cache = self._instantaneas.get(pin)
+        if cache is None or cache[0] != version:
+            cache = (version, f'"{self._epoca}-{version}"', codificar(estado_partida))
+            self._instantaneas[pin] = cache
+        return cache[1], cache[2]
+
+    # --- RESPUESTAS ---
+
+    def ya_respondio(self, pin, pregunta_id, jugador_id):
+        return jugador_id in self._por_pin[pin]["respondidas"].get(pregunta_id, ())
+
+    def marcar_respondida(self, pin, pregunta_id, jugador_id):
+        """
+        Anota que el jugador respondió la pregunta. Devuelve False si ya lo había
+        hecho; la comprobación y la anotación son atómicas, así que de dos
+        respuestas simultáneas del mismo jugador sólo una devuelve True.
+        """
+        estado_partida = self._por_pin[pin]
+        with estado_partida["lock_respuestas"]:
+            respondidas = estado_partida["respondidas"].setdefault(pregunta_id, set())
+            if jugador_id in respondidas:
+                return False
+            respondidas.add(jugador_id)
+            return True
+
+    def desmarcar_respondida(self, pin, pregunta_id, jugador_id):
+        """Deshace marcar_respondida (p. ej. si no se pudo guardar en la DB)."""
+        estado_partida = self._por_pin.get(pin)
+        if estado_partida is not None:
+            with estado_partida["lock_respuestas"]:
+                estado_partida["respondidas"].get(pregunta_id, set()).discard(jugador_id)
+
+    def pregunta_cerrada(self, pin, pregunta_id):
+        """True si la pregunta ya se liquidó y no admite más respuestas."""
+        return pregunta_id in self._por_pin[pin]["liquidadas"]
+
+    def registrar_respuesta(
+        self, pin, pregunta_id, jugador_id, opcion_id, tiempo, es_correcta
+    ):
+        """
+        Añade una respuesta al buffer de su pregunta y a las estadísticas. Devuelve
+        False si la pregunta ya se liquidó: la comprobación va con el mismo lock que
+        cerrar_pregunta, así que una respuesta aceptada siempre entra en el reparto.
+        """
+        estado_partida = self._por_pin.get(pin)
+        if estado_partida is None:
+            return False
+        with estado_partida["lock_respuestas"]:
+            if pregunta_id in estado_partida["liquidadas"]:
+                return False
+            buffer = estado_partida["respuestas_pregunta"][pregunta_id]
+            buffer["jugadores"].append(jugador_id)
+            buffer["tiempos"].append(tiempo)
+            buffer["correctas"].append(1 if es_correcta else 0)
+            sumar_respuesta_estadisticas(
+                estado_partida["estadisticas"][pregunta_id],
+                opcion_id,
+                es_correcta,
+                tiempo,
+            )
+            return True
+
+    def retirar_respuesta(
+        self, pin, pregunta_id, jugador_id, opcion_id, tiempo, es_correcta
+    ):
+        """
+        Deshace registrar_respuesta si no se pudo guardar en la DB. Devuelve False
+        si la pregunta ya se liquidó (sus puntos ya se repartieron).
+        """
+        estado_partida = self._por_pin.get(pin)
+        if estado_partida is None:
+            return False
+        with estado_partida["lock_respuestas"]:
+            if pregunta_id in estado_partida["liquidadas"]:
+                return False
+            buffer = estado_partida["respuestas_pregunta"][pregunta_id]
+            try:
+                posicion = buffer["jugadores"].index(jugador_id)
+            except ValueError:
+                return False
+            del buffer["jugadores"][posicion]
+            del buffer["tiempos"][posicion]
+            del buffer["correctas"][posicion]
+            sumar_respuesta_estadisticas(
+                estado_partida["estadisticas"][pregunta_id],
+                opcion_id,
+                es_correcta,
+                tiempo,
+                cantidad=-1,
+            )
+            return True
+
+    def cerrar_pregunta(self, pin, pregunta_id):
+        """
+        Marca la pregunta como liquidada y devuelve copias de sus respuestas
+        (jugadores, tiempos, correctas), o None si ya estaba cerrada.
+        """
+        estado_partida = self._por_pin[pin]
+        with estado_partida["lock_respuestas"]:
+            if pregunta_id in estado_partida["liquidadas"]:
+                return None
+            estado_partida["liquidadas"].add(pregunta_id)
+            buffer = estado_partida["respuestas_pregunta"][pregunta_id]
+            return (
+                buffer["jugadores"][:],
+                buffer["tiempos"][:],
+                buffer["correctas"][:],
+            )
+
+    def estadisticas_pregunta(self, pin, pregunta_id):
+        """Resumen de los contadores de una pregunta (O(opciones))."""
+        estado_partida = self._por_pin[pin]
+        with estado_partida["lock_respuestas"]:
+            return resumir_estadisticas(estado_partida["estadisticas"][pregunta_id])
+
+    # --- CONSULTAS ---
+
+    def get(self, pin, default=None):
+        return self._por_pin.get(pin, default)
+
+    def buscar_por_partida_id(self, partida_id):
+        """Devuelve (pin, estado) de la partida, o (None, None) si no está en memoria."""
+        pin = self._pin_por_partida_id.get(partida_id)
+        if pin is None:
+            return None, None
+        estado_partida = self._por_pin.get(pin)
+        if estado_partida is None:  # Se eliminó entre las dos consultas
+            return None, None
+        return pin, estado_partida
+
+    def items(self):
+        """Lista (pin, estado) de las partidas en este momento (copia: se puede recorrer sin lock)."""
+        return list(self._por_pin.items())
+
+    def __contains__(self, pin):
+        return pin in self._por_pin
+
+    def __getitem__(self, pin):
+        return self._por_pin[pin]
+
+    def __delitem__(self, pin):
+        if self.eliminar(pin) is None:
+            raise KeyError(pin)
+
+    def __len__(self):
+        return len(self._por_pin)
@@ -0,0 +1,82 @@
+# temporizador.py - Tareas programadas de todas las partidas en un solo hilo
+# Cierra cada pregunta al acabarse su tiempo (y, si está activado, pasa a la
+# siguiente) sin depender de que el host vaya pulsando botones. Las tareas se
+# guardan en un montículo ordenado por vencimiento con el reloj monotónico: un
+# hilo duerme hasta la más próxima, así que cientos de partidas a la vez no
+# cuestan más hilos ni sondeos.
+#
+#   temporizador.programar(pin, 20, lambda: cerrar_pregunta_por_tiempo(pin, ...))
+#
+# Cada clave (el PIN) tiene como mucho una tarea: programar otra la sustituye.
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class Temporizador:
+    """Montículo de tareas (vence_en, secuencia, clave) y un hilo que las ejecuta."""
+
+    def __init__(self, nombre="temporizador"):
+        self.nombre = nombre
+        self._monticulo = []
+        self._tareas = {}  # {clave: (secuencia, accion)} la tarea vigente de cada clave
+        self._secuencia = itertools.count()
+        self._condicion = threading.Condition()
+        self._hilo = None
+
+    def programar(self, clave, segundos, accion):
+        """Ejecuta 'accion()' dentro de 'segundos', sustituyendo la tarea anterior de 'clave'."""
+        with self._condicion:
+            self._arrancar()
+            secuencia = next(self._secuencia)
+            self._tareas[clave] = (secuencia, accion)
+            heapq.heappush(
+                self._monticulo, (time.monotonic() + segundos, secuencia, clave)
+            )
+            self._condicion.notify()
+
+    def cancelar(self, clave):
+        with self._condicion:
+            # Su entrada en el montículo se descarta al llegar arriba
+            self._tareas.pop(clave, None)
+
+    def pendientes(self):
+        with self._condicion:
+            return len(self._tareas)
+
+    def _arrancar(self):
+        # El hilo se arranca con la primera tarea, no al importar el módulo
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name=self.nombre, daemon=True)
+            self._hilo.start()
+
+    def _vigente(self, entrada):
+        _, secuencia, clave = entrada
+        tarea = self._tareas.get(clave)
+        return tarea is not None and tarea[0] == secuencia
+
+    def _siguiente_tarea(self):
+        with self._condicion:
+            while True:
+                # Las entradas canceladas o sustituidas se tiran sin ejecutar
+                while self._monticulo and not self._vigente(self._monticulo[0]):
+                    heapq.heappop(self._monticulo)
+                if not self._monticulo:
+                    self._condicion.wait()
+                    continue
+                espera = self._monticulo[0][0] - time.monotonic()
+                if espera <= 0:
+                    _, _, clave = heapq.heappop(self._monticulo)
+                    return clave, self._tareas.pop(clave)[1]
+                self._condicion.wait(espera)
+
+    def _bucle(self):
+        while True:
+            clave, accion = self._siguiente_tarea()
+            try:
+                accion()
+            except Exception as e:
+                # Una partida con problemas no puede parar los relojes de las demás
+                print(f"Error en la tarea programada de {clave}: {e}")
@@ -0,0 +1,76 @@
+# conftest.py - Las pruebas usan el motor SQLite en un archivo temporal
+# Las variables de entorno se leen al importar database.py, así que se fijan
+# aquí, antes de que ninguna prueba importe los módulos de la app.
+
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+CARPETA_PRUEBAS = tempfile.mkdtemp(prefix="kahoot-pruebas-")
+os.environ["KAHOOT_DB"] = "sqlite"
+os.environ["KAHOOT_DB_RUTA"] = os.path.join(CARPETA_PRUEBAS, "kahoot.sqlite3")
+os.environ["KAHOOT_ESTADO"] = "memoria"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# PINs distintos para que las pruebas no compartan partida
+_pines = itertools.count(70000)
+
+CSV_DOS_PREGUNTAS = (
+    "pregunta,opcion_1,opcion_2,correctas,tiempo_limite\n"
+    "¿Capital de Francia?,París,Roma,1,60\n"
+    "¿2 + 2?,3,4,2,60\n"
+)
+
+
+@pytest.fixture
+def app():
+    from app import app as aplicacion
+
+    aplicacion.config["TESTING"] = True
+    return aplicacion
+
+
+@pytest.fixture
+def cuestionario():
+    """Importa un cuestionario de dos preguntas y devuelve sus preguntas con opciones."""
+    import io
+
+    from database import obtener_cuestionario_completo
+    from importador import importar_banco_preguntas
+
+    informe = importar_banco_preguntas(
+        "pruebas", "Cuestionario de prueba", io.BytesIO(CSV_DOS_PREGUNTAS.encode()), "csv"
+    )
+    assert informe["exito"], informe
+    preguntas = {}
+    for fila in obtener_cuestionario_completo(informe["kahoot_id"]):
+        pregunta = preguntas.setdefault(
+            fila["id"], {"id": fila["id"], "correcta": None, "incorrecta": None}
+        )
+        clave = "correcta" if fila["opcion_es_correcta"] else "incorrecta"
+        pregunta[clave] = fila["opcion_id"]
+    return informe["kahoot_id"], list(preguntas.values())
+
+
+@pytest.fixture
+def partida(app, cuestionario):
+    """Crea una partida del cuestionario y devuelve (pin, partida_id, preguntas)."""
+    from database import crear_partida
+
+    kahoot_id, preguntas = cuestionario
+    pin = str(next(_pines))
+    partida_id = crear_partida(pin, kahoot_id)
+    assert partida_id is not None
+    return pin, partida_id, preguntas
+
+
+def unir_jugador(app, pin, nombre):
+    """Cliente de prueba con un jugador ya unido a la partida."""
+    cliente = app.test_client()
+    respuesta = cliente.post("/unirse", data={"pin": pin, "nombre": nombre})
+    assert respuesta.status_code == 302, respuesta.get_data(as_text=True)
+    return cliente
@@ -0,0 +1,79 @@
+# Caché de cuestionarios compilados: aciertos, versión en la DB e invalidación
+
+import threading
+
+from cuestionarios import CacheCuestionarios
+from database import get_db_connection, obtener_cuestionario_completo
+
+
+def agregar_pregunta(kahoot_id, texto):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO preguntas (kahoot_id, texto, orden) VALUES (%s, %s, 99)",
+            (kahoot_id, texto),
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def test_segunda_lectura_sale_de_la_cache(cuestionario):
+    kahoot_id, _ = cuestionario
+    cache = CacheCuestionarios()
+
+    primero = cache.obtener(kahoot_id)
+    segundo = cache.obtener(kahoot_id)
+
+    assert segundo is primero
+    assert len(primero.preguntas) == 2
+    assert cache.obtener_estadisticas()["aciertos"] == 1
+
+
+def test_invalidar_llega_a_las_caches_de_otros_procesos(cuestionario):
+    kahoot_id, _ = cuestionario
+    # Dos cachés independientes hacen de dos workers con la misma DB
+    esta, otra = CacheCuestionarios(), CacheCuestionarios()
+    esta.obtener(kahoot_id)
+    otra.obtener(kahoot_id)
+
+    agregar_pregunta(kahoot_id, "¿Nueva?")
+    esta.invalidar(kahoot_id)
+
+    assert len(esta.obtener(kahoot_id).preguntas) == 3
+    assert len(otra.obtener(kahoot_id).preguntas) == 3
+    assert otra.obtener_estadisticas()["obsoletos"] == 1
+
+
+def test_invalidar_durante_la_carga_no_guarda_la_copia_vieja(cuestionario):
+    kahoot_id, _ = cuestionario
+    leyendo, seguir = threading.Event(), threading.Event()
+
+    def cargar_lento(kahoot_id):
+        filas = obtener_cuestionario_completo(kahoot_id)
+        leyendo.set()
+        seguir.wait(5)
+        return filas
+
+    cache = CacheCuestionarios(cargar=cargar_lento)
+    hilo = threading.Thread(target=cache.obtener, args=(kahoot_id,))
+    hilo.start()
+    leyendo.wait(5)
+    cache.invalidar(kahoot_id)
+    seguir.set()
+    hilo.join(5)
+
+    assert cache.obtener_estadisticas()["cuestionarios"] == 0
+
+
+def test_expulsa_los_menos_usados_al_pasarse_de_memoria(cuestionario):
+    kahoot_id, _ = cuestionario
+    cache = CacheCuestionarios(max_bytes=1)
+    cache.obtener(kahoot_id)
+    cache.obtener(kahoot_id + 1000)
+
+    datos = cache.obtener_estadisticas()
+    assert datos["cuestionarios"] == 1
+    assert datos["expulsados"] == 1
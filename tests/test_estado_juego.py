@@ -0,0 +1,54 @@
+# /api/estado-juego: JSON pre-codificado con ETag, 304 si no cambió
+
+from conftest import unir_jugador
+
+
+def test_etag_igual_devuelve_304_y_cambia_con_el_estado(app, partida):
+    pin, _, preguntas = partida
+    host = app.test_client()
+    host.get(f"/host/{pin}")
+    ana = unir_jugador(app, pin, "ana")
+    host.post(f"/host/{pin}/iniciar")
+
+    primera = ana.get("/api/estado-juego")
+    assert primera.status_code == 200
+    assert primera.json["estado"] == "jugando"
+    assert primera.json["mi_puntaje"] == 0
+    etag = primera.headers["ETag"]
+
+    repetida = ana.get("/api/estado-juego", headers={"If-None-Match": etag})
+    assert repetida.status_code == 304
+    assert repetida.headers["ETag"] == etag
+    assert repetida.get_data() == b""
+
+    pregunta = preguntas[0]
+    ana.post(
+        "/responder",
+        json={"pregunta_id": pregunta["id"], "opcion_id": pregunta["correcta"]},
+    )
+    host.post(f"/host/{pin}/mostrar-resultado")
+
+    cambiada = ana.get("/api/estado-juego", headers={"If-None-Match": etag})
+    assert cambiada.status_code == 200
+    assert cambiada.headers["ETag"] != etag
+    assert cambiada.json["estado"] == "mostrando_resultado"
+    assert cambiada.json["mi_puntaje"] > 0
+
+
+def test_etag_es_distinto_por_jugador_si_cambia_su_puntaje(app, partida):
+    pin, _, preguntas = partida
+    host = app.test_client()
+    host.get(f"/host/{pin}")
+    ana = unir_jugador(app, pin, "ana")
+    beto = unir_jugador(app, pin, "beto")
+    host.post(f"/host/{pin}/iniciar")
+    pregunta = preguntas[0]
+    ana.post(
+        "/responder",
+        json={"pregunta_id": pregunta["id"], "opcion_id": pregunta["correcta"]},
+    )
+    host.post(f"/host/{pin}/mostrar-resultado")
+
+    etag_ana = ana.get("/api/estado-juego").headers["ETag"]
+    # Beto no puede reutilizar la respuesta cacheada de Ana
+    assert beto.get("/api/estado-juego", headers={"If-None-Match": etag_ana}).status_code == 200
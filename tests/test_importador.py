@@ -0,0 +1,54 @@
+# Importación de bancos de preguntas: las filas inválidas se informan y el resto entra
+
+import io
+
+from database import obtener_cuestionario_completo
+from importador import importar_banco_preguntas
+
+
+def importar(contenido, formato="csv", **kwargs):
+    return importar_banco_preguntas(
+        "pruebas", "Banco", io.BytesIO(contenido.encode()), formato, **kwargs
+    )
+
+
+def test_filas_invalidas_se_informan_y_el_resto_se_importa():
+    informe = importar(
+        "pregunta,opcion_1,opcion_2,correctas\n"
+        "¿Válida?,Sí,No,1\n"
+        ",Sí,No,1\n"
+        "¿Sin correcta válida?,Sí,No,5\n"
+        "¿También válida?,Sí,No,2\n"
+    )
+
+    assert informe["exito"]
+    assert informe["filas"] == 4
+    assert informe["importadas"] == 2
+    assert informe["total_errores"] == 2
+    assert [e["fila"] for e in informe["errores"]] == [3, 4]
+    assert informe["errores"][0]["error"] == "Falta el texto de la pregunta"
+
+    textos = {fila["texto"] for fila in obtener_cuestionario_completo(informe["kahoot_id"])}
+    assert textos == {"¿Válida?", "¿También válida?"}
+
+
+def test_jsonl_informa_la_linea_rota():
+    informe = importar(
+        '{"pregunta": "¿Bien?", "opciones": ["a", "b"], "correctas": [1]}\n'
+        '{"pregunta": "¿Rota?", "opciones": \n'
+        '{"pregunta": "¿Otra?", "opciones": ["a", "b"], "correctas": [2]}\n',
+        formato="jsonl",
+    )
+
+    assert informe["exito"]
+    assert informe["importadas"] == 2
+    assert [e["fila"] for e in informe["errores"]] == [2]
+
+
+def test_importa_por_bloques():
+    filas = "".join(f"¿Pregunta {n}?,a,b,1\n" for n in range(5))
+    informe = importar("pregunta,opcion_1,opcion_2,correctas\n" + filas, tamano_bloque=2)
+
+    assert informe["exito"]
+    assert informe["importadas"] == 5
+    assert len({f["id"] for f in obtener_cuestionario_completo(informe["kahoot_id"])}) == 5
@@ -0,0 +1,81 @@
+# Reparto de puntos al cerrar cada pregunta (app.liquidar_pregunta) y respuestas repetidas
+
+from conftest import unir_jugador
+from database import get_db_connection
+
+
+def puntajes_en_db(partida_id):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT nombre, puntaje FROM jugadores_sesion WHERE partida_id = %s",
+            (partida_id,),
+        )
+        return {fila["nombre"]: fila["puntaje"] for fila in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def responder(cliente, pregunta_id, opcion_id):
+    return cliente.post(
+        "/responder", json={"pregunta_id": pregunta_id, "opcion_id": opcion_id}
+    )
+
+
+def test_liquidacion_guarda_los_totales_acumulados(app, partida):
+    pin, partida_id, preguntas = partida
+    host = app.test_client()
+    assert host.get(f"/host/{pin}").status_code == 200
+    ana = unir_jugador(app, pin, "ana")
+    beto = unir_jugador(app, pin, "beto")
+    assert host.post(f"/host/{pin}/iniciar").json["success"]
+
+    totales = {"ana": 0, "beto": 0}
+    for numero, pregunta in enumerate(preguntas):
+        anteriores = totales
+        assert responder(ana, pregunta["id"], pregunta["correcta"]).json["success"]
+        assert responder(beto, pregunta["id"], pregunta["incorrecta"]).json["success"]
+
+        resultado = host.post(f"/host/{pin}/mostrar-resultado").json
+        totales = {j["nombre"]: j["puntaje"] for j in resultado["ranking"]}
+        # Cada pregunta suma a lo anterior, y la DB guarda el total, no el último reparto
+        assert totales["ana"] > anteriores["ana"]
+        assert totales["beto"] == 0
+        assert puntajes_en_db(partida_id) == totales
+
+        if numero + 1 < len(preguntas):
+            assert host.post(f"/host/{pin}/siguiente").json["success"]
+
+
+def test_respuesta_repetida_se_rechaza(app, partida):
+    pin, _, preguntas = partida
+    host = app.test_client()
+    host.get(f"/host/{pin}")
+    ana = unir_jugador(app, pin, "ana")
+    host.post(f"/host/{pin}/iniciar")
+
+    pregunta = preguntas[0]
+    assert responder(ana, pregunta["id"], pregunta["correcta"]).json["success"]
+    repetida = responder(ana, pregunta["id"], pregunta["incorrecta"])
+    assert repetida.status_code == 400
+    assert repetida.json["error"] == "Ya respondiste esta pregunta"
+
+    # Sólo cuenta la primera respuesta
+    resultado = host.post(f"/host/{pin}/mostrar-resultado").json
+    assert resultado["estadisticas"]["total_respuestas"] == 1
+    assert resultado["ranking"][0]["puntaje"] > 0
+
+
+def test_respuesta_tras_cerrar_la_pregunta_no_puntua(app, partida):
+    pin, _, preguntas = partida
+    host = app.test_client()
+    host.get(f"/host/{pin}")
+    ana = unir_jugador(app, pin, "ana")
+    host.post(f"/host/{pin}/iniciar")
+    host.post(f"/host/{pin}/mostrar-resultado")
+
+    tarde = responder(ana, preguntas[0]["id"], preguntas[0]["correcta"])
+    assert tarde.status_code == 400
+    assert "cerrada" in tarde.json["error"]
@@ -0,0 +1,69 @@
+# Pool de conexiones: espera acotada, devolución y reciclado
+
+import threading
+
+import pytest
+
+import database_sqlite
+from database import PoolAgotadoError, PoolConexiones
+
+
+def nuevo_pool(tamano=1, espera_maxima=0.05, reciclar_despues=1800):
+    return PoolConexiones(
+        database_sqlite.conectar,
+        tamano=tamano,
+        espera_maxima=espera_maxima,
+        reciclar_despues=reciclar_despues,
+        verificar_despues=30,
+    )
+
+
+def test_prestamo_agota_la_espera_si_no_hay_conexiones():
+    pool = nuevo_pool()
+    ocupada = pool.obtener()
+
+    with pytest.raises(PoolAgotadoError):
+        pool.obtener()
+
+    estadisticas = pool.obtener_estadisticas()
+    assert estadisticas["timeouts"] == 1
+    assert estadisticas["esperas"] == 1
+    ocupada.close()
+
+
+def test_prestamo_espera_a_que_se_devuelva_una_conexion():
+    pool = nuevo_pool(espera_maxima=5)
+    ocupada = pool.obtener()
+    threading.Timer(0.05, ocupada.close).start()
+
+    conexion = pool.obtener()
+
+    assert pool.obtener_estadisticas()["creadas"] == 1
+    conexion.close()
+
+
+def test_devolver_deshace_la_transaccion_abierta():
+    pool = nuevo_pool()
+    conexion = pool.obtener()
+    cursor = conexion.cursor()
+    conexion.start_transaction()
+    cursor.execute("INSERT INTO secuencias (nombre, siguiente) VALUES ('prueba_pool', 1)")
+    cursor.close()
+    conexion.close()
+
+    conexion = pool.obtener()
+    cursor = conexion.cursor()
+    cursor.execute("SELECT COUNT(*) FROM secuencias WHERE nombre = 'prueba_pool'")
+    assert cursor.fetchone()[0] == 0
+    cursor.close()
+    conexion.close()
+
+
+def test_conexiones_viejas_se_reciclan():
+    pool = nuevo_pool(reciclar_despues=0)
+    pool.obtener().close()
+    pool.obtener().close()
+
+    estadisticas = pool.obtener_estadisticas()
+    assert estadisticas["recicladas"] == 1
+    assert estadisticas["creadas"] == 2
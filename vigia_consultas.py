@@ -0,0 +1,163 @@
+# vigia_consultas.py - Registro de consultas lentas y detector de N+1 por petición
+# database.py le pasa cada consulta que ejecuta: el SQL (del que sólo se guarda
+# su forma, sin valores), cuántos parámetros lleva, lo que tardó y la función y
+# la ruta que la lanzaron. Las que pasan del umbral van al registro de consultas
+# lentas. Al terminar cada petición se revisa si hizo más consultas de las
+# presupuestadas o si repitió muchas veces la misma forma de SQL (el típico
+# N+1: una consulta por jugador, por pregunta...) y también se anota.
+#
+# El registro es un archivo con un JSON por línea:
+#   {"tipo": "lenta", "ms": 312.4, "forma": "SELECT ... WHERE pin = ?", ...}
+#   {"tipo": "peticion", "ruta": "jugar", "consultas": 41, "repetidas": [...], ...}
+#
+# Variables de entorno:
+#   KAHOOT_CONSULTA_LENTA_MS      umbral de consulta lenta en ms (0 = no registrar)
+#   KAHOOT_PRESUPUESTO_CONSULTAS  consultas máximas por petición (0 = no revisar)
+#   KAHOOT_REPETICIONES_CONSULTA  veces que una petición puede repetir una forma
+#   KAHOOT_LOG_CONSULTAS          archivo del registro
+
+import collections
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+from metricas import registro_metricas
+
+vigia_config = {
+    "umbral_lenta": float(os.environ.get("KAHOOT_CONSULTA_LENTA_MS", 100)) / 1000,
+    "presupuesto": int(os.environ.get("KAHOOT_PRESUPUESTO_CONSULTAS", 20)),
+    "repeticiones": int(os.environ.get("KAHOOT_REPETICIONES_CONSULTA", 5)),
+    "ruta_log": os.environ.get("KAHOOT_LOG_CONSULTAS", "consultas_lentas.log"),
+}
+
+# Formas repetidas que se detallan en cada aviso de petición
+MAX_FORMAS_AVISO = 5
+
+consultas_lentas = registro_metricas.contador(
+    "kahoot_db_consultas_lentas_total",
+    "Consultas que pasaron del umbral de consulta lenta, por función de database.py",
+    ("funcion",),
+)
+peticiones_sospechosas = registro_metricas.contador(
+    "kahoot_peticiones_sospechosas_total",
+    "Peticiones que pasaron del presupuesto de consultas o repitieron una forma de SQL",
+    ("endpoint", "motivo"),
+)
+
+# ============================================
+# FORMA DEL SQL
+# ============================================
+
+_LITERALES = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?\b")
+# Listas de marcadores: IN (?, ?, ?) y VALUES (?, ?), (?, ?), ...
+_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+# Los CASE que arma registrar_respuestas_lote: WHEN ? THEN ? WHEN ? THEN ? ...
+_CASOS = re.compile(r"(?:WHEN \? THEN \? ?)+")
+_ESPACIOS = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=256)
+def forma_sql(sql):
+    """
+    El SQL sin valores ni listas de longitud variable: un INSERT de 3 filas y
+    uno de 300, o un IN con 2 ids y con 40, tienen la misma forma.
+    """
+    forma = _ESPACIOS.sub(" ", sql.replace("%s", "?")).strip()
+    forma = _LITERALES.sub("?", forma)
+    forma = _LISTAS.sub("(...)", forma)
+    return _CASOS.sub("WHEN ... ", forma)
+
+
+def contar_parametros(parametros):
+    if not parametros:
+        return 0
+    try:
+        return len(parametros)
+    except TypeError:
+        return 0
+
+
+class VigiaConsultas:
+    """Registro de consultas lentas y revisión de las consultas de cada petición."""
+
+    def __init__(self, umbral_lenta, presupuesto, repeticiones, ruta_log):
+        self.umbral_lenta = umbral_lenta
+        self.presupuesto = presupuesto
+        self.repeticiones = repeticiones
+        self.ruta_log = ruta_log
+        self._lock = threading.Lock()
+
+    @property
+    def revisa_peticiones(self):
+        return self.presupuesto > 0
+
+    def anotar(self, sql, parametros, duracion, funcion, ruta):
+        """Registra la consulta si es lenta. 'parametros' es cuántos lleva."""
+        if self.umbral_lenta and duracion >= self.umbral_lenta:
+            consultas_lentas.incrementar(funcion)
+            self._escribir(
+                {
+                    "tipo": "lenta",
+                    "ms": round(duracion * 1000, 2),
+                    "forma": forma_sql(sql),
+                    "parametros": parametros,
+                    "funcion": funcion,
+                    "ruta": ruta,
+                }
+            )
+
+    def revisar_peticion(self, ruta, consultas):
+        """
+        Revisa las consultas de una petición, una lista de (sql, funcion, duracion).
+        Devuelve el aviso anotado o None si la petición está dentro de lo previsto.
+        """
+        if not self.revisa_peticiones or not consultas:
+            return None
+        por_forma = collections.Counter()
+        funciones = {}
+        for sql, funcion, _ in consultas:
+            forma = forma_sql(sql)
+            por_forma[forma] += 1
+            funciones.setdefault(forma, funcion)
+        repetidas = [
+            (forma, veces)
+            for forma, veces in por_forma.most_common()
+            if veces > self.repeticiones
+        ]
+
+        motivos = []
+        if len(consultas) > self.presupuesto:
+            motivos.append("presupuesto")
+        if repetidas:
+            motivos.append("repetidas")
+        if not motivos:
+            return None
+
+        for motivo in motivos:
+            peticiones_sospechosas.incrementar(ruta, motivo)
+        aviso = {
+            "tipo": "peticion",
+            "ruta": ruta,
+            "motivos": motivos,
+            "consultas": len(consultas),
+            "ms": round(sum(duracion for _, _, duracion in consultas) * 1000, 2),
+            "repetidas": [
+                {"forma": forma, "veces": veces, "funcion": funciones[forma]}
+                for forma, veces in repetidas[:MAX_FORMAS_AVISO]
+            ],
+        }
+        self._escribir(aviso)
+        return aviso
+
+    def _escribir(self, entrada):
+        entrada["fecha"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        linea = json.dumps(entrada, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                with open(self.ruta_log, "a", encoding="utf-8") as f:
+                    f.write(linea)
+            except OSError as e:
+                print(f"Error escribiendo el registro de consultas: {e}")